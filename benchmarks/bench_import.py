@@ -0,0 +1,118 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+"""
+Import time benchmark of the ramdecom modules. Each module is imported in
+a fresh interpreter, as in a worker process or a short-lived job, and the
+wall time of the import, the cumulative import time of the largest
+dependencies (from python -X importtime) and the optional packages that
+were loaded are written to a JSON file:
+
+    python bench_import.py -o imports.json
+    python bench_import.py -o imports.json --compare old.json
+
+The numerical core (ramdecom.wavespeed and the modules it depends on) is
+expected to load neither matplotlib, pandas nor cerberus.
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+MODULES = ['ramdecom.engine', 'ramdecom.wavespeed', 'ramdecom.batch', 'ramdecom.sweep',
+           'ramdecom.cache', 'ramdecom.envelope', 'ramdecom.btc']
+
+# Packages reported separately, only needed for plotting, DataFrames and
+# input validation
+OPTIONAL = ['matplotlib', 'pandas', 'cerberus']
+DEPENDENCIES = ['numpy', 'CoolProp'] + OPTIONAL
+
+CHILD = """
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'wall_time': elapsed,
+                  'loaded': [name for name in {optional!r} if name in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Cumulative import time (s) per top level package from the output of
+    python -X importtime
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(parts[1]) * 1e-6
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        if name in DEPENDENCIES:
+            times[name] = max(times.get(name, 0.0), cumulative)
+    return times
+
+
+def time_import(module, repeat=3):
+    """
+    Best wall time (s) of importing module in a fresh interpreter
+    """
+    best = None
+    for i in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                               CHILD.format(module=module, optional=OPTIONAL)],
+                              capture_output=True, text=True, check=True)
+        entry = json.loads(proc.stdout.strip().splitlines()[-1])
+        entry['dependencies'] = parse_importtime(proc.stderr)
+        if best is None or entry['wall_time'] < best['wall_time']:
+            best = entry
+    best['module'] = module
+    return best
+
+
+def run_benchmark(modules, repeat=3):
+    return {'meta': {'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'repeat': repeat,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': [time_import(module, repeat) for module in modules]}
+
+
+def compare(output, other):
+    old = {r['module']: r for r in other['results']}
+    print('\n{:22s} {:>9s} {:>9s}'.format('module', 'new (s)', 'old (s)'))
+    for r in output['results']:
+        if r['module'] in old:
+            print('{:22s} {:9.3f} {:9.3f}'.format(r['module'], r['wall_time'], old[r['module']]['wall_time']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ramdecom import time benchmark')
+    parser.add_argument('-o', '--output', default='imports.json', help='JSON output file')
+    parser.add_argument('-m', '--module', action='append', help='module to import (repeatable), default all')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='repetitions, best is reported')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    args = parser.parse_args(argv)
+
+    output = run_benchmark(args.module or MODULES, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    for r in output['results']:
+        deps = ' '.join('{} {:.3f}'.format(name, t) for name, t in sorted(r['dependencies'].items()))
+        print('{:22s} {:8.3f} s  loaded: {:28s} {}'.format(
+            r['module'], r['wall_time'], ','.join(r['loaded']) or '-', deps))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+"""
+Throughput and accuracy benchmark of WaveSpeed against the validation
+cases in validation/pure.csv and validation/mixture.csv. The mixture cases
+are skipped if REFPROP is not available.
+
+For each case and configuration the wall time, the number of backend
+calls and flashes per curve, the RMS deviation of W from the experimental
+curve and the plateau pressure error are written to a JSON file, which can
+be compared with the output of another commit:
+
+    python bench_wavespeed.py -o new.json
+    python bench_wavespeed.py -o new.json --compare old.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+import CoolProp
+import CoolProp.CoolProp as CP
+from ramdecom.wavespeed import WaveSpeed
+
+VALIDATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'validation')
+
+# WaveSpeed options benchmarked for every case
+CONFIGS = {
+    'default': {},
+    'analytic': {'sound_speed': 'analytic'},
+    'adaptive': {'sound_speed': 'analytic', 'adaptive_step': True},
+    'warm': {'sound_speed': 'analytic', 'warm_start': True},
+}
+
+# Case specific input, as used in scripts/validate_pure.py and validate_mixture.py
+CASE_OPTIONS = {
+    ('pure', '15'): {'extrapolate': True},
+    ('mixture', '2'): {'pressure_break': 70e5},
+}
+
+
+def refprop_available():
+    try:
+        CP.AbstractState('REFPROP', 'CO2')
+    except ValueError:
+        return False
+    return True
+
+
+def find_file(name):
+    """
+    Validation data file, matched case insensitively
+    """
+    for filename in os.listdir(VALIDATION_DIR):
+        if filename.lower() == name.lower():
+            return os.path.join(VALIDATION_DIR, filename)
+    raise FileNotFoundError(name)
+
+
+def read_cases():
+    cases = []
+    for kind, eos in (('pure', 'HEOS'), ('mixture', 'REFPROP')):
+        with open(os.path.join(VALIDATION_DIR, kind + '.csv'), newline='') as f:
+            for row in csv.DictReader(f, delimiter=';'):
+                row = {key.strip(): value for key, value in row.items()}
+                exp_no = row.get('Exp No.') or row.get('Exp. No.')
+                input = {'pressure': float(row['P (bar)']) * 1e5,
+                         'temperature': float(row['T (C)']) + 273.15,
+                         'eos': eos,
+                         'fluid': row.get('Fluid', 'CO2')}
+                input.update(CASE_OPTIONS.get((kind, exp_no), {}))
+                cases.append({'name': row['Source'].split()[0] + ' ' + exp_no,
+                              'kind': kind,
+                              'input': input,
+                              'data': np.loadtxt(find_file(row['File']), delimiter='\t')})
+    return cases
+
+
+def experimental_plateau(data):
+    """
+    Plateau pressure of an experimental curve (W in m/s, P in bar), taken
+    as the mean pressure of the flattest segment dP/dW
+    """
+    data = data[np.argsort(data[:, 0])]
+    dW = np.diff(data[:, 0])
+    dP = np.abs(np.diff(data[:, 1]))
+    slope = np.where(dW > 0, dP / np.where(dW > 0, dW, 1), np.inf)
+    i = np.argmin(slope)
+    return 0.5 * (data[i, 1] + data[i + 1, 1]) * 1e5
+
+
+def accuracy(ws, data):
+    """
+    RMS deviation of W (m/s) at the experimental pressures within the
+    calculated curve and plateau pressure error (Pa)
+    """
+    P = np.asarray(ws.P)[::-1]
+    W = np.asarray(ws.W)[::-1]
+    P_exp = data[:, 1] * 1e5
+    inside = (P_exp >= P[0]) & (P_exp <= P[-1])
+    rms = float(np.sqrt(np.mean((np.interp(P_exp[inside], P, W) - data[inside, 0])**2))) if inside.any() else None
+    P_plateau = ws.get_plateau()[0]
+    plateau_error = None if np.isnan(P_plateau) else float(P_plateau - experimental_plateau(data))
+    return rms, plateau_error
+
+
+def run_case(case, options, repeat):
+    input = dict(case['input'])
+    input.update(options)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ws = WaveSpeed(input, instrument=True)
+        ws.run()
+        times.append(time.perf_counter() - t0)
+    stats = ws.stats
+    flashes = stats.flashes
+    rms, plateau_error = accuracy(ws, case['data'])
+    P_plateau = ws.get_plateau()[0]
+    return {'wall_time': min(times),
+            'backend_calls': stats.calls,
+            'flashes': flashes,
+            'region_flashes': stats.region_calls,
+            'stage_times': stats.stage_times,
+            'failures': len(stats.failures),
+            'points': len(ws.P),
+            'flashes_per_point': flashes / max(len(ws.P), 1),
+            'end_pressure': float(ws.P[-1]),
+            'plateau_pressure': None if np.isnan(P_plateau) else float(P_plateau),
+            'rms_W': rms,
+            'plateau_error': plateau_error}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=VALIDATION_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(configs, repeat=3):
+    have_refprop = refprop_available()
+    results = []
+    for case in read_cases():
+        for config in configs:
+            entry = {'case': case['name'], 'kind': case['kind'], 'config': config}
+            if case['input']['eos'] == 'REFPROP' and not have_refprop:
+                entry['status'] = 'skipped'
+            else:
+                try:
+                    entry.update(run_case(case, CONFIGS[config], repeat))
+                    entry['status'] = 'ok'
+                except Exception as err:
+                    entry['status'] = 'failed'
+                    entry['error'] = repr(err)
+            results.append(entry)
+    return {'meta': {'commit': git_commit(),
+                     'coolprop': CoolProp.__version__,
+                     'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'refprop': have_refprop,
+                     'repeat': repeat,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def compare(new, old):
+    """
+    Print relative change of wall time and flashes and change of accuracy
+    between two benchmark outputs
+    """
+    old_results = {(r['case'], r['config']): r for r in old['results'] if r['status'] == 'ok'}
+    print('{:22s} {:9s} {:>8s} {:>8s} {:>10s} {:>12s}'.format('case', 'config', 'time', 'flashes', 'd rms_W', 'd plateau'))
+    for r in new['results']:
+        o = old_results.get((r['case'], r['config']))
+        if r['status'] != 'ok' or o is None:
+            continue
+
+        def delta(key):
+            if r[key] is None or o[key] is None:
+                return float('nan')
+            return r[key] - o[key]
+        print('{:22s} {:9s} {:7.2f}x {:7.2f}x {:10.3f} {:12.0f}'.format(
+            r['case'], r['config'], r['wall_time'] / o['wall_time'], r['flashes'] / o['flashes'],
+            delta('rms_W'), delta('plateau_error')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='WaveSpeed throughput and accuracy benchmark')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='JSON output file')
+    parser.add_argument('-c', '--config', action='append', choices=sorted(CONFIGS),
+                        help='configuration to run (repeatable), default all')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='timing repetitions, best is reported')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    args = parser.parse_args(argv)
+
+    output = run_benchmark(args.config or list(CONFIGS), args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    for r in output['results']:
+        if r['status'] == 'ok':
+            print('{:22s} {:9s} {:8.3f} s {:5d} flashes  rms W {:7.2f} m/s'.format(
+                r['case'], r['config'], r['wall_time'], r['flashes'], r['rms_W'] if r['rms_W'] is not None else float('nan')))
+        else:
+            print('{:22s} {:9s} {}'.format(r['case'], r['config'], r['status']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import sys
+from ramdecom.cli import main
+
+sys.exit(main())
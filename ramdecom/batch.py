@@ -0,0 +1,135 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import numpy as np
+from ramdecom.wavespeed import plateau_point
+from ramdecom.parallel import run_many
+
+
+class BatchResult:
+    """
+    Stacked results of a batch of decompression calculations. Per case
+    quantities are 1D arrays of length n_cases, curves are 2D arrays of
+    shape (n_cases, n_grid) resampled on the shared pressure grid and NaN
+    outside the calculated part of the curve.
+    """
+
+    def __init__(self, P0, T0, fluid, pressure_grid):
+        n = len(P0)
+        m = len(pressure_grid)
+        self.P0 = P0
+        self.T0 = T0
+        self.fluid = fluid
+        self.pressure_grid = pressure_grid
+        self.plateau_pressure = np.full(n, np.nan)
+        self.plateau_wave_speed = np.full(n, np.nan)
+        self.end_pressure = np.full(n, np.nan)
+        self.W = np.full((n, m), np.nan)
+        self.U = np.full((n, m), np.nan)
+        self.C = np.full((n, m), np.nan)
+        self.T = np.full((n, m), np.nan)
+        self.rho_mass = np.full((n, m), np.nan)
+        self.error = [None] * n
+
+    def __len__(self):
+        return len(self.P0)
+
+    def store(self, i, results):
+        """
+        Store the results of a finished WaveSpeed run as case i
+
+        Parameters
+        ----------
+        i : int
+            Case index
+        results : dict
+            Result arrays as returned by WaveSpeed.get_results()
+        """
+        P = results['P'][::-1]
+        if len(P) == 0:
+            return
+        self.plateau_pressure[i], self.plateau_wave_speed[i] = plateau_point(results['P'], results['Q'], results['W'])
+        self.end_pressure[i] = P[0]
+        mask = (self.pressure_grid >= P[0]) & (self.pressure_grid <= P[-1])
+        grid = self.pressure_grid[mask]
+        for name in ('W', 'U', 'C', 'T', 'rho_mass'):
+            getattr(self, name)[i, mask] = np.interp(grid, P, results[name][::-1])
+
+    def get_dataframe(self):
+        """
+        Per case summary as a pandas DataFrame
+        """
+        import pandas as pd
+
+        data = {'Pressure (Pa)': self.P0,
+                'Temperature (K)': self.T0,
+                'Fluid': self.fluid,
+                'Plateau pressure (Pa)': self.plateau_pressure,
+                'Plateau wave speed (m/s)': self.plateau_wave_speed,
+                'End pressure (Pa)': self.end_pressure,
+                'Error': self.error,
+                }
+        return pd.DataFrame(data)
+
+
+def run_batch(P0, T0, fluid='CO2', eos='HEOS', options=None, pressure_grid=None, workers=1):
+    """
+    Run the decompression calculation for many initial conditions. Inputs
+    are broadcast against each other. One state engine is constructed per
+    distinct set of components (per worker process) and shared by all cases 
+    using it, only the mole fractions are updated between cases. A case 
+    raising an exception is recorded in BatchResult.error and does not stop 
+    the batch.
+
+    Parameters
+    ----------
+    P0 : array_like
+        Initial pressures (Pa)
+    T0 : array_like
+        Initial temperatures (K)
+    fluid : str or sequence of str
+        Fluid string(s) in the WaveSpeed input format, e.g. 'CO2[0.96]&N2[0.04]'
+    eos : str
+        'HEOS' or 'REFPROP'
+    options : dict, optional
+        Additional WaveSpeed input applied to all cases, e.g.
+        {'adaptive_step': True, 'extrapolate': True}
+    pressure_grid : array_like, optional
+        Shared pressure grid (Pa) for the resampled curves. Default is
+        200 points from 1 bar to the highest initial pressure.
+    workers : int
+        Number of worker processes, see parallel.run_many()
+
+    Return
+    ----------
+    retval : BatchResult
+        Stacked results
+    """
+    P0, T0, fluid = np.broadcast_arrays(np.asarray(P0, dtype=float),
+                                        np.asarray(T0, dtype=float),
+                                        np.asarray(fluid, dtype=object))
+    P0 = P0.ravel()
+    T0 = T0.ravel()
+    fluid = list(fluid.ravel())
+    if pressure_grid is None:
+        pressure_grid = np.linspace(1e5, P0.max(), 200)
+    pressure_grid = np.asarray(pressure_grid, dtype=float)
+
+    inputs = []
+    for i in range(len(P0)):
+        input = {}
+        if options:
+            input.update(options)
+        input['pressure'] = float(P0[i])
+        input['temperature'] = float(T0[i])
+        input['eos'] = eos
+        input['fluid'] = fluid[i]
+        inputs.append(input)
+
+    result = BatchResult(P0, T0, fluid, pressure_grid)
+    for i, case in enumerate(run_many(inputs, workers=workers)):
+        if case['error']:
+            result.error[i] = case['error']
+        else:
+            result.store(i, case['results'])
+
+    return result
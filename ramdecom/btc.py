@@ -0,0 +1,247 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import numpy as np
+
+# Units of the Battelle two-curve (BTC) pipe input, all values may be
+# scalars or arrays of pipe designs of equal length:
+#   sigma : flow stress (MPa)
+#   Dt    : wall thickness (mm)
+#   E     : Young's modulus (GPa)
+#   CVN   : Charpy V-notch energy (J)
+#   CV    : Charpy V-notch energy per ligament area (J/mm2)
+#   Mt    : Folias factor (--)
+#   r     : nominal radius (mm)
+#   C     : backfill constant (--)
+BTC_KEYS = ('sigma', 'Dt', 'E', 'CVN', 'CV', 'Mt', 'r', 'C')
+
+
+def _params(btc_input):
+    """
+    BTC input as 1D arrays broadcast to the number of pipe designs
+    """
+    values = np.broadcast_arrays(*[np.atleast_1d(np.asarray(btc_input[key], dtype=float)) for key in BTC_KEYS])
+    return dict(zip(BTC_KEYS, values))
+
+
+def arrest_pressure(btc_input):
+    """
+    Arrest pressure of the pipe, i.e. the pressure below which a running
+    fracture cannot propagate:
+
+    sigma_a = 2 sigma / (pi Mt) acos(exp(-12.5 pi CVN E / (24 sigma^2 sqrt(r Dt))))
+    P_a = sigma_a Dt / r
+
+    Parameters
+    ----------
+    btc_input : dict
+        Pipe input, see BTC_KEYS
+
+    Return
+    ----------
+    retval : ndarray
+        Arrest pressure (Pa), one value per pipe design
+    """
+    p = _params(btc_input)
+    x = np.exp((-12.5 * np.pi * p['CVN'] * p['E'] * 1000) / (24 * p['sigma']**2 * np.sqrt(p['r'] * p['Dt'])))
+    sigma_a = 2 * p['sigma'] / (p['Mt'] * np.pi) * np.arccos(x)
+    return sigma_a * p['Dt'] / p['r'] * 1e6
+
+
+def fracture_velocity(P, btc_input):
+    """
+    Fracture velocity as function of the pressure at the crack tip
+
+    Vf = C sigma / sqrt(CV) (P / P_a - 1)^(1/6)
+
+    and zero below the arrest pressure.
+
+    Parameters
+    ----------
+    P : array_like
+        Pressure (Pa)
+    btc_input : dict
+        Pipe input, see BTC_KEYS
+
+    Return
+    ----------
+    retval : ndarray
+        Fracture velocity (m/s) of shape (n_designs, len(P))
+    """
+    p = _params(btc_input)
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    P_a = arrest_pressure(p)[:, None]
+    ratio = np.maximum(P[None, :] / P_a - 1, 0)
+    return (p['C'] * p['sigma'] / np.sqrt(p['CV']))[:, None] * ratio ** (1. / 6)
+
+
+def fracture_curve(btc_input, P_max, dP=1e5):
+    """
+    Fracture velocity curve of a single pipe design from the arrest
+    pressure to P_max, e.g. for plotting together with the decompression
+    curve.
+
+    Parameters
+    ----------
+    btc_input : dict
+        Pipe input, see BTC_KEYS
+    P_max : float
+        Upper pressure (Pa)
+    dP : float
+        Approximate pressure spacing (Pa)
+
+    Return
+    ----------
+    retval : tuple
+        Pressure (Pa) and fracture velocity (m/s) arrays
+    """
+    P_a = arrest_pressure(btc_input)[0]
+    Pd = np.linspace(P_a, P_max, max(int((P_max - P_a) / dP), 2))
+    return Pd, fracture_velocity(Pd, btc_input)[0]
+
+
+# Interval reduction per golden-section iteration
+GOLDEN = (np.sqrt(5) - 1) / 2
+
+
+def arrest_margin(btc_input, P, W, tol=1.):
+    """
+    Arrest check according to the Battelle two-curve method. A running
+    fracture is arrested if the fracture velocity is below the
+    decompression wave speed at every pressure above the arrest pressure,
+    i.e. if the fracture curve does not intersect the decompression curve.
+    The margin is the smallest difference W - Vf and the tangency pressure
+    the pressure where it occurs. The margin is +inf if the decompression
+    curve lies entirely below the arrest pressure.
+
+    W is linear between the points of the decompression curve and Vf is
+    concave above the arrest pressure, so W - Vf is convex on each
+    interval of the curve. Its minimum on every interval is located by a
+    golden-section search to tol, and the margin does not depend on the
+    spacing of the curve beyond its linear interpolation.
+
+    Parameters
+    ----------
+    btc_input : dict
+        Pipe input, see BTC_KEYS
+    P : array_like
+        Pressure of the decompression curve (Pa)
+    W : array_like
+        Decompression wave speed (m/s)
+    tol : float
+        Pressure tolerance (Pa) of the tangency pressure
+
+    Return
+    ----------
+    retval : tuple
+        Margin (m/s) and tangency pressure (Pa), arrays with one value per
+        pipe design. Arrest for margin > 0.
+    """
+    p = _params(btc_input)
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    W = np.atleast_1d(np.asarray(W, dtype=float))
+    if len(P) == 1:
+        P, W = np.repeat(P, 2), np.repeat(W, 2)
+    P_a = arrest_pressure(p)[:, None]
+    scale = (p['C'] * p['sigma'] / np.sqrt(p['CV']))[:, None]
+
+    # Intervals of the curve with the lower end first, shape (1, n - 1)
+    lower = P[:-1] > P[1:]
+    P_lo = np.where(lower, P[1:], P[:-1])[None, :]
+    P_hi = np.where(lower, P[:-1], P[1:])[None, :]
+    W_lo = np.where(lower, W[1:], W[:-1])[None, :]
+    W_hi = np.where(lower, W[:-1], W[1:])[None, :]
+    width = P_hi - P_lo
+    slope = np.divide(W_hi - W_lo, width, out=np.zeros_like(width), where=width > 0)
+
+    def diff(x):
+        return W_lo + slope * (x - P_lo) - scale * np.maximum(x / P_a - 1, 0) ** (1. / 6)
+
+    # Parts of the intervals above the arrest pressure, shape (n_designs, n - 1)
+    start = np.maximum(P_lo, P_a)
+    end = np.broadcast_to(P_hi, start.shape)
+    a, b = start, end
+    n_iter = 0
+    if width.max() > tol:
+        n_iter = int(np.ceil(np.log(tol / width.max()) / np.log(GOLDEN)))
+    for _ in range(n_iter):
+        c = b - GOLDEN * (b - a)
+        d = a + GOLDEN * (b - a)
+        left = diff(c) < diff(d)
+        a, b = np.where(left, a, c), np.where(left, d, b)
+
+    # Smallest of the interior minimum and the ends of each interval
+    x = np.stack((0.5 * (a + b), start, end))
+    values = np.where(P_hi > P_a, diff(x), np.inf)
+    k = np.argmin(values, axis=0)[None]
+    values = np.take_along_axis(values, k, axis=0)[0]
+    x = np.take_along_axis(x, k, axis=0)[0]
+    i = np.argmin(values, axis=1)
+    rows = np.arange(len(i))
+    margin = values[rows, i]
+    P_tangent = np.where(np.isfinite(margin), x[rows, i], np.nan)
+    return margin, P_tangent
+
+
+def is_arrested(btc_input, P, W):
+    """
+    True for pipe designs arresting a running fracture, see arrest_margin()
+    """
+    return arrest_margin(btc_input, P, W)[0] > 0
+
+
+def minimum_for_arrest(btc_input, P, W, parameter, lower, upper, tol=1e-3, max_iter=100):
+    """
+    Smallest value of a pipe parameter for which a running fracture is
+    arrested, solved by bisection on the arrest margin simultaneously for
+    all pipe designs. When solving for 'CVN' the Charpy energy per area
+    'CV' is scaled by the same factor.
+
+    Parameters
+    ----------
+    btc_input : dict
+        Pipe input, see BTC_KEYS. The value of the parameter solved for
+        is ignored.
+    P : array_like
+        Pressure of the decompression curve (Pa)
+    W : array_like
+        Decompression wave speed (m/s)
+    parameter : str
+        'CVN' or 'Dt' (or any other key of BTC_KEYS with margin increasing
+        with the parameter)
+    lower, upper : float or array_like
+        Bracket of the parameter
+    tol : float
+        Absolute tolerance of the parameter
+
+    Return
+    ----------
+    retval : ndarray
+        Minimum parameter value per pipe design, NaN where the fracture is
+        not arrested at the upper bound. The lower bound is returned where
+        it already gives arrest.
+    """
+    p = _params(btc_input)
+    n = len(p['sigma'])
+    lo = np.broadcast_to(np.asarray(lower, dtype=float), (n,)).copy()
+    hi = np.broadcast_to(np.asarray(upper, dtype=float), (n,)).copy()
+    cv_ratio = p['CV'] / p['CVN']
+
+    def margin(value):
+        trial = dict(p)
+        trial[parameter] = value
+        if parameter == 'CVN':
+            trial['CV'] = cv_ratio * value
+        return arrest_margin(trial, P, W)[0]
+
+    arrest_lo = margin(lo) > 0
+    arrest_hi = margin(hi) > 0
+    for _ in range(max_iter):
+        active = ~arrest_lo & arrest_hi & (hi - lo > tol)
+        if not active.any():
+            break
+        mid = 0.5 * (lo + hi)
+        arrest = margin(mid) > 0
+        hi = np.where(active & arrest, mid, hi)
+        lo = np.where(active & ~arrest, mid, lo)
+
+    return np.where(arrest_lo, lo, np.where(arrest_hi, hi, np.nan))
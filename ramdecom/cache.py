@@ -0,0 +1,195 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import os
+import json
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
+import CoolProp
+from ramdecom.wavespeed import WaveSpeed, InputError, validate_mandatory_ruleset
+from ramdecom.composition import Composition
+from ramdecom.table import table_fingerprint
+
+# Increase when the stored results or the key normalisation change
+CACHE_VERSION = 2
+
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+def default_cache_dir():
+    """
+    Cache directory from the RAMDECOM_CACHE_DIR environment variable,
+    default ~/.cache/ramdecom
+    """
+    if 'RAMDECOM_CACHE_DIR' in os.environ:
+        return os.environ['RAMDECOM_CACHE_DIR']
+    return os.path.join(os.path.expanduser('~'), '.cache', 'ramdecom')
+
+
+def normalise_input(input, validate=True):
+    """
+    Validated input with defaults filled in and the fluid string written
+    in canonical form (see Composition), such that
+    equivalent inputs give identical dicts. validate=False skips the
+    schema validation of an input already validated by the caller.
+    """
+    if validate and validate_mandatory_ruleset(input) is False:
+        raise InputError("Input file error")
+
+    normalised = dict(input)
+    normalised['pressure'] = float(input['pressure'])
+    normalised['temperature'] = float(input['temperature'])
+    normalised['pressure_step'] = float(input.get('pressure_step', 1.0e5))
+    normalised['pressure_break'] = float(input.get('pressure_break', 1.0e5))
+    normalised['extrapolate'] = bool(input.get('extrapolate', False))
+    try:
+        normalised['fluid'] = Composition.parse(input['fluid']).fluid
+    except ValueError as err:
+        raise InputError("Fluid error: " + str(err))
+    if input['eos'] != 'REFPROP':
+        normalised.pop('refprop_option', None)
+    return normalised
+
+
+def cache_key(input, normalised=False):
+    """
+    Content hash of the normalised input, the CoolProp version and the
+    cache format version. normalised=True skips the normalisation of an
+    input returned by normalise_input(). With a property_table the key
+    includes the content hash of the table file.
+    """
+    key = {'input': input if normalised else normalise_input(input),
+           'coolprop': CoolProp.__version__,
+           'version': CACHE_VERSION}
+    if 'property_table' in key['input']:
+        key['table'] = table_fingerprint(key['input']['property_table'])
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache of WaveSpeed results keyed by the normalised
+    input. Results are stored as one uncompressed .npz file per input.
+    When the total size exceeds max_bytes the least recently used entries
+    are deleted.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            Cache directory, default see default_cache_dir()
+        max_bytes : int
+            Size limit of the cache
+        enabled : bool
+            If False nothing is read from or written to the cache
+        """
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, input, key=None):
+        """
+        Cached results for the input, None if not cached. key is the
+        cache_key() of the input if already known.
+
+        Return
+        ----------
+        retval : dict or None
+            Result arrays as returned by WaveSpeed.get_results()
+        """
+        if not self.enabled:
+            return None
+        path = self.path(key or cache_key(input))
+        try:
+            with np.load(path) as f:
+                results = {name: f[name] for name in f.files}
+            os.utime(path)
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return results
+
+    def put(self, input, results, key=None):
+        """
+        Store results for the input and evict old entries if the cache is
+        full. key is the cache_key() of the input if already known.
+        """
+        if not self.enabled or results is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **results)
+            os.replace(tmp, self.path(key or cache_key(input)))
+        except Exception:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache is within
+        max_bytes
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Delete all cached results
+        """
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npz'):
+                    os.remove(entry.path)
+
+    def run(self, input, engine=None):
+        """
+        Results for the input, from the cache if available. Otherwise
+        WaveSpeed is run and the results stored. On a cache hit no
+        backend is constructed. Results of a caller-supplied engine, e.g.
+        a TabularEngine, are neither taken from nor stored in the cache,
+        as the key does not identify the engine.
+
+        Return
+        ----------
+        retval : dict
+            Result arrays as returned by WaveSpeed.get_results()
+        """
+        if engine is not None:
+            ws = WaveSpeed(input, engine=engine)
+            ws.run()
+            return ws.get_results()
+        results = self.get(input)
+        if results is None:
+            ws = WaveSpeed(input)
+            ws.run()
+            results = ws.get_results()
+            self.put(input, results)
+        return results
@@ -0,0 +1,345 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+"""
+Command line interface, installed as the 'ramdecom' console script:
+
+    ramdecom run cases.csv -o results -w 8
+
+runs every case of a case table and checkpoints finished cases in the
+output directory. Running the same command again resumes an interrupted
+batch, see run_cases().
+
+    ramdecom serve --port 8000 -w 4
+
+runs the local HTTP calculation service, see ramdecom.service.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from ramdecom.wavespeed import INPUT_SCHEMA, plateau_point
+from ramdecom.parallel import run_many
+from ramdecom.store import ResultStore
+
+# Column names of the case table, as in validation/pure.csv and mixture.csv
+NAME_COLUMNS = ('Exp No.', 'Exp. No.', 'Case', 'Name')
+PRESSURE_COLUMN = 'P (bar)'
+TEMPERATURE_COLUMN = 'T (C)'
+FLUID_COLUMN = 'Fluid'
+EOS_COLUMN = 'EOS'
+
+CHECKPOINT_FILE = 'checkpoint.jsonl'
+SUMMARY_FILE = 'summary.csv'
+CURVE_DIR = 'curves'
+
+
+def parse_value(key, text):
+    """
+    Convert a table entry or command line value to the type of the
+    WaveSpeed input key
+    """
+    kind = INPUT_SCHEMA[key]['type']
+    if kind == 'boolean':
+        if text.strip().lower() in ('1', 'true', 'yes'):
+            return True
+        if text.strip().lower() in ('0', 'false', 'no'):
+            return False
+        raise ValueError("Invalid boolean for " + key + ": " + text)
+    if kind == 'number':
+        return float(text)
+    return text.strip()
+
+
+def read_cases(filename, eos='HEOS', options=None):
+    """
+    Read a case table with one case per row, in the format of
+    validation/pure.csv and mixture.csv: ';' (or ',') separated with the
+    columns 'P (bar)' and 'T (C)' and optionally a case name ('Exp No.',
+    'Case' or 'Name'), 'Fluid' (default CO2) and 'EOS'. Columns named
+    as a WaveSpeed input key, e.g. 'pressure_break' or 'sound_speed', set
+    that option for the case in the units of the input (Pa, K). Other 
+    columns are ignored.
+
+    Parameters
+    ----------
+    filename : str
+        Case table
+    eos : str
+        Equation of state of cases without an EOS column
+    options : dict, optional
+        WaveSpeed input applied to all cases, overridden by the table
+
+    Return
+    ----------
+    retval : list of tuple
+        Case name and WaveSpeed input per row
+    """
+    with open(filename, newline='') as f:
+        text = f.read()
+    delimiter = ';' if text.splitlines()[0].count(';') >= text.splitlines()[0].count(',') else ','
+    rows = csv.DictReader(text.splitlines(), delimiter=delimiter)
+
+    cases = []
+    for i, row in enumerate(rows):
+        row = {key.strip(): value.strip() for key, value in row.items() if key is not None and value is not None}
+        name = next((row[key] for key in NAME_COLUMNS if row.get(key)), str(i + 1))
+        input = {}
+        if options:
+            input.update(options)
+        input['pressure'] = float(row[PRESSURE_COLUMN]) * 1e5
+        input['temperature'] = float(row[TEMPERATURE_COLUMN]) + 273.15
+        input['eos'] = row.get(EOS_COLUMN) or eos
+        input['fluid'] = row.get(FLUID_COLUMN) or input.get('fluid', 'CO2')
+        for key, value in row.items():
+            if key in INPUT_SCHEMA and value != '':
+                input[key] = parse_value(key, value)
+        cases.append((name, input))
+    return cases
+
+
+def case_key(index, input):
+    """
+    Identifier of a case in the checkpoint, from its row and input, such
+    that a changed case table is not mixed up with an old checkpoint
+    """
+    digest = hashlib.sha256(json.dumps(input, sort_keys=True).encode()).hexdigest()
+    return str(index) + '-' + digest[:16]
+
+
+class Checkpoint:
+    """
+    Append-only record of finished cases in a directory. Each finished
+    case is written as one JSON line to checkpoint.jsonl, flushed to disk
+    before the next case is recorded, and its curve (if kept) to the
+    result store in curves/ (see ramdecom.store.ResultStore). A line cut 
+    short by an interruption is ignored when the checkpoint is read.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CHECKPOINT_FILE)
+        self.store = ResultStore(os.path.join(directory, CURVE_DIR))
+
+    def load(self):
+        """
+        Records of the finished cases by case key, the last record of a
+        case wins
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['key']] = record
+        return records
+
+    def curve(self, record):
+        """
+        Stored curve of a case as a dict of arrays, None if not kept
+        """
+        if record.get('curve') is None:
+            return None
+        return self.store.curve(record['curve'])
+
+    def append(self, record, results=None):
+        if results is not None:
+            record['curve'] = self.store.append(results, record['input'], name=record['name'], key=record['key'])
+        with open(self.path, 'a+b') as f:
+            # A line cut short by an interruption is ended, not continued
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write((json.dumps(record) + '\n').encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def case_record(key, name, case):
+    """
+    Checkpoint record of a finished case, see parallel.run_case()
+    """
+    record = {'key': key, 'name': name, 'input': case['input'], 'error': case['error'],
+              'plateau_pressure': None, 'plateau_wave_speed': None, 'end_pressure': None,
+              'points': 0, 'curve': None}
+    results = case['results']
+    if results is not None and len(results['P']) > 0:
+        P, W = plateau_point(results['P'], results['Q'], results['W'])
+        record['plateau_pressure'] = None if np.isnan(P) else float(P)
+        record['plateau_wave_speed'] = None if np.isnan(W) else float(W)
+        record['end_pressure'] = float(results['P'][-1])
+        record['points'] = len(results['P'])
+    return record
+
+
+def run_cases(cases, directory, workers=1, retry_failed=False, curves=True, progress=None):
+    """
+    Run a batch of cases with checkpointing. Cases already recorded in the
+    checkpoint of the directory are skipped, so an interrupted batch
+    continues where it stopped. A failing case is recorded with its error
+    and does not stop the batch; with retry_failed it is run again on the
+    next call.
+
+    Parameters
+    ----------
+    cases : list of tuple
+        Case name and WaveSpeed input, see read_cases()
+    directory : str
+        Output directory holding the checkpoint and curves
+    workers : int
+        Number of worker processes, see parallel.run_many()
+    retry_failed : bool
+        Run recorded failed cases again
+    curves : bool
+        Store the curve of each case in the result store in curves/
+    progress : callable, optional
+        Called as progress(done, total, failed) after each case
+
+    Return
+    ----------
+    retval : list of dict
+        Checkpoint record per case, in the order of the cases
+    """
+    checkpoint = Checkpoint(directory)
+    records = checkpoint.load()
+    keys = [case_key(i, input) for i, (name, input) in enumerate(cases)]
+    todo = [i for i, key in enumerate(keys)
+            if key not in records or (retry_failed and records[key]['error'])]
+
+    done = len(cases) - len(todo)
+    failed = sum(1 for key in keys if key in records and records[key]['error']) if not retry_failed else 0
+    if progress:
+        progress(done, len(cases), failed)
+    # Each case is checkpointed as soon as it finishes
+    for j, case in run_many([cases[i][1] for i in todo], workers=workers, ordered=False):
+        i = todo[j]
+        record = case_record(keys[i], cases[i][0], case)
+        checkpoint.append(record, case['results'] if curves and case['results'] is not None else None)
+        records[keys[i]] = record
+        done += 1
+        failed += bool(record['error'])
+        if progress:
+            progress(done, len(cases), failed)
+    return [records[key] for key in keys]
+
+
+def write_summary(filename, records):
+    """
+    Per case summary as a ';' separated table
+    """
+    columns = ['name', 'pressure', 'temperature', 'eos', 'fluid', 'plateau_pressure',
+               'plateau_wave_speed', 'end_pressure', 'points', 'error']
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(columns)
+        for record in records:
+            row = dict(record['input'], **record)
+            writer.writerow(['' if row.get(column) is None else row[column] for column in columns])
+
+
+class Progress:
+    """
+    Progress line with rate and estimated remaining time on stderr
+    """
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.t0 = None
+        self.start = 0
+
+    def __call__(self, done, total, failed):
+        now = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = now
+            self.start = done
+        rate = (done - self.start) / (now - self.t0) if now > self.t0 else 0.
+        eta = time.strftime('%H:%M:%S', time.gmtime((total - done) / rate)) if rate > 0 else '--:--:--'
+        self.stream.write('\r{:d}/{:d} cases  {:d} failed  {:.2f} cases/s  ETA {}'.format(
+            done, total, failed, rate, eta))
+        if done == total:
+            self.stream.write('\n')
+        self.stream.flush()
+
+
+def parse_option(text):
+    """
+    KEY=VALUE command line option as a WaveSpeed input item
+    """
+    key, sep, value = text.partition('=')
+    if not sep or key not in INPUT_SCHEMA:
+        raise argparse.ArgumentTypeError("Expected KEY=VALUE with a WaveSpeed input key: " + text)
+    try:
+        return key, parse_value(key, value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def run_command(args):
+    cases = read_cases(args.cases, args.eos, dict(args.option))
+    records = run_cases(cases, args.output, args.workers, args.retry_failed, not args.no_curves,
+                        None if args.quiet else Progress())
+    summary = os.path.join(args.output, SUMMARY_FILE)
+    write_summary(summary, records)
+    failed = [record for record in records if record['error']]
+    if not args.quiet:
+        print(str(len(records) - len(failed)) + ' cases finished, ' + str(len(failed)) + ' failed, summary in ' + summary)
+    return 1 if failed else 0
+
+
+def serve_command(args):
+    from ramdecom.service import serve
+
+    print('Serving on http://' + args.host + ':' + str(args.port))
+    serve(args.host, args.port, args.workers, args.cache_dir, args.max_pending, not args.quiet)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ramdecom', description='Decompression wave speed calculations')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the cases of a case table with checkpointing')
+    run.add_argument('cases', help="case table, ';' separated as validation/pure.csv")
+    run.add_argument('-o', '--output', default='ramdecom_results', help='output and checkpoint directory')
+    run.add_argument('-w', '--workers', type=int, default=1, help='worker processes, 0 for one per CPU')
+    run.add_argument('--eos', default='HEOS', choices=INPUT_SCHEMA['eos']['allowed'],
+                     help='equation of state of cases without an EOS column')
+    run.add_argument('--option', action='append', type=parse_option, default=[], metavar='KEY=VALUE',
+                     help='WaveSpeed input for all cases (repeatable), e.g. pressure_break=5e5')
+    run.add_argument('--retry-failed', action='store_true', help='run recorded failed cases again')
+    run.add_argument('--no-curves', action='store_true', help='only keep the per case summary')
+    run.add_argument('-q', '--quiet', action='store_true', help='no progress output')
+    run.set_defaults(func=run_command)
+
+    serve = commands.add_parser('serve', help='run the local HTTP calculation service')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    serve.add_argument('-p', '--port', type=int, default=8000, help='port to listen on')
+    serve.add_argument('-w', '--workers', type=int, default=0, help='worker processes, 0 for one per CPU')
+    serve.add_argument('--cache-dir', default=None, help='result cache directory, default RAMDECOM_CACHE_DIR')
+    serve.add_argument('--max-pending', type=int, default=100, help='largest number of queued and running jobs')
+    serve.add_argument('-q', '--quiet', action='store_true', help='no request log')
+    serve.set_defaults(func=serve_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'workers', None) == 0:
+        args.workers = None
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        sys.stderr.write('\nInterrupted, run the same command again to resume\n')
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import numpy as np
+
+
+class Composition:
+    """
+    Fluid composition with components in canonical (alphabetical) order
+    and mole fractions normalised to unity and rounded to 12 decimals, so
+    that equivalent fluid strings give equal compositions. Compositions 
+    are immutable and can be compared and used as dict keys. Duplicate 
+    components are merged and components with zero fraction dropped.
+    """
+
+    def __init__(self, components, fractions=None):
+        """
+        Parameters
+        ----------
+        components : sequence of str
+            CoolProp / REFPROP component names
+        fractions : sequence of float, optional
+            Mole fractions or any positive amounts, default a pure fluid
+            or equal amounts
+        """
+        components = [str(c).strip() for c in components]
+        if fractions is None:
+            fractions = [1.0] * len(components)
+        fractions = [float(x) for x in fractions]
+        if len(components) == 0 or len(components) != len(fractions):
+            raise ValueError("Number of components and mole fractions differ")
+        if any(c == '' for c in components):
+            raise ValueError("Empty component name")
+        if any(not x >= 0 for x in fractions) or sum(fractions) <= 0:
+            raise ValueError("Mole fractions must be non-negative with a positive sum")
+
+        amounts = {}
+        for c, x in zip(components, fractions):
+            if x > 0:
+                amounts[c] = amounts.get(c, 0.) + x
+        total = sum(amounts.values())
+        self.components = tuple(sorted(amounts))
+        self.fractions = tuple(round(amounts[c] / total, 12) for c in self.components)
+
+    @classmethod
+    def parse(cls, fluid):
+        """
+        Composition from a fluid string, e.g. "CO2" or
+        "CO2[0.9667]&O2[0.0333]"
+        """
+        if '&' not in fluid and '[' not in fluid:
+            return cls([fluid])
+        components = []
+        fractions = []
+        for item in fluid.split('&'):
+            name, sep, rest = item.partition('[')
+            if not sep or not rest.strip().endswith(']'):
+                raise ValueError("Invalid fluid string: " + fluid)
+            components.append(name)
+            try:
+                fractions.append(float(rest.strip()[:-1]))
+            except ValueError:
+                raise ValueError("Invalid mole fraction in fluid string: " + fluid)
+        return cls(components, fractions)
+
+    @property
+    def is_pure(self):
+        return len(self.components) == 1
+
+    @property
+    def comp(self):
+        """
+        Components separated by '&', as used by CoolProp AbstractState
+        """
+        return '&'.join(self.components)
+
+    @property
+    def molefracs(self):
+        return np.asarray(self.fractions)
+
+    @property
+    def fluid(self):
+        """
+        Canonical fluid string, the component name for a pure fluid
+        """
+        if self.is_pure:
+            return self.components[0]
+        return '&'.join([c + '[' + repr(x) + ']' for c, x in zip(self.components, self.fractions)])
+
+    def fluid_string(self, eos):
+        """
+        Fluid string for PropsSI, e.g. "HEOS::CO2"
+        """
+        return eos + '::' + self.fluid
+
+    def __eq__(self, other):
+        return (isinstance(other, Composition) and self.components == other.components
+                and self.fractions == other.fractions)
+
+    def __hash__(self):
+        return hash((self.components, self.fractions))
+
+    def __repr__(self):
+        return 'Composition(' + repr(self.fluid) + ')'
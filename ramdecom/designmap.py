@@ -0,0 +1,270 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import numpy as np
+from ramdecom.wavespeed import WaveSpeed, InputError
+from ramdecom.parallel import run_many
+
+# Quantities of the design map, as returned by WaveSpeed.find_plateau()
+QUANTITIES = ('plateau_pressure', 'plateau_wave_speed')
+
+
+def plateau_case(task):
+    """
+    Plateau pressure and wave speed of one initial state, NaN if the
+    backend fails (ValueError from CoolProp, InputError) or the isentrope
+    does not reach the two-phase region. Other exceptions are raised.
+    Module level so that it can be run in worker processes.
+
+    Parameters
+    ----------
+    task : tuple
+        P0 (Pa), T0 (K) and the WaveSpeed input without initial state
+    """
+    P0, T0, base = task
+    input = dict(base)
+    input['pressure'] = float(P0)
+    input['temperature'] = float(T0)
+    try:
+        return WaveSpeed(input).find_plateau()
+    except (ValueError, InputError):
+        return np.nan, np.nan
+
+
+class Cell:
+    """
+    Rectangle of the (P0, T0) window, a leaf of the quadtree, sampled at
+    its corners, edge midpoints and centre. error holds the estimated
+    interpolation error per quantity, see cell_error().
+    """
+
+    def __init__(self, P_lo, P_hi, T_lo, T_hi, depth=0):
+        self.P_lo = P_lo
+        self.P_hi = P_hi
+        self.T_lo = T_lo
+        self.T_hi = T_hi
+        self.depth = depth
+        self.error = None
+
+    @property
+    def centre(self):
+        return (0.5 * (self.P_lo + self.P_hi), 0.5 * (self.T_lo + self.T_hi))
+
+    @property
+    def points(self):
+        """
+        The 3 x 3 sample points, pressure varying fastest
+        """
+        P_mid, T_mid = self.centre
+        return [(P, T) for T in (self.T_lo, T_mid, self.T_hi) for P in (self.P_lo, P_mid, self.P_hi)]
+
+    def split(self):
+        P_mid, T_mid = self.centre
+        return [Cell(P_lo, P_hi, T_lo, T_hi, self.depth + 1)
+                for T_lo, T_hi in ((self.T_lo, T_mid), (T_mid, self.T_hi))
+                for P_lo, P_hi in ((self.P_lo, P_mid), (P_mid, self.P_hi))]
+
+
+class DesignMap:
+    """
+    Plateau pressure (Pa) and plateau wave speed (m/s) over a (P0, T0)
+    window, sampled on an adaptively refined quadtree, see design_map().
+    Values are interpolated biquadratically from the 3 x 3 samples of the
+    leaf cell containing the point, and the error estimate is that of the
+    cell.
+    """
+
+    def __init__(self, P_range, T_range, cells, values):
+        """
+        Parameters
+        ----------
+        P_range, T_range : tuple
+            Window of initial pressure (Pa) and temperature (K)
+        cells : list of Cell
+            Leaves of the quadtree
+        values : dict
+            Evaluated (P0, T0) and tuple of the quantities
+        """
+        self.P_range = P_range
+        self.T_range = T_range
+        self.cells = cells
+        self.values = values
+        points = list(values)
+        self.points = np.array(points, dtype=float).reshape(-1, 2)
+        for j, name in enumerate(QUANTITIES):
+            setattr(self, name, np.array([values[p][j] for p in points], dtype=float))
+
+    @property
+    def n_evaluations(self):
+        return len(self.values)
+
+    def _evaluate(self, P0, T0, name, error):
+        j = QUANTITIES.index(name)
+        P0, T0 = np.broadcast_arrays(np.asarray(P0, dtype=float), np.asarray(T0, dtype=float))
+        retval = np.full(P0.shape, np.nan)
+        for cell in self.cells:
+            inside = (P0 >= cell.P_lo) & (P0 <= cell.P_hi) & (T0 >= cell.T_lo) & (T0 <= cell.T_hi)
+            if not inside.any():
+                continue
+            if error:
+                retval[inside] = cell.error[j]
+                continue
+            f = np.array([self.values[p][j] for p in cell.points]).reshape(3, 3)
+            x = (P0[inside] - cell.P_lo) / (cell.P_hi - cell.P_lo)
+            y = (T0[inside] - cell.T_lo) / (cell.T_hi - cell.T_lo)
+            retval[inside] = np.einsum('ki,kl,li->i', lagrange(y), f, lagrange(x))
+        return retval if retval.ndim else float(retval)
+
+    def __call__(self, P0, T0, name='plateau_pressure'):
+        """
+        Interpolated quantity at initial pressure P0 (Pa) and temperature
+        T0 (K), NaN outside the window or where a corner failed
+        """
+        return self._evaluate(P0, T0, name, False)
+
+    def error(self, P0, T0, name='plateau_pressure'):
+        """
+        Estimated interpolation error of the quantity at (P0, T0)
+        """
+        return self._evaluate(P0, T0, name, True)
+
+    def surface(self, n_P=100, n_T=100, name='plateau_pressure'):
+        """
+        Quantity and error estimate on a regular grid, e.g. for contour
+        plots
+
+        Return
+        ----------
+        retval : tuple
+            P0 and T0 grids (shape (n_T, n_P)), values and error estimates
+        """
+        P0, T0 = np.meshgrid(np.linspace(*self.P_range, n_P), np.linspace(*self.T_range, n_T))
+        return P0, T0, self(P0, T0, name), self.error(P0, T0, name)
+
+
+def lagrange(x):
+    """
+    Quadratic Lagrange basis on the nodes 0, 0.5 and 1, shape (3, len(x))
+    """
+    return np.array([2 * (x - 0.5) * (x - 1), -4 * x * (x - 1), 2 * x * (x - 0.5)])
+
+
+def cell_error(cell, values):
+    """
+    Largest deviation of the edge midpoint and centre values from the
+    bilinear interpolation of the corners, per quantity. This measures
+    the curvature resolved by the cell and bounds the error of the
+    biquadratic interpolation where the quantity is smooth. It is
+    infinite where only some of the points failed, so that the boundary 
+    of the valid region is refined.
+    """
+    error = []
+    for j in range(len(QUANTITIES)):
+        f = np.array([values[p][j] for p in cell.points]).reshape(3, 3)
+        nan = np.isnan(f)
+        if nan.all():
+            error.append(0.)
+        elif nan.any():
+            error.append(np.inf)
+        else:
+            linear = np.outer([1, 0.5, 0], [1, 0.5, 0])
+            bilinear = (f[0, 0] * linear + f[0, 2] * linear[:, ::-1]
+                        + f[2, 0] * linear[::-1] + f[2, 2] * linear[::-1, ::-1])
+            error.append(float(np.max(np.abs(f - bilinear))))
+    return error
+
+
+def relative_error(cell, tol):
+    return max(e / t for e, t in zip(cell.error, tol) if t is not None)
+
+
+def design_map(P_range, T_range, fluid='CO2', eos='HEOS', tol_P=1e5, tol_W=None, n=4, max_depth=5,
+               max_evaluations=2000, options=None, workers=1, func=plateau_case):
+    """
+    Adaptive map of the plateau pressure and plateau wave speed over a
+    window of initial pressure and temperature. The window is divided in
+    n x n cells, each sampled at 3 x 3 points, and a cell is split in four
+    (quadtree) where the samples deviate from the bilinear interpolation 
+    of its corners by more than the tolerance (see cell_error()). The
+    sampling is thus dense where the plateau changes rapidly, e.g. near 
+    the critical point, and coarse elsewhere. Each
+    refinement level is evaluated as one batch on the process pool, cells
+    with the largest relative error first if the evaluation budget runs
+    out.
+
+    Parameters
+    ----------
+    P_range : tuple
+        Lowest and highest initial pressure (Pa)
+    T_range : tuple
+        Lowest and highest initial temperature (K)
+    fluid : str
+        Fluid string in the WaveSpeed input format
+    eos : str
+        'HEOS' or 'REFPROP'
+    tol_P : float
+        Tolerance of the plateau pressure (Pa)
+    tol_W : float, optional
+        Tolerance of the plateau wave speed (m/s), default no refinement
+        on the wave speed
+    n : int
+        Number of initial cells in each direction
+    max_depth : int
+        Maximum number of splits of an initial cell
+    max_evaluations : int
+        Budget of plateau evaluations
+    options : dict, optional
+        Additional WaveSpeed input, e.g. {'sound_speed': 'analytic'}
+    workers : int
+        Number of worker processes, see parallel.run_many()
+    func : callable
+        Module level function returning the quantities of a task
+        (P0, T0, input), default plateau_case()
+
+    Return
+    ----------
+    retval : DesignMap
+    """
+    base = {}
+    if options:
+        base.update(options)
+    base['eos'] = eos
+    base['fluid'] = fluid
+    tol = (tol_P, tol_W)
+    values = {}
+
+    def evaluate(points):
+        new = list(dict.fromkeys(p for p in points if p not in values))
+        for p, value in zip(new, run_many([(p[0], p[1], base) for p in new], workers=workers, func=func)):
+            values[p] = tuple(float(v) for v in value)
+
+    P_edges = np.linspace(P_range[0], P_range[1], n + 1)
+    T_edges = np.linspace(T_range[0], T_range[1], n + 1)
+    leaves = [Cell(P_edges[i], P_edges[i + 1], T_edges[k], T_edges[k + 1])
+              for k in range(n) for i in range(n)]
+    evaluate([p for cell in leaves for p in cell.points])
+
+    active = list(leaves)
+    while active:
+        for cell in active:
+            cell.error = cell_error(cell, values)
+        candidates = [cell for cell in active if cell.depth < max_depth and relative_error(cell, tol) > 1]
+        candidates.sort(key=lambda cell: -relative_error(cell, tol))
+
+        split, points = [], {}
+        for cell in candidates:
+            new = {p for child in cell.split() for p in child.points
+                   if p not in values and p not in points}
+            if len(values) + len(points) + len(new) > max_evaluations:
+                break
+            split.append(cell)
+            points.update(dict.fromkeys(new))
+        evaluate(list(points))
+
+        active = []
+        for cell in split:
+            leaves.remove(cell)
+            children = cell.split()
+            leaves.extend(children)
+            active.extend(children)
+
+    return DesignMap(tuple(P_range), tuple(T_range), leaves, values)
@@ -0,0 +1,292 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import math
+import weakref
+import threading
+import CoolProp.CoolProp as CP
+
+# Process-wide pool of idle AbstractState objects by (eos, components,
+# refprop_option), see acquire_state(). Shared by the threads of the
+# process, e.g. Streamlit sessions, so guarded by _states_lock.
+_states = {}
+_states_lock = threading.Lock()
+
+
+def state_key(eos, comp, refprop_option=None):
+    if eos != 'REFPROP':
+        refprop_option = None
+    return (eos, comp, refprop_option)
+
+
+def acquire_state(eos, comp, refprop_option=None):
+    """
+    Borrow an AbstractState from the process-wide pool, constructing a new
+    one if none is idle. Constructing the backend, in particular REFPROP
+    mixtures, is expensive, so sweeps over the same components pay the
+    cost once. The REFPROP configuration (see 
+    wavespeed.configure_refprop()) must be set before the call.
+
+    Return
+    ----------
+    retval : tuple
+        Pool key and AbstractState, to be returned with release_state()
+    """
+    key = state_key(eos, comp, refprop_option)
+    with _states_lock:
+        idle = _states.get(key)
+        if idle:
+            return key, idle.pop()
+    return key, CP.AbstractState(eos, comp)
+
+
+def release_state(key, state):
+    """
+    Return a borrowed AbstractState to the pool
+    """
+    with _states_lock:
+        _states.setdefault(key, []).append(state)
+
+
+def clear_states():
+    """
+    Drop all idle states, e.g. in a new worker process
+    """
+    with _states_lock:
+        _states.clear()
+
+
+class StateEngine:
+    """
+    Interface between the isentrope march in WaveSpeed and the thermodynamic
+    backend. An engine holds a single thermodynamic state which is set by one
+    of the update methods (one flash) and then queried for properties without
+    further flash calculations.
+
+    Sub-classes must implement the update methods and the property accessors
+    below. The property accessors refer to the state of the most recent update.
+    """
+
+    def set_mole_fractions(self, molefracs):
+        """
+        Set the composition used by subsequent updates. Engines for a 
+        fixed fluid may ignore this.
+        """
+        pass
+
+    def update_PT(self, P, T):
+        """
+        Flash at given pressure (Pa) and temperature (K)
+        """
+        raise NotImplementedError
+
+    def update_PS(self, P, Smass):
+        """
+        Flash at given pressure (Pa) and mass specific entropy (J/kg/K)
+        """
+        raise NotImplementedError
+
+    def update_PS_guess(self, P, Smass, T, rhomass):
+        """
+        Flash at given pressure and entropy seeded with the temperature (K)
+        and density (kg/m3) of a nearby state, e.g. the previous pressure 
+        step. Engines without warm starts do an ordinary PS flash.
+
+        Return
+        ----------
+        retval : bool
+            True if the warm start was used
+        """
+        self.update_PS(P, Smass)
+        return False
+
+    def p(self):
+        raise NotImplementedError
+
+    def T(self):
+        raise NotImplementedError
+
+    def rhomass(self):
+        raise NotImplementedError
+
+    def hmass(self):
+        raise NotImplementedError
+
+    def smass(self):
+        raise NotImplementedError
+
+    def Q(self):
+        raise NotImplementedError
+
+    def speed_sound(self):
+        """
+        Equilibrium speed of sound (m/s). In the two-phase region this is
+        the homogeneous equilibrium sound speed.
+        """
+        raise NotImplementedError
+
+
+class CoolPropEngine(StateEngine):
+    """
+    State engine backed by a persistent CoolProp AbstractState. The fluid
+    string is parsed and the backend constructed once, after which every
+    update is a single flash on the same object. The AbstractState is 
+    borrowed from the process-wide pool and returned when the engine is 
+    garbage collected.
+    """
+
+    def __init__(self, eos, comp, molefracs, refprop_option=None):
+        """
+        Parameters
+        ----------
+        eos : str
+            CoolProp backend name, e.g. 'HEOS' or 'REFPROP'
+        comp : str
+            Component names separated by '&'
+        molefracs : list
+            Mole fractions of the components
+        refprop_option : str, optional
+            REFPROP mixture model the backend is configured with, 'GERG' 
+            or 'PR'
+        """
+        self.eos = eos
+        self.comp = comp
+        key, self.state = acquire_state(eos, comp, refprop_option)
+        weakref.finalize(self, release_state, key, self.state)
+        self.state.set_mole_fractions(list(molefracs))
+        # Warm started flashes for pure fluids in HEOS, see update_PS_guess()
+        self.warm_start = eos == 'HEOS' and '&' not in comp
+        if self.warm_start:
+            self.T_crit = self.state.keyed_output(CP.iT_critical)
+            self.molar_mass = self.state.molar_mass()
+            self.rhomass_crit = self.state.keyed_output(CP.irhomass_critical)
+
+    def set_mole_fractions(self, molefracs):
+        self.state.set_mole_fractions(molefracs)
+
+    def update_PT(self, P, T):
+        self.state.update(CP.PT_INPUTS, P, T)
+
+    def update_PS(self, P, Smass):
+        self.state.update(CP.PSmass_INPUTS, P, Smass)
+
+    def update_PS_guess(self, P, Smass, T, rhomass, max_iter=10, margin=0.01):
+        """
+        Warm started PS flash. CoolProp does not accept guesses for PS
+        inputs, so for a pure fluid in the single-phase region the state
+        is solved by Newton iteration on p(T, rho) = P and s(T, rho) = Smass 
+        from the guess, with explicit (rho, T) updates in the imposed phase.
+        The result is rejected, and an ordinary PS flash done, if the 
+        iteration does not converge or the density is not at least the 
+        relative margin outside the saturated density of its phase, i.e. 
+        if the state may be metastable or inside the two-phase region.
+
+        Return
+        ----------
+        retval : bool
+            True if the warm start was used
+        """
+        if self.warm_start and T is not None:
+            try:
+                if self.newton_PS(P, Smass, T, rhomass, max_iter, margin):
+                    return True
+            except ValueError:
+                pass
+        self.state.update(CP.PSmass_INPUTS, P, Smass)
+        return False
+
+    def newton_PS(self, P, Smass, T, rho, max_iter, margin):
+        liquid = rho > self.rhomass_crit
+        self.state.specify_phase(CP.iphase_liquid if liquid else CP.iphase_gas)
+        try:
+            for i in range(max_iter):
+                self.state.update(CP.DmassT_INPUTS, rho, T)
+                r_p = self.state.p() - P
+                r_s = self.state.smass() - Smass
+                # Entropy tolerance with a floor of 1e-11 J/kg/K, as the
+                # rounding error of s does not vanish where s is near zero
+                if abs(r_p) <= 1e-12 * P and abs(r_s) <= 1e-14 * max(abs(Smass), 1e3):
+                    break
+                dp_dT = self.state.first_partial_deriv(CP.iP, CP.iT, CP.iDmass)
+                dp_drho = self.state.first_partial_deriv(CP.iP, CP.iDmass, CP.iT)
+                ds_dT = self.state.cvmass() / T
+                # Maxwell relation (ds/drho)_T = -(dp/dT)_rho / rho^2
+                ds_drho = -dp_dT / rho**2
+                det = dp_dT * ds_drho - dp_drho * ds_dT
+                T -= (r_p * ds_drho - dp_drho * r_s) / det
+                rho -= (dp_dT * r_s - ds_dT * r_p) / det
+            else:
+                return False
+        finally:
+            self.state.unspecify_phase()
+
+        if T >= self.T_crit:
+            return True
+        rho_sat = self.state.saturation_ancillary(CP.iDmolar, 0 if liquid else 1, CP.iT, T) * self.molar_mass
+        if liquid:
+            return rho > rho_sat * (1 + margin)
+        return rho < rho_sat * (1 - margin)
+
+    def p(self):
+        return self.state.p()
+
+    def T(self):
+        return self.state.T()
+
+    def rhomass(self):
+        return self.state.rhomass()
+
+    def hmass(self):
+        return self.state.hmass()
+
+    def smass(self):
+        return self.state.smass()
+
+    def Q(self):
+        return self.state.Q()
+
+    def speed_sound(self):
+        """
+        Speed of sound at the current state. In the single phase region 
+        the backend value is returned directly. In the two-phase region
+        the homogeneous equilibrium (HEM) speed of sound is calculated from 
+        the two-phase derivatives of the backend:
+
+        (d_rho/d_P)_s = (d_rho/d_P)_h + (d_rho/d_h)_P / rho
+
+        since dh = T ds + dP / rho. If the backend does not provide two-phase 
+        derivatives (e.g. REFPROP) the Wood mixture expression is used.
+
+        Return
+        ----------
+        retval : float 
+            Speed of sound    
+        """
+        Q = self.state.Q()
+        if Q < 0 or Q > 1:
+            return self.state.speed_sound()
+
+        rho = self.state.rhomass()
+        try:
+            drho_dP = self.state.first_two_phase_deriv(CP.iDmass, CP.iP, CP.iHmass)
+            drho_dh = self.state.first_two_phase_deriv(CP.iDmass, CP.iHmass, CP.iP)
+        except ValueError:
+            return self.wood_speed_sound()
+        return 1 / math.sqrt(drho_dP + drho_dh / rho)
+
+    def wood_speed_sound(self):
+        """
+        Two-phase speed of sound from the Wood mixture expression 
+
+        1 / (rho C^2) = alpha / (rho_v C_v^2) + (1 - alpha) / (rho_l C_l^2)
+
+        with alpha being the vapour volume fraction. The saturated phase 
+        properties are taken at the current state.
+        """
+        rho = self.state.rhomass()
+        rho_l = self.state.saturated_liquid_keyed_output(CP.iDmass)
+        rho_v = self.state.saturated_vapor_keyed_output(CP.iDmass)
+        C_l = self.state.saturated_liquid_keyed_output(CP.ispeed_sound)
+        C_v = self.state.saturated_vapor_keyed_output(CP.ispeed_sound)
+        alpha = self.state.Q() * rho / rho_v
+        compressibility = alpha / (rho_v * C_v**2) + (1 - alpha) / (rho_l * C_l**2)
+        return 1 / math.sqrt(rho * compressibility)
@@ -0,0 +1,180 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import os
+import json
+import zipfile
+import hashlib
+import tempfile
+import numpy as np
+import CoolProp
+import CoolProp.CoolProp as CP
+from ramdecom.wavespeed import configure_refprop
+from ramdecom.composition import Composition
+from ramdecom.cache import default_cache_dir
+
+# Increase when the stored envelopes change
+ENVELOPE_VERSION = 1
+
+# Envelopes kept in memory by key, see envelope_key()
+_envelopes = {}
+
+
+class EnvelopeError(Exception):
+    """Raised if the phase envelope of a mixture cannot be calculated"""
+    pass
+
+
+class PhaseEnvelope:
+    """
+    Saturation line of a pure fluid from the triple to the critical point,
+    or phase envelope of a mixture, as temperature (K) and pressure (Pa)
+    arrays. Critical and triple point are NaN where not available, i.e.
+    for mixtures. For a mixture where the calculation failed the arrays
+    are empty and error holds the message.
+    """
+
+    def __init__(self, T, p, Tc=np.nan, pc=np.nan, Tt=np.nan, pt=np.nan, mixture=False, error=None):
+        self.T = np.asarray(T, dtype=float)
+        self.p = np.asarray(p, dtype=float)
+        self.Tc = float(Tc)
+        self.pc = float(pc)
+        self.Tt = float(Tt)
+        self.pt = float(pt)
+        self.mixture = mixture
+        self.error = error
+
+    @classmethod
+    def calculate(cls, eos, comp, molefracs, n=100):
+        """
+        Calculate the saturation line (n points) of a pure fluid or the
+        phase envelope of a mixture
+        """
+        asfluid = CP.AbstractState(eos, comp)
+        if len(molefracs) == 1:
+            Tc = asfluid.keyed_output(CP.iT_critical)
+            pc = asfluid.keyed_output(CP.iP_critical)
+            Tt = asfluid.keyed_output(CP.iT_triple)
+            pt = asfluid.keyed_output(CP.iP_triple)
+            T = np.linspace(Tt, Tc, n)
+            p = CP.PropsSI('P', 'T', T, 'Q', 0, eos + '::' + comp)
+            return cls(T, p, Tc, pc, Tt, pt)
+
+        asfluid.set_mole_fractions(list(molefracs))
+        try:
+            asfluid.build_phase_envelope("")
+            PE = asfluid.get_phase_envelope_data()
+        except ValueError as err:
+            return cls([], [], mixture=True, error=str(err))
+        return cls(PE.T, PE.p, mixture=True)
+
+    def save(self, filename):
+        np.savez(filename, T=self.T, p=self.p, Tc=self.Tc, pc=self.pc, Tt=self.Tt, pt=self.pt,
+                 mixture=self.mixture, error=self.error or '', version=ENVELOPE_VERSION)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            if int(f['version']) != ENVELOPE_VERSION:
+                raise ValueError("Phase envelope version mismatch")
+            return cls(f['T'], f['p'], f['Tc'], f['pc'], f['Tt'], f['pt'], bool(f['mixture']),
+                       str(f['error']) or None)
+
+    def contains(self, T, P):
+        """
+        True for states (T, P) inside the phase envelope of a mixture,
+        i.e. in the two-phase region. The saturation line of a pure fluid
+        encloses no states and False is returned.
+
+        Parameters
+        ----------
+        T, P : float or array_like
+            Temperature (K) and pressure (Pa)
+        """
+        T = np.asarray(T, dtype=float)
+        P = np.asarray(P, dtype=float)
+        inside = np.zeros(np.broadcast(T, P).shape, dtype=bool)
+        if not self.mixture:
+            return inside
+        # Even-odd rule on the envelope closed between its end points
+        T1, p1 = self.T, self.p
+        T2, p2 = np.roll(T1, -1), np.roll(p1, -1)
+        for Ta, pa, Tb, pb in zip(T1, p1, T2, p2):
+            if pa == pb:
+                continue
+            crosses = (pa > P) != (pb > P)
+            T_cross = Ta + (P - pa) * (Tb - Ta) / (pb - pa)
+            inside ^= crosses & (T < T_cross)
+        return inside
+
+
+def envelope_key(eos, fluid, refprop_option=None):
+    """
+    Key of the envelope by equation of state, canonical composition and 
+    REFPROP option
+    """
+    composition = Composition.parse(fluid)
+    if eos != 'REFPROP':
+        refprop_option = None
+    return (eos, composition.comp, composition.fractions, refprop_option)
+
+
+def get_envelope(eos, fluid, refprop_option=None, directory=None):
+    """
+    Saturation line or phase envelope of the fluid, calculated once per
+    equation of state and normalised composition. Envelopes are kept in
+    memory and stored on disk, by default in the 'envelopes' directory of
+    the result cache (see ramdecom.cache.default_cache_dir()). Mixtures for
+    which the envelope does not converge are remembered as well.
+
+    Parameters
+    ----------
+    eos : str
+        'HEOS' or 'REFPROP'
+    fluid : str
+        Fluid string, e.g. "CO2" or "CO2[0.9667]&O2[0.0333]"
+    refprop_option : str, optional
+        'GERG' or 'PR', see configure_refprop()
+    directory : str, optional
+        Directory of the stored envelopes
+
+    Return
+    ----------
+    retval : PhaseEnvelope
+
+    Raises
+    ----------
+    EnvelopeError
+        If the phase envelope of a mixture cannot be calculated
+    """
+    key = envelope_key(eos, fluid, refprop_option)
+    if key not in _envelopes:
+        if directory is None:
+            directory = os.path.join(default_cache_dir(), 'envelopes')
+        digest = hashlib.sha256(json.dumps({'key': key, 'coolprop': CoolProp.__version__,
+                                            'version': ENVELOPE_VERSION}).encode()).hexdigest()
+        path = os.path.join(directory, digest + '.npz')
+        try:
+            _envelopes[key] = PhaseEnvelope.load(path)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # Missing or corrupt entry, recalculated and overwritten
+            eos, comp, molefracs, refprop_option = key
+            if eos == 'REFPROP':
+                configure_refprop(refprop_option)
+            _envelopes[key] = PhaseEnvelope.calculate(eos, comp, molefracs)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        _envelopes[key].save(f)
+                    os.replace(tmp, path)
+                except OSError:
+                    os.remove(tmp)
+                    raise
+            except OSError:
+                pass
+
+    envelope = _envelopes[key]
+    if envelope.error is not None:
+        raise EnvelopeError(envelope.error)
+    return envelope
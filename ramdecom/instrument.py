@@ -0,0 +1,170 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import time
+from ramdecom.engine import StateEngine
+
+FLASHES = ('update_PT', 'update_PS', 'update_PS_guess')
+
+
+class RunStats:
+    """
+    Backend call statistics of one or more WaveSpeed runs:
+
+    - calls / times: number of calls and cumulative time (s) per engine
+      method, e.g. 'update_PS', 'rhomass', 'speed_sound'
+    - region_calls / region_times: flashes and their cumulative time per
+      phase region ('single_phase', 'two_phase') of the resulting state
+    - stage_calls / stage_times: calls and cumulative time of the stages
+      of a pressure step in WaveSpeed, 'flash' (the PS flash and property
+      reads) and 'sound_speed' (including the finite difference flash)
+    - failures: list of dicts with the call, pressure P (Pa), entropy S
+      (J/kg/K) and exception text of every failed backend call
+    - wall_time: total time (s) spent in WaveSpeed.run()
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.times = {}
+        self.region_calls = {}
+        self.region_times = {}
+        self.stage_calls = {}
+        self.stage_times = {}
+        self.failures = []
+        self.wall_time = 0.0
+        self.runs = 0
+
+    def record(self, name, elapsed):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+
+    def record_region(self, region, elapsed):
+        self.region_calls[region] = self.region_calls.get(region, 0) + 1
+        self.region_times[region] = self.region_times.get(region, 0.0) + elapsed
+
+    def record_stage(self, stage, elapsed):
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + elapsed
+
+    def record_failure(self, call, P, S, err):
+        self.failures.append({'call': call, 'P': P, 'S': S, 'error': repr(err)})
+
+    @property
+    def flashes(self):
+        """
+        Total number of flash calculations
+        """
+        return sum(self.calls.get(name, 0) for name in FLASHES)
+
+    def timed(self, stage, func):
+        """
+        Wrap func such that its calls are recorded as the given stage
+        """
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record_stage(stage, time.perf_counter() - t0)
+        return wrapper
+
+    def merge(self, other):
+        """
+        Add the statistics of another RunStats, e.g. to aggregate many runs
+        """
+        for mine, theirs in ((self.calls, other.calls), (self.times, other.times),
+                             (self.region_calls, other.region_calls), (self.region_times, other.region_times),
+                             (self.stage_calls, other.stage_calls), (self.stage_times, other.stage_times)):
+            for key, value in theirs.items():
+                mine[key] = mine.get(key, 0) + value
+        self.failures.extend(other.failures)
+        self.wall_time += other.wall_time
+        self.runs += other.runs
+
+    def as_dict(self):
+        """
+        Statistics as a JSON serialisable dict
+        """
+        return {'calls': dict(self.calls),
+                'times': dict(self.times),
+                'region_calls': dict(self.region_calls),
+                'region_times': dict(self.region_times),
+                'stage_calls': dict(self.stage_calls),
+                'stage_times': dict(self.stage_times),
+                'flashes': self.flashes,
+                'failures': list(self.failures),
+                'wall_time': self.wall_time,
+                'runs': self.runs}
+
+
+class InstrumentedEngine(StateEngine):
+    """
+    State engine wrapper recording calls, timings, phase regions and
+    failures of another engine in a RunStats object
+    """
+
+    def __init__(self, engine, stats):
+        self.engine = engine
+        self.stats = stats
+        self.state = getattr(engine, 'state', None)
+        self.P = None
+        self.S = None
+
+    def _call(self, name, *args):
+        t0 = time.perf_counter()
+        try:
+            return getattr(self.engine, name)(*args)
+        finally:
+            self.stats.record(name, time.perf_counter() - t0)
+
+    def _flash(self, name, P, S, *args):
+        self.P = P
+        self.S = S
+        t0 = time.perf_counter()
+        try:
+            retval = getattr(self.engine, name)(*args)
+        except Exception as err:
+            self.stats.record(name, time.perf_counter() - t0)
+            self.stats.record_failure(name, P, S, err)
+            raise
+        elapsed = time.perf_counter() - t0
+        self.stats.record(name, elapsed)
+        Q = self.engine.Q()
+        self.stats.record_region('two_phase' if 0 <= Q <= 1 else 'single_phase', elapsed)
+        return retval
+
+    def set_mole_fractions(self, molefracs):
+        return self._call('set_mole_fractions', molefracs)
+
+    def update_PT(self, P, T):
+        self._flash('update_PT', P, None, P, T)
+
+    def update_PS(self, P, Smass):
+        self._flash('update_PS', P, Smass, P, Smass)
+
+    def update_PS_guess(self, P, Smass, T, rhomass):
+        return self._flash('update_PS_guess', P, Smass, P, Smass, T, rhomass)
+
+    def p(self):
+        return self._call('p')
+
+    def T(self):
+        return self._call('T')
+
+    def rhomass(self):
+        return self._call('rhomass')
+
+    def hmass(self):
+        return self._call('hmass')
+
+    def smass(self):
+        return self._call('smass')
+
+    def Q(self):
+        return self._call('Q')
+
+    def speed_sound(self):
+        try:
+            return self._call('speed_sound')
+        except Exception as err:
+            self.stats.record_failure('speed_sound', self.P, self.S, err)
+            raise
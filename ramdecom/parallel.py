@@ -0,0 +1,85 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import multiprocessing
+from ramdecom.wavespeed import WaveSpeed
+from ramdecom.engine import clear_states
+
+
+def run_case(input):
+    """
+    Run a single WaveSpeed case. Exceptions are caught and returned so
+    that a failing case does not abort a batch of cases. The backend is
+    borrowed from the process-wide pool (see engine.acquire_state()), so
+    cases with the same backend, components and REFPROP option share it.
+
+    Parameters
+    ----------
+    input : dict
+        WaveSpeed input
+
+    Return
+    ----------
+    retval : dict
+        'input': the input dict, 'results': dict of result arrays
+        (WaveSpeed.get_results()) or None, 'error': None or the
+        exception text
+    """
+    try:
+        ws = WaveSpeed(input)
+        ws.run()
+    except Exception as err:
+        return {'input': input, 'results': None, 'error': repr(err)}
+    return {'input': input, 'results': ws.get_results(), 'error': None}
+
+
+def _init_worker():
+    clear_states()
+
+
+def _run_indexed(task):
+    i, func, input = task
+    return i, func(input)
+
+
+def run_many(inputs, workers=None, chunksize=1, func=run_case, ordered=True):
+    """
+    Run independent WaveSpeed cases on a pool of worker processes. Each
+    worker constructs a backend once per eos, set of components and 
+    REFPROP option and reuses it for all its cases. The REFPROP configuration
+    is set from each case's input, so options do not leak between cases
+    in the same worker.
+
+    Results are yielded as soon as they are available, in the order of
+    the inputs, or with ordered=False in the order the cases finish, so
+    that a slow case does not hold back the results after it.
+
+    Parameters
+    ----------
+    inputs : iterable of dict
+        WaveSpeed inputs
+    workers : int, optional
+        Number of worker processes, default is the number of CPUs. With
+        workers=1 the cases are run in the calling process.
+    chunksize : int
+        Number of cases sent to a worker at a time
+    func : callable
+        Module level function running one case, default run_case()
+    ordered : bool
+        If False, (index, result) pairs are yielded as the cases finish
+
+    Return
+    ----------
+    retval : generator
+        One dict per case, see run_case()
+    """
+    if workers == 1:
+        for i, input in enumerate(inputs):
+            yield func(input) if ordered else (i, func(input))
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        if ordered:
+            yield from pool.imap(func, inputs, chunksize)
+        else:
+            tasks = ((i, func, input) for i, input in enumerate(inputs))
+            yield from pool.imap_unordered(_run_indexed, tasks, chunksize)
@@ -0,0 +1,116 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from collections import namedtuple
+import numpy as np
+
+# Quantities stored per point of the decompression curve
+FIELDS = ('P', 'T', 'S_mass', 'H_mass', 'rho_mass', 'Q', 'C', 'U', 'W')
+DTYPE = np.dtype([(name, 'f8') for name in FIELDS])
+
+COLUMNS = {'P': 'Pressure (Pa)',
+           'T': 'Temperature (K)',
+           'C': 'Speed of sound (m/s)',
+           'U': 'Bernouilli velocity (m/s)',
+           'W': 'Decompression wave speed (m/s)',
+           'rho_mass': 'Fluid density (kg/m3)',
+           'H_mass': 'Fluid enthalpy (J/kg)',
+           }
+
+# Point of the decompression curve as yielded by WaveSpeed.iter_steps()
+Step = namedtuple('Step', ('P', 'T', 'rho_mass', 'H_mass', 'Q', 'C', 'U', 'W'))
+
+
+class DecompressionResult:
+    """
+    Decompression curve stored in a preallocated NumPy structured array
+    with one record per pressure step. The storage grows by doubling if
+    the capacity is exceeded and can be trimmed when the curve is
+    finished. Fields are accessed as zero-copy views, e.g. result['W'].
+    """
+
+    def __init__(self, capacity=64):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of points to preallocate
+        """
+        self._data = np.empty(max(capacity, 1), dtype=DTYPE)
+        self.n = 0
+        self._df = None
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, name):
+        return self._data[name][:self.n]
+
+    @property
+    def data(self):
+        """
+        Structured array view of the stored points
+        """
+        return self._data[:self.n]
+
+    def append(self, P, T, S_mass, H_mass, rho_mass, Q, C, U, W):
+        """
+        Store one point of the decompression curve
+        """
+        if self.n == len(self._data):
+            self._data = np.resize(self._data, 2 * len(self._data))
+        self._data[self.n] = (P, T, S_mass, H_mass, rho_mass, Q, C, U, W)
+        self.n += 1
+        self._df = None
+
+    def replace(self, start, stop, records):
+        """
+        Replace the points start:stop by a sequence of records, tuples in
+        the order of FIELDS
+        """
+        new = np.array(records, dtype=DTYPE)
+        self._data = np.concatenate((self._data[:start], new, self._data[stop:self.n]))
+        self.n = len(self._data)
+        self._df = None
+
+    def trim(self):
+        """
+        Release the unused preallocated storage
+        """
+        if self.n < len(self._data):
+            self._data = self._data[:self.n].copy()
+
+    def invalidate(self):
+        """
+        Discard the cached DataFrame after the stored values are modified
+        """
+        self._df = None
+
+    def to_dict(self):
+        """
+        Dict of field views, see WaveSpeed.get_results()
+        """
+        return {name: self[name] for name in FIELDS}
+
+    def to_dataframe(self):
+        """
+        Results as a pandas DataFrame, built on first use
+        """
+        if self._df is None:
+            import pandas as pd
+            self._df = pd.DataFrame({column: self[name] for name, column in COLUMNS.items()})
+        return self._df
+
+    @classmethod
+    def from_dict(cls, results):
+        """
+        Result from a dict of arrays. Fields missing in the dict are NaN.
+        """
+        n = len(results['P'])
+        result = cls(n)
+        for name in FIELDS:
+            if name in results:
+                result._data[name][:n] = results[name]
+            else:
+                result._data[name][:n] = np.nan
+        result.n = n
+        return result
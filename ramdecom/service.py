@@ -0,0 +1,323 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+"""
+Local HTTP calculation service, started by
+
+    ramdecom serve --port 8000 -w 4
+
+Endpoints (JSON):
+
+    POST /jobs              WaveSpeed input, returns the job id and status
+    GET  /jobs/<id>         status, and the results when done; with
+                            ?wait=<s> the request waits up to s seconds
+                            for the job to finish
+    GET  /health            number of workers and jobs
+
+Identical inputs get the same job id, so a request for a calculation
+already queued or running joins it instead of starting another, and
+finished results are served from the shared result cache (see
+ramdecom.cache.ResultCache).
+"""
+
+import json
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from ramdecom.wavespeed import INPUT_SCHEMA, InputError, configure_refprop, plateau_point
+from ramdecom.cache import ResultCache, cache_key, normalise_input
+from ramdecom.engine import clear_states
+from ramdecom.parallel import run_case
+
+
+class ServiceBusy(Exception):
+    """Raised if the job queue of the service is full"""
+    pass
+
+
+def _init_worker():
+    # Each worker is a process of its own, so CoolProp's global REFPROP
+    # configuration (set per case by WaveSpeed) is never shared between
+    # concurrent calculations
+    clear_states()
+    configure_refprop(None)
+
+
+def validate(input):
+    """
+    Validate a WaveSpeed input against the cerberus schema
+
+    Return
+    ----------
+    retval : dict
+        Normalised input, see cache.normalise_input()
+
+    Raises
+    ----------
+    InputError
+        With the cerberus errors as message
+    """
+    from cerberus import Validator
+
+    if not isinstance(input, dict):
+        raise InputError("Input must be a JSON object")
+    v = Validator(INPUT_SCHEMA)
+    if not v.validate(input):
+        raise InputError(json.dumps(v.errors))
+    return normalise_input(input, validate=False)
+
+
+def to_json(values):
+    """
+    List of floats with NaN as None, as JSON has no NaN
+    """
+    return [None if math.isnan(v) else v for v in map(float, values)]
+
+
+class Job:
+    """
+    Calculation of one normalised input. status is 'queued', 'running',
+    'done' or 'failed'; source is 'cache' or 'calculation' when done.
+    """
+
+    def __init__(self, id, input):
+        self.id = id
+        self.input = input
+        self.future = None
+        self.results = None
+        self.error = None
+        self.source = None
+        self.finished = threading.Event()
+
+    @property
+    def status(self):
+        if self.finished.is_set():
+            return 'failed' if self.error else 'done'
+        if self.future is not None and self.future.running():
+            return 'running'
+        return 'queued'
+
+    def as_dict(self, results=True):
+        retval = {'id': self.id, 'status': self.status, 'input': self.input}
+        if self.error:
+            retval['error'] = self.error
+        if self.finished.is_set() and not self.error:
+            retval['source'] = self.source
+            P, W = plateau_point(self.results['P'], self.results['Q'], self.results['W'])
+            retval['plateau'] = to_json([P, W])
+            if results:
+                retval['results'] = {name: to_json(values) for name, values in self.results.items()}
+        return retval
+
+
+class CalculationService:
+    """
+    Job queue on a bounded pool of worker processes with deduplication of
+    identical inputs and a shared result cache
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker processes, default the number of CPUs
+    cache : ResultCache, optional
+        Result cache, default the user cache directory
+    max_pending : int
+        Largest number of queued and running jobs; further submissions
+        raise ServiceBusy
+    max_jobs : int
+        Number of jobs kept for polling, the oldest finished jobs are
+        forgotten first (their results stay in the cache)
+    """
+
+    def __init__(self, workers=None, cache=None, max_pending=100, max_jobs=1000):
+        self.executor = ProcessPoolExecutor(workers, initializer=_init_worker)
+        self.workers = self.executor._max_workers
+        self.cache = cache if cache is not None else ResultCache()
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        # Reentrant, as submit() counts the pending jobs holding the lock
+        self.lock = threading.RLock()
+
+    @property
+    def pending(self):
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if not job.finished.is_set())
+
+    def restart(self):
+        """
+        Replace a broken worker pool, e.g. after a worker crashed in the
+        backend. The jobs of the old pool have failed.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+
+    def start(self, job):
+        """
+        Run the job on the worker pool, restarting the pool once if it
+        is broken. If that fails too the job is marked failed.
+        """
+        for attempt in range(2):
+            try:
+                job.future = self.executor.submit(run_case, job.input)
+                break
+            except BrokenProcessPool as err:
+                if attempt:
+                    job.error = repr(err)
+                    job.finished.set()
+                    return
+                self.restart()
+        job.future.add_done_callback(lambda future, job=job: self.finish(job, future))
+
+    def submit(self, input):
+        """
+        Submit a calculation, or join the job of an identical input
+
+        Return
+        ----------
+        retval : Job
+
+        Raises
+        ----------
+        InputError
+            If the input is invalid
+        ServiceBusy
+            If max_pending jobs are queued or running
+
+        A job whose worker crashed is failed, submitting the input again
+        runs it on a new worker pool.
+        """
+        input = validate(input)
+        id = cache_key(input, normalised=True)
+        with self.lock:
+            job = self.jobs.get(id)
+            if job is not None and job.status != 'failed':
+                self.jobs.move_to_end(id)
+                return job
+            job = Job(id, input)
+            results = self.cache.get(input, id)
+            if results is not None:
+                job.results = results
+                job.source = 'cache'
+                job.finished.set()
+            else:
+                if self.pending >= self.max_pending:
+                    raise ServiceBusy("Job queue is full")
+                self.start(job)
+            self.jobs[id] = job
+            self.forget()
+        return job
+
+    def finish(self, job, future):
+        try:
+            case = future.result()
+        except Exception as err:
+            case = {'results': None, 'error': repr(err)}
+        if case['error']:
+            job.error = case['error']
+        else:
+            job.results = case['results']
+            job.source = 'calculation'
+            try:
+                self.cache.put(job.input, job.results, job.id)
+            except OSError:
+                pass
+        job.finished.set()
+
+    def forget(self):
+        """
+        Drop the oldest finished jobs beyond max_jobs
+        """
+        for id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[id].finished.is_set():
+                del self.jobs[id]
+
+    def get(self, id, wait=None):
+        """
+        Job by id, None if unknown. With wait the call blocks up to wait
+        seconds for the job to finish.
+        """
+        with self.lock:
+            job = self.jobs.get(id)
+        if job is not None and wait:
+            job.finished.wait(wait)
+        return job
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints of the CalculationService of the server
+    """
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            return self.send_json(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            input = json.loads(self.rfile.read(length) or b'null')
+            job = self.server.service.submit(input)
+        except (ValueError, InputError) as err:
+            return self.send_json(400, {'error': str(err)})
+        except ServiceBusy as err:
+            return self.send_json(503, {'error': str(err)})
+        self.send_json(200 if job.finished.is_set() else 202, job.as_dict(results=False))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        service = self.server.service
+        if parts == ['health']:
+            return self.send_json(200, {'workers': service.workers, 'jobs': len(service.jobs),
+                                        'pending': service.pending})
+        if len(parts) == 2 and parts[0] == 'jobs':
+            try:
+                wait = float(parse_qs(url.query).get('wait', ['0'])[0])
+            except ValueError:
+                return self.send_json(400, {'error': 'Invalid wait'})
+            job = service.get(parts[1], wait)
+            if job is None:
+                return self.send_json(404, {'error': 'Unknown job'})
+            return self.send_json(200, job.as_dict())
+        self.send_json(404, {'error': 'Not found'})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host='127.0.0.1', port=8000, service=None, verbose=False):
+    """
+    HTTP server of a CalculationService, each request handled in a thread
+    """
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service if service is not None else CalculationService()
+    server.verbose = verbose
+    return server
+
+
+def serve(host='127.0.0.1', port=8000, workers=None, cache_dir=None, max_pending=100, verbose=True):
+    """
+    Run the calculation service until interrupted
+    """
+    service = CalculationService(workers, ResultCache(cache_dir), max_pending)
+    server = make_server(host, port, service, verbose)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
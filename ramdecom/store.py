@@ -0,0 +1,270 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import os
+import json
+import numpy as np
+from ramdecom.result import FIELDS
+from ramdecom.wavespeed import plateau_point
+
+# Increase when the layout of the store changes
+STORE_VERSION = 1
+
+HEADER_FILE = 'store.json'
+INDEX_FILE = 'index.jsonl'
+COLUMN_DTYPE = np.dtype('<f8')
+
+
+class StoreError(Exception):
+    """Raised if a result store cannot be opened"""
+    pass
+
+
+class ResultStore:
+    """
+    Append-only columnar store of decompression curves in a directory.
+    Each result field (P, T, ..., W, see ramdecom.result.FIELDS) is a raw
+    little-endian float64 file with the curves one after the other, read
+    through memory maps, so a curve or a field of all curves is a
+    zero-copy view. The index (index.jsonl) holds one line per curve with
+    its position in the columns, the WaveSpeed input and the plateau and
+    end pressure, and is what queries are evaluated on.
+
+    A curve is committed when its index line is written, after the column
+    data. Column data and a partial index line of an interrupted append
+    are discarded when the store is opened for writing. A store has a single writer; readers in
+    other processes see the curves committed when they opened the store
+    or called refresh().
+    """
+
+    def __init__(self, directory, mode='a'):
+        """
+        Parameters
+        ----------
+        directory : str
+            Store directory, created in mode 'a'
+        mode : str
+            'a' to read and append, 'r' to read only
+        """
+        self.directory = directory
+        self.mode = mode
+        header = os.path.join(directory, HEADER_FILE)
+        if not os.path.exists(header):
+            if mode == 'r':
+                raise StoreError("No result store in " + directory)
+            os.makedirs(directory, exist_ok=True)
+            with open(header, 'w') as f:
+                json.dump({'version': STORE_VERSION, 'fields': list(FIELDS), 'dtype': COLUMN_DTYPE.str}, f)
+        with open(header) as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION or meta.get('fields') != list(FIELDS):
+            raise StoreError("Result store version mismatch in " + directory)
+        self._maps = {}
+        self.refresh()
+        if mode != 'r':
+            self._truncate()
+
+    def column_path(self, name):
+        return os.path.join(self.directory, name + '.f8')
+
+    def refresh(self):
+        """
+        Read the index, e.g. to see curves appended by another process
+        """
+        self.index = []
+        # Length in bytes of the committed index lines
+        self.index_size = 0
+        path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Line cut short by an interrupted append
+                        break
+                    try:
+                        self.index.append(json.loads(line))
+                    except ValueError:
+                        break
+                    self.index_size += len(line)
+        self.n_points = self.index[-1]['offset'] + self.index[-1]['length'] if self.index else 0
+        self._maps = {}
+        self._table = None
+
+    def _truncate(self):
+        """
+        Discard column data beyond the last committed curve and index data
+        beyond the last complete line, so that the next index line starts
+        on a line of its own
+        """
+        path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(path) and os.path.getsize(path) > self.index_size:
+            with open(path, 'r+b') as f:
+                f.truncate(self.index_size)
+        for name in FIELDS:
+            path = self.column_path(name)
+            with open(path, 'ab') as f:
+                if f.tell() > self.n_points * COLUMN_DTYPE.itemsize:
+                    f.truncate(self.n_points * COLUMN_DTYPE.itemsize)
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, results, input=None, **metadata):
+        """
+        Append one curve
+
+        Parameters
+        ----------
+        results : dict
+            Result arrays, see WaveSpeed.get_results()
+        input : dict, optional
+            WaveSpeed input, stored as metadata
+        **metadata
+            Additional JSON serialisable metadata, e.g. a case name
+
+        Return
+        ----------
+        retval : int
+            Curve id
+        """
+        if self.mode == 'r':
+            raise StoreError("Result store opened read only")
+        n = len(results['P'])
+        try:
+            for name in FIELDS:
+                values = np.asarray(results[name], dtype=COLUMN_DTYPE) if name in results else np.full(n, np.nan)
+                with open(self.column_path(name), 'ab') as f:
+                    f.write(values.tobytes())
+        except Exception:
+            self._truncate()
+            raise
+
+        entry = {'id': len(self.index), 'offset': self.n_points, 'length': n}
+        if n > 0:
+            P, W = plateau_point(results['P'], results['Q'], results['W'])
+            entry['plateau_pressure'] = None if np.isnan(P) else float(P)
+            entry['plateau_wave_speed'] = None if np.isnan(W) else float(W)
+            entry['end_pressure'] = float(results['P'][-1])
+        if input:
+            entry['input'] = dict(input)
+        entry.update(metadata)
+        line = (json.dumps(entry) + '\n').encode()
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            self._truncate()
+            raise
+        self.index_size += len(line)
+        self.index.append(entry)
+        self.n_points += n
+        self._maps = {}
+        self._table = None
+        return entry['id']
+
+    def append_run(self, ws, **metadata):
+        """
+        Append the curve of a finished WaveSpeed calculation with its input
+        """
+        return self.append(ws.get_results(), ws.input, **metadata)
+
+    def column(self, name):
+        """
+        Field of all curves as one read only memory mapped array
+        """
+        if name not in FIELDS:
+            raise KeyError(name)
+        if name not in self._maps:
+            if self.n_points == 0:
+                return np.empty(0, dtype=COLUMN_DTYPE)
+            self._maps[name] = np.memmap(self.column_path(name), dtype=COLUMN_DTYPE, mode='r',
+                                         shape=(self.n_points,))
+        return self._maps[name]
+
+    def curve(self, i, fields=FIELDS):
+        """
+        Curve i as a dict of zero-copy views of the memory mapped columns
+        """
+        entry = self.index[i]
+        start, stop = entry['offset'], entry['offset'] + entry['length']
+        return {name: self.column(name)[start:stop] for name in fields}
+
+    def curves(self, ids=None, fields=FIELDS):
+        """
+        Iterate over (id, curve) for the given ids, default all curves
+        """
+        if ids is None:
+            ids = range(len(self.index))
+        for i in ids:
+            yield int(i), self.curve(int(i), fields)
+
+    def metadata(self, i):
+        return self.index[i]
+
+    def table(self):
+        """
+        Index as a dict of NumPy arrays, one entry per curve, with the
+        input flattened into the top level (e.g. 'pressure', 'fluid').
+        Missing values are NaN for numbers and None otherwise.
+        """
+        if self._table is None:
+            rows = []
+            for entry in self.index:
+                row = dict(entry.get('input', {}))
+                row.update({key: value for key, value in entry.items() if key != 'input'})
+                rows.append(row)
+            keys = []
+            for row in rows:
+                keys.extend(key for key in row if key not in keys)
+            table = {}
+            for key in keys:
+                values = [row.get(key) for row in rows]
+                if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+                    table[key] = np.array([np.nan if v is None else v for v in values], dtype=float)
+                else:
+                    table[key] = np.array(values, dtype=object)
+            self._table = table
+        return self._table
+
+    def query(self, **conditions):
+        """
+        Ids of the curves matching all conditions on the index (see
+        table()), without reading the curves. A condition is a value
+        (equality), a (lower, upper) tuple (inclusive range, None for
+        open) or a callable returning a boolean mask, e.g.
+
+            store.query(fluid='CO2', pressure=(100e5, 150e5))
+            store.query(plateau_pressure=lambda p: p > 50e5)
+
+        Return
+        ----------
+        retval : ndarray
+            Curve ids
+        """
+        table = self.table()
+        mask = np.ones(len(self.index), dtype=bool)
+        for key, condition in conditions.items():
+            if key not in table:
+                return np.empty(0, dtype=int)
+            values = table[key]
+            if callable(condition):
+                mask &= np.asarray(condition(values), dtype=bool)
+            elif isinstance(condition, tuple):
+                lower, upper = condition
+                with np.errstate(invalid='ignore'):
+                    if lower is not None:
+                        mask &= values >= lower
+                    if upper is not None:
+                        mask &= values <= upper
+            else:
+                mask &= np.array([v == condition for v in values], dtype=bool)
+        return np.flatnonzero(mask)
+
+    def get_dataframe(self):
+        """
+        Index as a pandas DataFrame, one row per curve
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.table())
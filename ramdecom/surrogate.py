@@ -0,0 +1,332 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import json
+import numpy as np
+from ramdecom.wavespeed import WaveSpeed
+from ramdecom.parallel import run_many
+from ramdecom.sweep import design_points, mix_fluid
+
+# Increase when the stored surrogates change
+SURROGATE_VERSION = 1
+
+
+def curve_pressures(P0, P_plateau, P_end, u):
+    """
+    Pressures of the curve points at the fractions u (1 to 0) of the
+    single-phase branch from P0 to the plateau followed by the two-phase
+    branch from the plateau to the end of the curve
+    """
+    return np.concatenate((P_plateau + u * (P0 - P_plateau), P_end + u * (P_plateau - P_end)))
+
+
+def evaluate(input, u):
+    """
+    Full calculation of the surrogate quantities: plateau pressure and
+    wave speed (WaveSpeed.find_plateau(), resolved to pressure_step_min),
+    end pressure of the curve and W at the points of curve_pressures().
+    The curve is represented relative to the plateau, so that the kink 
+    of W at the phase boundary is at the same point for all cases.
+
+    All quantities are NaN if the isentrope does not enter the two-phase
+    region above pressure_break, i.e. there is no plateau.
+    """
+    ws = WaveSpeed(input)
+    ws.run()
+    P_plateau, W_plateau = ws.find_plateau(P_guess=ws.get_plateau()[0])
+    if np.isnan(P_plateau):
+        return np.full(3 + 2 * len(u), np.nan)
+    P = ws.P[::-1]
+    W = ws.W[::-1]
+    above = P > P_plateau
+    P_end = P[0]
+    W_hi = branch(P_plateau + u * (ws.P0 - P_plateau), P[above], W[above], W_plateau)
+    W_lo = branch(P_end + u * (P_plateau - P_end), P[~above], W[~above], W_plateau)
+    return np.concatenate(([P_plateau, W_plateau, P_end], W_hi, W_lo))
+
+
+def branch(P_new, P, W, W_plateau):
+    """
+    W of a curve branch interpolated at P_new. A branch without points,
+    e.g. the single-phase branch of P0 within pressure_step_min of
+    saturation, has the plateau wave speed.
+    """
+    if len(P) == 0:
+        return np.full(len(P_new), W_plateau)
+    return np.interp(P_new, P, W)
+
+
+def training_case(task):
+    """
+    Surrogate quantities of one training input, None if the calculation
+    fails. Module level so that it can be run in worker processes.
+    """
+    input, u = task
+    try:
+        return evaluate(input, u)
+    except Exception:
+        return None
+
+
+def cubic(r):
+    return r**3
+
+
+class Surrogate:
+    """
+    Radial basis function surrogate of the decompression calculation over
+    initial pressure, temperature and impurity mole fractions. The plateau
+    pressure and wave speed, the end pressure and the wave speed curve W
+    (see curve_pressures()) are interpolated by a cubic RBF with a linear
+    polynomial, in coordinates scaled to the unit box of the training
+    domain.
+
+    The error estimate is the leave-one-out error of the training points
+    (Rippa's formula, no refitting), interpolated by inverse distance
+    weighting: for the plateau pressure (Pa), the plateau wave speed 
+    (m/s) and the largest deviation along the W curve (m/s).
+
+    See train() for building a surrogate from WaveSpeed calculations and
+    query() for predictions with fallback to the full calculation.
+    """
+
+    def __init__(self, X, Y, lower, upper, u, base, impurities=(), input=None):
+        """
+        Parameters
+        ----------
+        X : ndarray
+            Training points (P0, T0, impurity fractions...), shape (n, d)
+        Y : ndarray
+            Plateau pressure, plateau wave speed, end pressure and W per
+            training point, see evaluate(), shape (n, 3 + 2 * len(u))
+        lower, upper : array_like
+            Bounds of the training domain per coordinate
+        u : array_like
+            Fractions of the curve branches, see curve_pressures()
+        base : str
+            Base fluid string
+        impurities : sequence of str
+            Impurity names, one coordinate each after P0 and T0
+        input : dict, optional
+            Other WaveSpeed input of the training runs (eos, options)
+        """
+        self.X = np.asarray(X, dtype=float)
+        self.Y = np.asarray(Y, dtype=float)
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.u = np.asarray(u, dtype=float)
+        self.base = base
+        self.impurities = list(impurities)
+        self.input = dict(input or {})
+        self.fit()
+
+    def scale(self, X):
+        span = np.where(self.upper > self.lower, self.upper - self.lower, 1.)
+        return (np.asarray(X, dtype=float) - self.lower) / span
+
+    def distance(self, Z):
+        return np.sqrt(((Z[:, None, :] - self.Z[None, :, :])**2).sum(axis=2))
+
+    def basis(self, Z, r):
+        """
+        RBF and linear polynomial terms at scaled points Z with distances
+        r to the training points, shape (m, n + d + 1)
+        """
+        return np.hstack((cubic(r), np.ones((len(Z), 1)), Z))
+
+    def fit(self):
+        """
+        Solve for the RBF weights of the quantities and of their
+        leave-one-out errors
+        """
+        n, d = self.X.shape
+        self.Z = self.scale(self.X)
+        A = np.zeros((n + d + 1, n + d + 1))
+        A[:n] = self.basis(self.Z, self.distance(self.Z))
+        A[n:, :n] = A[:n, n:].T
+        A_inv = np.linalg.pinv(A)
+        rhs = np.zeros((n + d + 1, self.Y.shape[1]))
+        rhs[:n] = self.Y
+        weights = A_inv @ rhs
+        self.weights = weights
+        # Rippa: leave-one-out error e_i = c_i / (A^-1)_ii
+        loo = np.abs(weights[:n] / np.diag(A_inv)[:n, None])
+        self.loo = np.column_stack((loo[:, 0], loo[:, 1], loo[:, 3:].max(axis=1)))
+
+    def contains(self, x):
+        x = np.asarray(x, dtype=float)
+        return bool(np.all(x >= self.lower) and np.all(x <= self.upper))
+
+    def point(self, P0, T0, fractions=None):
+        fractions = [] if fractions is None else list(fractions)
+        if len(fractions) != len(self.impurities):
+            raise ValueError("Expected one mole fraction per impurity: " + ', '.join(self.impurities))
+        return np.array([P0, T0] + fractions, dtype=float)
+
+    def predict(self, P0, T0, fractions=None):
+        """
+        Surrogate prediction without domain or error checks
+
+        Parameters
+        ----------
+        P0 : float
+            Initial pressure (Pa)
+        T0 : float
+            Initial temperature (K)
+        fractions : sequence of float, optional
+            Impurity mole fractions in the order of self.impurities
+
+        Return
+        ----------
+        retval : dict
+            'plateau_pressure', 'plateau_wave_speed', the curve 'P' and 
+            'W' and 'error' (dict of the estimated errors 
+            'plateau_pressure', 'plateau_wave_speed' and 'W', the largest
+            along the curve)
+        """
+        Z = self.scale(self.point(P0, T0, fractions)[None, :])
+        r = self.distance(Z)
+        y = self.basis(Z, r)[0] @ self.weights
+        r = r[0]
+        if r.min() == 0:
+            error = self.loo[np.argmin(r)]
+        else:
+            w = 1 / r**2
+            error = w @ self.loo / w.sum()
+        return self.result(P0, y, error)
+
+    def result(self, P0, y, error):
+        return {'plateau_pressure': float(y[0]),
+                'plateau_wave_speed': float(y[1]),
+                'P': curve_pressures(P0, y[0], y[2], self.u),
+                'W': y[3:],
+                'error': {'plateau_pressure': float(error[0]),
+                          'plateau_wave_speed': float(error[1]),
+                          'W': float(error[2])}}
+
+    def fluid(self, fractions=None):
+        return mix_fluid(self.base, self.impurities, [] if fractions is None else list(fractions))
+
+    def compute(self, P0, T0, fractions=None):
+        """
+        Full WaveSpeed calculation in the format of predict(), with zero
+        error. The quantities are NaN if there is no plateau, see
+        evaluate().
+        """
+        x = self.point(P0, T0, fractions)
+        input = dict(self.input)
+        input['pressure'] = float(P0)
+        input['temperature'] = float(T0)
+        input['fluid'] = self.fluid(x[2:])
+        return self.result(P0, evaluate(input, self.u), np.zeros(3))
+
+    def query(self, P0, T0, fractions=None, tol_P=None, tol_W=None):
+        """
+        Surrogate prediction (see predict()), or the full calculation if
+        the point is outside the training domain or an estimated error
+        exceeds its tolerance. 'source' of the returned dict is
+        'surrogate' or 'full'. The full calculation gives NaN where the
+        isentrope does not reach the two-phase region, see evaluate().
+
+        Parameters
+        ----------
+        tol_P : float, optional
+            Tolerance of the plateau pressure (Pa)
+        tol_W : float, optional
+            Tolerance of the plateau wave speed and of W (m/s)
+        """
+        retval = None
+        if self.contains(self.point(P0, T0, fractions)):
+            retval = self.predict(P0, T0, fractions)
+            error = retval['error']
+            if ((tol_P is not None and error['plateau_pressure'] > tol_P)
+                    or (tol_W is not None and max(error['plateau_wave_speed'], error['W']) > tol_W)):
+                retval = None
+        if retval is None:
+            retval = self.compute(P0, T0, fractions)
+            retval['source'] = 'full'
+        else:
+            retval['source'] = 'surrogate'
+        return retval
+
+    def save(self, filename):
+        meta = {'base': self.base, 'impurities': self.impurities, 'input': self.input,
+                'version': SURROGATE_VERSION}
+        np.savez(filename, X=self.X, Y=self.Y, lower=self.lower, upper=self.upper, u=self.u,
+                 meta=json.dumps(meta))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            meta = json.loads(str(f['meta']))
+            if meta['version'] != SURROGATE_VERSION:
+                raise ValueError("Surrogate version mismatch")
+            return cls(f['X'], f['Y'], f['lower'], f['upper'], f['u'], meta['base'],
+                       meta['impurities'], meta['input'])
+
+
+def train(P_range, T_range, base='CO2', impurities=None, eos='HEOS', n=100, seed=None,
+          n_curve=25, options=None, workers=1, func=training_case):
+    """
+    Train a surrogate on WaveSpeed calculations at a Latin hypercube
+    design over the initial pressure, temperature and impurity fractions.
+    Failed calculations and cases without a plateau are left out.
+
+    Parameters
+    ----------
+    P_range : tuple
+        Lowest and highest initial pressure (Pa)
+    T_range : tuple
+        Lowest and highest initial temperature (K)
+    base : str
+        Base fluid string
+    impurities : dict, optional
+        Impurity name and (lower, upper) mole fraction range, see
+        sweep.composition_sweep()
+    eos : str
+        'HEOS' or 'REFPROP'
+    n : int
+        Number of training calculations
+    seed : int, optional
+        Random seed of the design
+    n_curve : int
+        Number of points of each branch of the W curve, see
+        curve_pressures()
+    options : dict, optional
+        Additional WaveSpeed input, e.g. {'sound_speed': 'analytic'}
+    workers : int
+        Number of worker processes, see parallel.run_many()
+    func : callable
+        Module level function returning the surrogate quantities of a
+        task (input, u) or None, default training_case()
+
+    Return
+    ----------
+    retval : Surrogate
+    """
+    impurities = impurities or {}
+    names = list(impurities)
+    ranges = [P_range, T_range] + [impurities[name] for name in names]
+    X = design_points(ranges, 'lhs', n, seed)
+    u = np.linspace(1, 0, n_curve)
+
+    input = {}
+    if options:
+        input.update(options)
+    input['eos'] = eos
+    inputs = []
+    for x in X:
+        case = dict(input)
+        case['pressure'] = float(x[0])
+        case['temperature'] = float(x[1])
+        case['fluid'] = mix_fluid(base, names, x[2:])
+        inputs.append(case)
+
+    rows, Y = [], []
+    for x, y in zip(X, run_many([(case, u) for case in inputs], workers=workers, func=func)):
+        if y is None or np.isnan(y).any():
+            continue
+        rows.append(x)
+        Y.append(y)
+    if len(rows) <= len(ranges) + 1:
+        raise ValueError("Too few successful training calculations")
+    return Surrogate(rows, Y, [r[0] for r in ranges], [r[1] for r in ranges], u, base, names, input)
@@ -0,0 +1,238 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import os
+import itertools
+import numpy as np
+from ramdecom.wavespeed import WaveSpeed
+from ramdecom.composition import Composition
+from ramdecom.batch import BatchResult
+from ramdecom.parallel import run_many
+
+
+class SweepResult(BatchResult):
+    """
+    Results of a composition sweep, see composition_sweep(). In addition
+    to the BatchResult arrays, the impurity names and their mole
+    fractions per case, an array of shape (n_cases, n_impurities), are
+    stored. If the sweep is run for the plateau only, the curve arrays
+    are NaN.
+    """
+
+    def __init__(self, P0, T0, fluid, pressure_grid, impurities, fractions, shape=None):
+        super().__init__(P0, T0, fluid, pressure_grid)
+        self.impurities = impurities
+        self.fractions = fractions
+        self.shape = shape
+
+    def surface(self, name):
+        """
+        Per case quantity or curve of a grid design reshaped to one axis
+        per impurity, e.g. surface('plateau_pressure') of shape (n, n) for
+        two impurities or surface('W') of shape (n, n, n_grid)
+        """
+        if self.shape is None:
+            raise ValueError("Surfaces are only available for grid designs")
+        values = getattr(self, name)
+        return values.reshape(self.shape + values.shape[1:])
+
+    def get_dataframe(self):
+        """
+        Per case summary as a pandas DataFrame with one column per impurity
+        """
+        df = super().get_dataframe()
+        for j, name in enumerate(self.impurities):
+            df[name + ' (mole fraction)'] = self.fractions[:, j]
+        return df
+
+
+def design_points(ranges, design='grid', n=5, seed=None):
+    """
+    Design of experiments in the impurity mole fractions
+
+    Parameters
+    ----------
+    ranges : sequence of tuple
+        (lower, upper) mole fraction per impurity
+    design : str
+        'grid' for a full factorial design with n levels per impurity or
+        'lhs' for a Latin hypercube of n samples
+    n : int
+        Number of levels or samples
+    seed : int, optional
+        Random seed of the Latin hypercube
+
+    Return
+    ----------
+    retval : ndarray
+        Mole fractions of shape (n_cases, n_impurities)
+    """
+    lower = np.array([r[0] for r in ranges], dtype=float)
+    upper = np.array([r[1] for r in ranges], dtype=float)
+    if design == 'grid':
+        levels = [np.linspace(lo, hi, n) for lo, hi in zip(lower, upper)]
+        return np.array(list(itertools.product(*levels)), dtype=float).reshape(-1, len(ranges))
+    elif design == 'lhs':
+        rng = np.random.default_rng(seed)
+        k = len(ranges)
+        strata = np.array([rng.permutation(n) for _ in range(k)]).T
+        u = (strata + rng.random((n, k))) / n
+        return lower + u * (upper - lower)
+    raise ValueError("Unknown design: " + str(design))
+
+
+def mix_fluid(base, impurities, fractions):
+    """
+    Fluid string of the base fluid with impurities added at the given mole
+    fractions, the base composition scaled by one minus their sum, e.g.
+    mix_fluid('CO2', ['N2'], [0.05]) gives 'CO2[0.95]&N2[0.05]'
+    """
+    base = Composition.parse(base)
+    scale = 1 - sum(fractions)
+    components = list(base.components) + list(impurities)
+    amounts = [f * scale for f in base.fractions] + list(fractions)
+    return Composition(components, amounts).fluid
+
+
+def neighbour_order(points):
+    """
+    Order of the design points such that consecutive cases are close in
+    composition, a greedy nearest neighbour chain starting from the
+    lowest impurity content. Distances are scaled by the range of each
+    impurity.
+    """
+    span = np.ptp(points, axis=0)
+    scaled = points / np.where(span > 0, span, 1)
+    remaining = list(range(len(points)))
+    current = int(np.argmin(scaled.sum(axis=1)))
+    order = [current]
+    remaining.remove(current)
+    while remaining:
+        dist = np.sum((scaled[remaining] - scaled[current])**2, axis=1)
+        current = remaining.pop(int(np.argmin(dist)))
+        order.append(current)
+    return order
+
+
+def run_chunk(task):
+    """
+    Run a chain of neighbouring cases in one process. In plateau only
+    mode the plateau pressure of the previous case is the starting
+    estimate of the next (WaveSpeed.find_plateau()).
+
+    Parameters
+    ----------
+    task : tuple
+        List of WaveSpeed inputs and the curves flag
+
+    Return
+    ----------
+    retval : list of dict
+        'results' (full curves only), 'plateau' and 'error' per case
+    """
+    inputs, curves = task
+    cases = []
+    P_guess = None
+    for input in inputs:
+        try:
+            ws = WaveSpeed(input)
+            if curves:
+                ws.run()
+                results = ws.get_results()
+                plateau = ws.get_plateau()
+            else:
+                results = None
+                plateau = ws.find_plateau(P_guess=P_guess)
+        except Exception as err:
+            cases.append({'results': None, 'plateau': (np.nan, np.nan), 'error': repr(err)})
+            continue
+        if not np.isnan(plateau[0]):
+            P_guess = plateau[0]
+        cases.append({'results': results, 'plateau': plateau, 'error': None})
+    return cases
+
+
+def composition_sweep(base, impurities, P0, T0, eos='REFPROP', design='grid', n=5, seed=None,
+                      curves=False, options=None, pressure_grid=None, workers=1, chunk=None):
+    """
+    Plateau pressure and decompression curves over a range of impurity
+    contents, e.g. 0-5 % N2 and H2 in CO2. The impurities replace the
+    base fluid, i.e. the base composition is scaled by one minus the total
+    impurity fraction.
+
+    The cases are ordered such that neighbouring compositions follow each
+    other and split in contiguous chains, one per task in the process
+    pool. Within a chain the backend is reused (see engine.acquire_state())
+    and the plateau search starts from the neighbour's plateau.
+
+    Parameters
+    ----------
+    base : str
+        Base fluid string, e.g. 'CO2'
+    impurities : dict
+        Impurity name and (lower, upper) mole fraction range
+    P0 : float
+        Initial pressure (Pa)
+    T0 : float
+        Initial temperature (K)
+    eos : str
+        'HEOS' or 'REFPROP'
+    design : str
+        'grid' or 'lhs', see design_points()
+    n : int
+        Levels per impurity (grid) or number of samples (lhs)
+    seed : int, optional
+        Random seed of the Latin hypercube
+    curves : bool
+        If True the full curves are calculated and resampled on the
+        pressure grid, otherwise only the plateau (find_plateau())
+    options : dict, optional
+        Additional WaveSpeed input applied to all cases
+    pressure_grid : array_like, optional
+        Shared pressure grid (Pa), see batch.run_batch()
+    workers : int
+        Number of worker processes, see parallel.run_many()
+    chunk : int, optional
+        Number of cases per chain, default an even split over four
+        chains per worker
+
+    Return
+    ----------
+    retval : SweepResult
+    """
+    names = list(impurities)
+    fractions = design_points([impurities[name] for name in names], design, n, seed)
+    fluids = [mix_fluid(base, names, x) for x in fractions]
+
+    n_cases = len(fluids)
+    if pressure_grid is None:
+        pressure_grid = np.linspace(1e5, P0, 200)
+    result = SweepResult(np.full(n_cases, float(P0)), np.full(n_cases, float(T0)), fluids,
+                         np.asarray(pressure_grid, dtype=float), names, fractions,
+                         (n,) * len(names) if design == 'grid' else None)
+
+    order = neighbour_order(fractions)
+    if chunk is None:
+        chunk = max(1, -(-n_cases // (4 * (workers or os.cpu_count() or 1))))
+    tasks = []
+    for start in range(0, n_cases, chunk):
+        inputs = []
+        for i in order[start:start + chunk]:
+            input = {}
+            if options:
+                input.update(options)
+            input['pressure'] = float(P0)
+            input['temperature'] = float(T0)
+            input['eos'] = eos
+            input['fluid'] = fluids[i]
+            inputs.append(input)
+        tasks.append((inputs, curves))
+
+    cases = itertools.chain.from_iterable(run_many(tasks, workers=workers, func=run_chunk))
+    for i, case in zip(order, cases):
+        if case['error']:
+            result.error[i] = case['error']
+            continue
+        if case['results'] is not None:
+            result.store(i, case['results'])
+        result.plateau_pressure[i], result.plateau_wave_speed[i] = case['plateau']
+    return result
@@ -0,0 +1,297 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+import os
+import math
+import hashlib
+import numpy as np
+import CoolProp
+from ramdecom.composition import Composition
+from ramdecom.engine import StateEngine, CoolPropEngine
+
+# Increase when the file layout or the tabulated properties change
+TABLE_VERSION = 2
+
+# Tabulated properties, in the order of the last axis of PropertyTable.data
+PROPERTIES = ('T', 'rhomass', 'hmass', 'Q', 'speed_sound')
+
+_loaded_tables = {}
+_fingerprints = {}
+
+
+class TableError(Exception):
+    """Raised for property tables not matching the requested fluid or version"""
+    pass
+
+
+class PropertyTable:
+    """
+    Isentrope property table on a uniform (P, Smass) grid holding
+    temperature, density, enthalpy, vapour quality and the equilibrium 
+    speed of sound. Properties are interpolated bilinearly within cells
+    lying entirely in the single phase or entirely in the two-phase region.
+    Cells crossing the phase boundary, where the properties have kinks 
+    and the speed of sound is discontinuous, are treated as outside the 
+    table, as are cells touching grid nodes where the backend failed (NaN).
+    """
+
+    def __init__(self, eos, comp, molefracs, P, S, data, coolprop_version=None, refprop_option=None):
+        """
+        Parameters
+        ----------
+        eos : str
+            Backend used to build the table
+        comp : str
+            Component names separated by '&'
+        molefracs : sequence
+            Mole fractions of the components
+        P : ndarray
+            Uniform pressure grid (Pa)
+        S : ndarray
+            Uniform mass entropy grid (J/kg/K)
+        data : ndarray
+            Properties of shape (len(P), len(S), len(PROPERTIES))
+        coolprop_version : str, optional
+            CoolProp version used to build the table
+        refprop_option : str, optional
+            REFPROP mixture model used to build the table, 'GERG' or 'PR'.
+            Ignored for other backends.
+        """
+        self.eos = eos
+        self.comp = comp
+        self.molefracs = np.asarray(molefracs, dtype=float)
+        self.P = P
+        self.S = S
+        self.data = data
+        self.coolprop_version = coolprop_version
+        self.refprop_option = refprop_option if eos == 'REFPROP' else None
+        self.dP = P[1] - P[0]
+        self.dS = S[1] - S[0]
+
+    @classmethod
+    def build(cls, eos, comp, molefracs, P_min, P_max, T_min, T_max, nP=200, nS=100,
+              refprop_option=None):
+        """
+        Build a table covering the given pressure and temperature window.
+        The entropy range is taken from the corners of the window.
+
+        Parameters
+        ----------
+        eos : str
+            'HEOS' or 'REFPROP'
+        comp : str
+            Component names separated by '&'
+        molefracs : sequence
+            Mole fractions of the components
+        P_min, P_max : float
+            Pressure range (Pa)
+        T_min, T_max : float
+            Temperature range (K)
+        nP, nS : int
+            Number of grid points in pressure and entropy
+        refprop_option : str, optional
+            'GERG' or 'PR', see wavespeed.configure_refprop()
+
+        Return
+        ----------
+        retval : PropertyTable
+        """
+        if eos == 'REFPROP':
+            from ramdecom.wavespeed import configure_refprop
+            configure_refprop(refprop_option)
+        engine = CoolPropEngine(eos, comp, molefracs, refprop_option)
+        engine.update_PT(P_max, T_min)
+        S_min = engine.smass()
+        engine.update_PT(P_min, T_max)
+        S_max = engine.smass()
+
+        P = np.linspace(P_min, P_max, nP)
+        S = np.linspace(S_min, S_max, nS)
+        data = np.full((nP, nS, len(PROPERTIES)), np.nan)
+        for i in range(nP):
+            for j in range(nS):
+                try:
+                    engine.update_PS(P[i], S[j])
+                    data[i, j] = (engine.T(), engine.rhomass(), engine.hmass(),
+                                  engine.Q(), engine.speed_sound())
+                except ValueError:
+                    pass
+
+        return cls(eos, comp, molefracs, P, S, data, CoolProp.__version__, refprop_option)
+
+    def save(self, filename):
+        """
+        Save table to a NumPy .npz file
+        """
+        np.savez_compressed(filename, version=TABLE_VERSION, eos=self.eos, comp=self.comp,
+                            molefracs=self.molefracs, P=self.P, S=self.S, data=self.data,
+                            properties=np.array(PROPERTIES), coolprop_version=self.coolprop_version or '',
+                            refprop_option=self.refprop_option or '')
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a table saved with save(). Tables of another format version,
+        or built with another CoolProp version than the installed one,
+        are rejected.
+        """
+        with np.load(filename) as f:
+            if int(f['version']) != TABLE_VERSION or tuple(f['properties']) != PROPERTIES:
+                raise TableError("Property table version mismatch: " + str(filename))
+            coolprop_version = str(f['coolprop_version'])
+            if coolprop_version != CoolProp.__version__:
+                raise TableError("Property table built with CoolProp " + (coolprop_version or 'unknown')
+                                 + ", installed is " + CoolProp.__version__ + ": " + str(filename))
+            return cls(str(f['eos']), str(f['comp']), f['molefracs'], f['P'], f['S'],
+                       f['data'], coolprop_version, str(f['refprop_option']) or None)
+
+    def matches(self, eos, comp, molefracs, refprop_option=None):
+        """
+        True if the table was built for the given backend, REFPROP option
+        and fluid, in any component order
+        """
+        if eos != 'REFPROP':
+            refprop_option = None
+        mine = Composition(self.comp.split('&'), self.molefracs)
+        other = Composition(comp.split('&'), molefracs)
+        return (eos == self.eos and refprop_option == self.refprop_option
+                and other.components == mine.components
+                and np.allclose(other.fractions, mine.fractions, rtol=0, atol=1e-10))
+
+    def lookup(self, P, Smass):
+        """
+        Interpolated properties at P, Smass
+
+        Return
+        ----------
+        retval : ndarray or None
+            Properties in the order of PROPERTIES, None if the point is
+            outside the table
+        """
+        x = (P - self.P[0]) / self.dP
+        y = (Smass - self.S[0]) / self.dS
+        if not (0 <= x <= len(self.P) - 1 and 0 <= y <= len(self.S) - 1):
+            return None
+        i = min(int(x), len(self.P) - 2)
+        j = min(int(y), len(self.S) - 2)
+        fx = x - i
+        fy = y - j
+        cell = self.data[i:i+2, j:j+2]
+        two_phase = (cell[:, :, 3] >= 0) & (cell[:, :, 3] <= 1)
+        if two_phase.any() and not two_phase.all():
+            return None
+        values = ((1 - fx) * ((1 - fy) * cell[0, 0] + fy * cell[0, 1])
+                  + fx * ((1 - fy) * cell[1, 0] + fy * cell[1, 1]))
+        if math.isnan(values.sum()):
+            return None
+        return values
+
+
+def file_key(filename):
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+def load_table(filename):
+    """
+    Load a property table, keeping it in memory for later calls with the
+    same file. A file changed since it was loaded is loaded again.
+    """
+    key = file_key(filename)
+    if key not in _loaded_tables:
+        _loaded_tables[key] = PropertyTable.load(filename)
+    return _loaded_tables[key]
+
+
+def table_fingerprint(filename):
+    """
+    Content hash of a property table file, None if it cannot be read.
+    The hash is computed again when the file changes.
+    """
+    try:
+        key = file_key(filename)
+        if key not in _fingerprints:
+            digest = hashlib.sha256()
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            _fingerprints[key] = digest.hexdigest()
+    except OSError:
+        return None
+    return _fingerprints[key]
+
+
+class TabularEngine(StateEngine):
+    """
+    State engine interpolating PS states from a PropertyTable. Other
+    updates, and PS states outside the table, are evaluated with the full
+    equation of state.
+    """
+
+    def __init__(self, table, fallback=None):
+        """
+        Parameters
+        ----------
+        table : PropertyTable
+            Table to interpolate from
+        fallback : StateEngine, optional
+            Engine for states outside the table. Default is a
+            CoolPropEngine for the fluid of the table.
+        """
+        self.table = table
+        if fallback is None:
+            fallback = CoolPropEngine(table.eos, table.comp, table.molefracs, table.refprop_option)
+        self.fallback = fallback
+        self.state = getattr(fallback, 'state', None)
+        self.values = None
+        self.P = None
+
+    def set_mole_fractions(self, molefracs):
+        if not self.table.matches(self.table.eos, self.table.comp, molefracs, self.table.refprop_option):
+            raise TableError("Mole fractions do not match property table")
+
+    def update_PT(self, P, T):
+        self.values = None
+        self.fallback.update_PT(P, T)
+
+    def update_PS(self, P, Smass):
+        self.values = self.table.lookup(P, Smass)
+        if self.values is None:
+            self.fallback.update_PS(P, Smass)
+        else:
+            self.P = P
+            self.Smass = Smass
+
+    def p(self):
+        if self.values is None:
+            return self.fallback.p()
+        return self.P
+
+    def T(self):
+        if self.values is None:
+            return self.fallback.T()
+        return self.values[0]
+
+    def rhomass(self):
+        if self.values is None:
+            return self.fallback.rhomass()
+        return self.values[1]
+
+    def hmass(self):
+        if self.values is None:
+            return self.fallback.hmass()
+        return self.values[2]
+
+    def smass(self):
+        if self.values is None:
+            return self.fallback.smass()
+        return self.Smass
+
+    def Q(self):
+        if self.values is None:
+            return self.fallback.Q()
+        return self.values[3]
+
+    def speed_sound(self):
+        if self.values is None:
+            return self.fallback.speed_sound()
+        return self.values[4]
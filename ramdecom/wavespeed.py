@@ -1,12 +1,85 @@
 # RAMDECOM Copyright (c) 2022 Anders Andreasen
 
 import math
+import time
 import numpy as np
-import pandas as pd
-from matplotlib import pyplot as plt
-from cerberus import Validator
-from CoolProp.CoolProp import PropsSI
 import CoolProp.CoolProp as CP
+from ramdecom.engine import CoolPropEngine
+from ramdecom.composition import Composition
+from ramdecom.table import TabularEngine, TableError, load_table
+from ramdecom.result import DecompressionResult, Step
+from ramdecom.instrument import RunStats, InstrumentedEngine
+
+
+# Cerberus schema of the WaveSpeed input
+INPUT_SCHEMA = {
+    'temperature': {
+        'required': True,
+        'type': 'number',
+        },
+    'pressure': {
+        'required': True,
+        'type': 'number',
+    },                
+    'extrapolate': {
+        'required': False,
+        'type': 'boolean',
+    },
+    'pressure_step': {
+        'required': False,
+        'type': 'number',
+    },
+    'pressure_break': {
+        'required': False,
+        'type': 'number',
+    },
+    'eos': {
+        'required': True,
+        'type': 'string',
+        'allowed': ['HEOS', 'REFPROP']
+    },
+    'fluid': {
+        'required': True,
+        'type': 'string',
+    },
+    'refprop_option': {
+        'required': False,
+        'type': 'string',
+        'allowed': ['GERG', 'PR']
+    },
+    'adaptive_step': {
+        'required': False,
+        'type': 'boolean',
+    },
+    'velocity_tolerance': {
+        'required': False,
+        'type': 'number',
+        'min': 0,
+    },
+    'pressure_step_min': {
+        'required': False,
+        'type': 'number',
+        'min': 1,
+    },
+    'pressure_step_max': {
+        'required': False,
+        'type': 'number',
+        'min': 1,
+    },
+    'property_table': {
+        'required': False,
+        'type': 'string',
+    },
+    'sound_speed': {
+        'required': False,
+        'type': 'string',
+        'allowed': ['finite_difference', 'analytic']
+    },
+    'warm_start': {
+        'required': False,
+        'type': 'boolean',
+    },
+}
 
 
 def validate_mandatory_ruleset(input):
@@ -24,44 +97,10 @@ def validate_mandatory_ruleset(input):
         True for success, False for failure
     """
 
-    schema_general = {
-        'temperature': {
-            'required': True,
-            'type': 'number',
-            },
-        'pressure': {
-            'required': True,
-            'type': 'number',
-        },                
-        'extrapolate': {
-            'required': False,
-            'type': 'boolean',
-        },
-        'pressure_step': {
-            'required': False,
-            'type': 'number',
-        },
-        'pressure_break': {
-            'required': False,
-            'type': 'number',
-        },
-        'eos': {
-            'required': True,
-            'type': 'string',
-            'allowed': ['HEOS', 'REFPROP']
-        },
-        'fluid': {
-            'required': True,
-            'type': 'string',
-        },
-        'refprop_option': {
-            'required': False,
-            'type': 'string',
-            'allowed': ['GERG', 'PR']
-        },
-    }
+    # Imported here to keep the numerical core light to import
+    from cerberus import Validator
 
-    v = Validator(schema_general)
+    v = Validator(INPUT_SCHEMA)
     retval = v.validate(input)
     if v.errors:
         print(v.errors)
@@ -69,6 +108,61 @@ def validate_mandatory_ruleset(input):
     return retval
 
 
+def configure_refprop(option):
+    """
+    Set the CoolProp global REFPROP configuration. Both flags are always 
+    set so that an option from a previous calculation in the same process 
+    does not carry over.
+
+    Parameters
+    ----------
+    option : str or None
+        'GERG', 'PR' or None for the default REFPROP mixture model
+    """
+    CP.set_config_bool(CP.REFPROP_USE_GERG, option == 'GERG')
+    CP.set_config_bool(CP.REFPROP_USE_PENGROBINSON, option == 'PR')
+
+
+def parse_fluid(fluid):
+    """
+    Split a fluid string, e.g. "CO2[0.9667]&O2[0.0333]", into components 
+    in canonical order and mole fractions normalised to unity, see 
+    ramdecom.composition.Composition.
+
+    Return
+    ----------
+    retval : tuple
+        Components separated by '&' and array of mole fractions
+    """
+    composition = Composition.parse(fluid)
+    return composition.comp, composition.molefracs
+
+
+def plateau_point(P, Q, W):
+    """
+    Locate the plateau of a decompression curve, i.e. the point where
+    the isentrope enters the two-phase region and the speed of sound 
+    drops. 
+
+    Parameters
+    ----------
+    P, Q, W : sequence
+        Pressure, vapour quality and decompression wave speed along the 
+        isentrope
+
+    Return
+    ----------
+    retval : tuple
+        Pressure (Pa) and decompression wave speed (m/s) at the first 
+        two-phase point of the isentrope. NaN if the isentrope does not 
+        enter the two-phase region.
+    """
+    for p, q, w in zip(P, Q, W):
+        if 0 < q < 1:
+            return p, w
+    return math.nan, math.nan
+
+
 class InputError(Exception):
     """Base class for exceptions in this module."""
     pass
@@ -79,14 +173,30 @@ class WaveSpeed:
     Main class to to hold problem definition, running problem, storing results, plotting etc.
     """
 
-    def __init__(self, input):
+    def __init__(self, input, engine=None, instrument=False, hook=None):
         """
         Parameters
         ----------
         input : dict
             Dict holding problem definition
+        engine : StateEngine, optional
+            Thermodynamic state engine used for the flash calculations. 
+            If not given a CoolPropEngine is constructed from the input.
+        instrument : bool
+            Record backend call counts, timings and failures in self.stats
+            (RunStats)
+        hook : callable, optional
+            Called with the RunStats object at the end of every run. 
+            Implies instrument=True.
         """
         self.input = input
+        self.engine = engine
+        self.custom_engine = engine is not None
+        self.hook = hook
+        if instrument or hook is not None:
+            self.stats = RunStats()
+        else:
+            self.stats = None
         self.del_P = 10
         self.single_component = True
         self.isrun = False
@@ -119,6 +229,39 @@ class WaveSpeed:
             self.extrapolate = self.input['extrapolate']
         else:
             self.extrapolate = False 
+        if 'adaptive_step' in self.input:
+            self.adaptive_step = self.input['adaptive_step']
+        else:
+            self.adaptive_step = False
+        if 'velocity_tolerance' in self.input:
+            self.U_tol = self.input['velocity_tolerance']
+        else:
+            self.U_tol = 0.5
+        # Defaults are limited by the other bound if only one is given
+        if 'pressure_step_min' in self.input:
+            self.P_step_min = self.input['pressure_step_min']
+        else:
+            self.P_step_min = min(self.P_step / 10, self.input.get('pressure_step_max', math.inf))
+        if 'pressure_step_max' in self.input:
+            self.P_step_max = self.input['pressure_step_max']
+        else:
+            self.P_step_max = max(self.P_step * 10, self.P_step_min)
+        if self.P_step_max < self.P_step_min:
+            raise InputError("pressure_step_max is smaller than pressure_step_min")
+        if 'property_table' in self.input:
+            self.property_table = self.input['property_table']
+        else:
+            self.property_table = None
+        if 'sound_speed' in self.input:
+            self.sound_speed = self.input['sound_speed']
+        elif self.property_table:
+            self.sound_speed = 'analytic'
+        else:
+            self.sound_speed = 'finite_difference'
+        if 'warm_start' in self.input:
+            self.warm_start = self.input['warm_start']
+        else:
+            self.warm_start = False
         
         self.T0 = self.input['temperature']
         self.P0 = self.input['pressure']
@@ -127,53 +270,125 @@ class WaveSpeed:
         #self.fluid_string = self.eos + '::' + self.input['fluid']
         self.max_step = int(self.P0 / self.P_step)
 
-        if "&" in self.input["fluid"]:
-            comp_frac_pair = [str.replace("[", " ").replace("]", "").split(" ") for str in self.input["fluid"].split("&")]
-            comp = [pair[0] for pair in comp_frac_pair]
-            molefracs = np.asarray([float(pair[1]) for pair in comp_frac_pair])
-            molefracs = molefracs / sum(molefracs)
-            self.molefracs = molefracs
-            sep = "&"
-            self.comp = sep.join(comp)
-            self.single_component = False
-            
-            self.fluid = '&'.join([c + '[' + str(x) + ']'  for c,x in zip(self.comp.split('&'), self.molefracs)]) #self.input['fluid']
-            self.fluid_string = self.eos + '::' + self.fluid #self.input['fluid']
-        # Normally single component fluid is specified
-        else:
-            self.comp = self.input["fluid"]
-            self.molefracs = [1.0]
-            self.fluid = self.input['fluid']
-            self.fluid_string = self.eos + '::' + self.input['fluid']
+        try:
+            self.composition = Composition.parse(self.input['fluid'])
+        except ValueError as err:
+            raise InputError("Fluid error: " + str(err))
+        self.single_component = self.composition.is_pure
+        self.comp = self.composition.comp
+        self.molefracs = self.composition.molefracs
+        self.fluid = self.composition.fluid
+        self.fluid_string = self.composition.fluid_string(self.eos)
 
-        if self.eos == 'REFPROP' and 'refprop_option' in self.input:
-            if self.input['refprop_option'] == 'GERG':
-                CP.set_config_bool(CP.REFPROP_USE_GERG, True)
-            elif self.input['refprop_option'] == 'PR':
-                CP.set_config_bool(CP.REFPROP_USE_PENGROBINSON, True)
+        if self.eos == 'REFPROP':
+            if 'refprop_option' in self.input:
+                configure_refprop(self.input['refprop_option'])
+            else:
+                configure_refprop(None)
 
 
     def initialize(self):
         """
-        Setting inital entropy for the isentrope, and preparing lists 
-        for storing results. 
+        Setting up the state engine and inital entropy for the isentrope, 
+        and preallocating storage for the results. 
+        """
+        if self.engine is None and self.property_table:
+            try:
+                table = load_table(self.property_table)
+            except (OSError, TableError) as err:
+                raise InputError("Property table error: " + str(err))
+            if not table.matches(self.eos, self.comp, self.molefracs, self.input.get('refprop_option')):
+                raise InputError("Property table does not match eos, refprop_option and fluid")
+            self.engine = TabularEngine(table)
+        elif self.engine is None:
+            self.engine = CoolPropEngine(self.eos, self.comp, self.molefracs, self.input.get('refprop_option'))
+        else:
+            self.engine.set_mole_fractions(self.molefracs)
+        if self.stats is not None:
+            self.engine = InstrumentedEngine(self.engine, self.stats)
+            self.calc_state = self.stats.timed('flash', self.calc_state)
+            self.speed_of_sound = self.stats.timed('sound_speed', self.speed_of_sound)
+        self.asfluid = getattr(self.engine, 'state', None)
+        self.engine.update_PT(self.P0, self.T0)
+        self.S0 = self.engine.smass()
+        self.result = DecompressionResult(self.max_step + 1)
+        self.extrapolated = None
+        # Last converged state on the isentrope (P, T, rho, Q) seeding the
+        # next single-phase flash, see flash()
+        self.guess = None
+
+    @property
+    def P(self):
+        return self.result['P']
+
+    @property
+    def T(self):
+        return self.result['T']
+
+    @property
+    def S_mass(self):
+        return self.result['S_mass']
+
+    @property
+    def H_mass(self):
+        return self.result['H_mass']
+
+    @property
+    def rho_mass(self):
+        return self.result['rho_mass']
+
+    @property
+    def Q(self):
+        return self.result['Q']
+
+    @property
+    def C(self):
+        return self.result['C']
+
+    @property
+    def U(self):
+        return self.result['U']
+
+    @property
+    def W(self):
+        return self.result['W']
+
+
+    def speed_of_sound(self, Smass, P1, rho1=None):
+        """
+        Calculation of the fluid speed of sound at the isentrope according
+        to the selected sound speed mode. With 'analytic' the engine speed 
+        of sound is used (homogeneous equilibrium value in the two-phase 
+        region). If the backend cannot provide it, or with 
+        'finite_difference', the finite difference approximation is used. 
+
+        Parameters
+        ----------
+        Smass: float
+            Mass specific entropy of the fluid 
+        P1: float
+            The pressure at the isentrope at which the speed of sound 
+            shall be calculated
+        rho1: float, optional
+            Density at P1 if already known. The engine is then assumed to 
+            hold the state at P1, Smass.
+            
+        Return
+        ----------
+        retval : float 
+            Speed of sound    
         """
-        self.S0 = PropsSI('Smass', 'P', self.P0, 'T', self.T0, self.fluid_string)
-        self.asfluid = CP.AbstractState(self.eos, self.comp)
-        self.asfluid.set_mole_fractions(self.molefracs)
-        self.asfluid.update(CP.PT_INPUTS, self.P0, self.T0)
-        self.T = []
-        self.P = []
-        self.S_mass = []
-        self.H_mass = []
-        self.rho_mass = []
-        self.Q = []
-        self.C = []
-        self.U = []
-        self.W = []        
+        if self.sound_speed == 'analytic':
+            if rho1 is None:
+                self.engine.update_PS(P1, Smass)
+            try:
+                return self.engine.speed_sound()
+            except (ValueError, NotImplementedError):
+                pass
 
+        return self.finite_difference_speed_of_sound(Smass, P1, rho1)
 
-    def speed_of_sound(self, Smass, P1):
+    def finite_difference_speed_of_sound(self, Smass, P1, rho1=None):
         """
         Generic calculation of the fluid speed of sound using 
         a finite difference approximation to the expression
@@ -193,6 +408,8 @@ class WaveSpeed:
         P1: float
             The pressure at the isentrope at which the speed of sound 
             shall be calculated
+        rho1: float, optional
+            Density at P1 if already known, saving one flash
             
         Return
         ----------
@@ -200,30 +417,151 @@ class WaveSpeed:
             Speed of sound    
         """
         
-        rho1 = PropsSI('Dmass', 'S', Smass, 'P', P1, self.fluid_string)
+        if rho1 is None:
+            self.flash(P1, Smass)
+            rho1 = self.engine.rhomass()
         P2=P1+self.del_P
-        rho2 = PropsSI('Dmass', 'S', Smass, 'P', P2, self.fluid_string)
+        self.flash(P2, Smass)
+        rho2 = self.engine.rhomass()
         try:
             retval = math.sqrt((P2-P1)/(rho2-rho1))
-        except:
-            print("P:", P1, "T:", PropsSI('T', 'S', Smass, 'P', P1, self.fluid_string))
+        except Exception:
+            self.engine.update_PS(P1, Smass)
+            print("P:", P1, "T:", self.engine.T())
             raise 
 
         return retval
 
+    def get_plateau(self):
+        """
+        Pressure and decompression wave speed at the plateau, see 
+        plateau_point()
+        """
+        return plateau_point(self.P, self.Q, self.W)
+
+    def find_plateau(self, P_step=None, tol=None, nodes=8, P_guess=None):
+        """
+        Plateau pressure and wave speed without calculating the full
+        decompression curve. The isentrope is marched from P0 in coarse
+        steps until it enters the two-phase region and the crossing is
+        bisected to tol. The Bernoulli velocity at the plateau is
+        integrated over the single-phase part of the isentrope by
+        Gauss-Legendre quadrature.
+
+        Parameters
+        ----------
+        P_step : float, optional
+            Pressure step (Pa) of the bracketing march, default
+            10 * pressure_step
+        tol : float, optional
+            Pressure tolerance (Pa) of the crossing, default
+            pressure_step_min
+        nodes : int
+            Number of Gauss-Legendre nodes of the velocity integral
+        P_guess : float, optional
+            Estimate of the plateau pressure (Pa), e.g. from a similar
+            case. The crossing is bracketed from the estimate with steps
+            starting at pressure_step.
+
+        Return
+        ----------
+        retval : tuple
+            Pressure (Pa) and decompression wave speed (m/s) at the first
+            two-phase point of the isentrope, see plateau_point(). NaN if
+            the isentrope does not enter the two-phase region above
+            pressure_break.
+        """
+        if P_step is None:
+            P_step = 10 * self.P_step
+        if tol is None:
+            tol = self.P_step_min
+
+        def two_phase(P):
+            return 0 < self.calc_state(P)[2] < 1
+
+        P_hi = self.P0
+        step = P_step
+        if two_phase(P_hi):
+            P_lo = P_hi
+        else:
+            P_lo = None
+            if P_guess is not None and self.P_break < P_guess < self.P0:
+                step = self.P_step
+                if two_phase(P_guess):
+                    # March up from the estimate, P0 is single-phase
+                    P_lo = P_guess
+                    while True:
+                        P_hi = min(P_lo + step, self.P0)
+                        if not two_phase(P_hi):
+                            break
+                        P_lo = P_hi
+                        step = min(2 * step, P_step)
+                else:
+                    P_hi = P_guess
+
+            while P_lo is None:
+                P_next = max(P_hi - step, self.P_break)
+                if two_phase(P_next):
+                    P_lo = P_next
+                    break
+                if P_next <= self.P_break:
+                    return math.nan, math.nan
+                P_hi = P_next
+                step = min(2 * step, P_step)
+
+            while P_hi - P_lo > tol:
+                P_mid = 0.5 * (P_hi + P_lo)
+                if two_phase(P_mid):
+                    P_lo = P_mid
+                else:
+                    P_hi = P_mid
+
+        def integrand(P):
+            D_mass = self.calc_state(P)[3]
+            return 1 / (D_mass * self.speed_of_sound(self.S0, P, rho1=D_mass))
+
+        try:
+            U = 0.
+            if P_hi < self.P0:
+                x, w = np.polynomial.legendre.leggauss(nodes)
+                half = 0.5 * (self.P0 - P_hi)
+                U = half * sum(wi * integrand(half * (xi + 1) + P_hi) for xi, wi in zip(x, w))
+            if P_lo < P_hi:
+                f_hi = integrand(P_hi)
+            D_mass = self.calc_state(P_lo)[3]
+            C = self.speed_of_sound(self.S0, P_lo, rho1=D_mass)
+        except Exception as err:
+            self.record_failure('find_plateau', P_lo, err)
+            return math.nan, math.nan
+
+        if P_lo < P_hi:
+            U += 0.5 * (P_hi - P_lo) * (f_hi + 1 / (D_mass * C))
+
+        return P_lo, float(C - U)
+
+    def load_results(self, results):
+        """
+        Set the results from a dict of arrays as returned by get_results(),
+        e.g. from a cache, and mark the calculation as run.
+        """
+        self.result = DecompressionResult.from_dict(results)
+        self.extrapolated = None
+        self.isrun = True
+
+    def get_results(self):
+        """
+        Results as a dict of NumPy arrays (views of the result storage), 
+        e.g. for passing between processes or storing to disk. 
+        """
+        if self.isrun == True:
+            return self.result.to_dict()
+        else: 
+            return None
+
     def get_dataframe(self):
         if self.isrun == True:
-            data = {'Pressure (Pa)': self.P, 
-                    'Temperature (K)': self.T,
-                    'Speed of sound (m/s)': self.C,
-                    'Bernouilli velocity (m/s)': self.U,
-                    'Decompression wave speed (m/s)': self.W,
-                    'Fluid density (kg/m3)': self.rho_mass,
-                    'Fluid enthalpy (J/kg)': self.H_mass
-                    }
-            df=pd.DataFrame(data)
-            self.df = df
-            return df
+            self.df = self.result.to_dataframe()
+            return self.df
         else: 
             return None    
     
@@ -239,28 +577,30 @@ class WaveSpeed:
         Convenience function to provide easy plotting of the 
         isentropic path in the phase diagram / PT-envelope. 
         Checking is made if fluid is single component, then the saturation 
-        curve from triple to critical point is calculated, else for mixture 
-        the phase envelope is calculated. 
+        curve from triple to critical point is plotted, else for mixture 
+        the phase envelope. Both are taken from ramdecom.envelope, which 
+        calculates them once per fluid. 
         """
 
-        if self.single_component:
-            pc = self.asfluid.keyed_output(CP.iP_critical)
-            Tc = self.asfluid.keyed_output(CP.iT_critical)
-            Tt = self.asfluid.keyed_output(CP.iT_triple)
-            pt = self.asfluid.keyed_output(CP.iP_triple)
+        # Imported here as ramdecom.envelope depends on this module
+        from ramdecom.envelope import get_envelope, EnvelopeError
+        from matplotlib import pyplot as plt
 
-            Ts = np.linspace(Tt, Tc, 100)
-            ps = CP.PropsSI('P', 'T', Ts, 'Q', 0, self.fluid_string)
+        try:
+            envelope = get_envelope(self.eos, self.input['fluid'], self.input.get('refprop_option'))
+        except EnvelopeError as err:
+            print("Phase envelope not available:", err)
+            envelope = None
 
-            plt.plot(Ts, ps, color='dimgrey', label='Saturation line')
+        if self.single_component:
+            plt.plot(envelope.T, envelope.p, color='dimgrey', label='Saturation line')
             plt.plot(self.T, self.P,'k--', label='Isentropic path')
-            plt.plot(Tc, pc, 'ko', label='Critical point')
-            plt.plot(Tt, pt, linestyle='none', marker='o', color='black', fillstyle='none', label='Triple point')
+            plt.plot(envelope.Tc, envelope.pc, 'ko', label='Critical point')
+            plt.plot(envelope.Tt, envelope.pt, linestyle='none', marker='o', color='black', fillstyle='none', label='Triple point')
             plt.plot(self.T0, self.P0, linestyle='none', marker='o', color='k', fillstyle='right', label='Initial state')
         else:
-            self.asfluid.build_phase_envelope("")
-            PE = self.asfluid.get_phase_envelope_data()
-            plt.plot(PE.T, PE.p, 'k--', label='Phase envelope')
+            if envelope is not None:
+                plt.plot(envelope.T, envelope.p, 'k--', label='Phase envelope')
             plt.plot(self.T, self.P, 'k', label='Isentropic path')
             t_max = max(self.T0, 310) + 10.
             plt.xlim(t_min, t_max)
@@ -279,6 +619,8 @@ class WaveSpeed:
         Convenience function to provide easy plotting of the 
         pressure vs decompression wave speed. 
         """
+        from matplotlib import pyplot as plt
+
         plt.plot(self.W, self.P, 'k--', label="Calculated")
         if type(data) != type(None):
             plt.plot(data[:,0], data[:,1]*1e5, 'ko', label="Experimental")
@@ -292,59 +634,189 @@ class WaveSpeed:
             plt.show()
         plt.clf()
 
-    def run(self,disable_pbar=False):
+    def flash(self, P, Smass):
+        """
+        PS flash, seeded with the last converged state on the isentrope 
+        if warm_start is set and that state is single-phase (see 
+        StateEngine.update_PS_guess())
+        """
+        if self.warm_start and self.guess is not None and not 0 <= self.guess[3] <= 1:
+            self.engine.update_PS_guess(P, Smass, self.guess[1], self.guess[2])
+        else:
+            self.engine.update_PS(P, Smass)
+
+    def calc_state(self, P):
+        """
+        Single PS flash at the isentrope. All properties are read from 
+        the same engine state. With warm_start the flash is seeded with 
+        the previous state, falling back to an unseeded flash. If both 
+        fail, the pressure is approached from the previous state in 
+        sub-steps, each seeding the next, before the exception is raised.
+
+        Parameters
+        ----------
+        P: float
+            Pressure (Pa)
+
+        Return
+        ----------
+        retval : tuple
+            Temperature, mass enthalpy, vapour quality (clamped to [0, 1]) 
+            and mass density
+        """
+        try:
+            self.flash(P, self.S0)
+        except Exception:
+            if not self.warm_start or self.guess is None:
+                raise
+            P_last = self.guess[0]
+            for k in range(1, 4):
+                P_sub = P_last + (P - P_last) * k / 4
+                try:
+                    self.flash(P_sub, self.S0)
+                except Exception:
+                    break
+                self.guess = (P_sub, self.engine.T(), self.engine.rhomass(), self.engine.Q())
+            self.flash(P, self.S0)
+        T = self.engine.T()
+        H_mass = self.engine.hmass()
+        Q = self.engine.Q()
+        D_mass = self.engine.rhomass()
+        self.guess = (P, T, D_mass, Q)
+
+        if Q < 0:
+            Q = 0
+        elif Q > 1:
+            Q = 1
+
+        return T, H_mass, Q, D_mass
+
+    def record_failure(self, call, P, err):
+        """
+        Record a failed pressure step in the run statistics if instrumented
+        """
+        if self.stats is not None:
+            self.stats.record_failure(call, P, self.S0, err)
+
+    def store_step(self, P, T, Q, H_mass, D_mass, C, U, W):
+        self.result.append(P, T, self.S0, H_mass, D_mass, Q, C, U, W)
+
+    def run(self,disable_pbar=False, cache=None):
         """
         Main function to run through the isentropic path from initial P,T
         and stepping down in P along the isentrope. For each pressure step
         the speed of sound, the maximum velocity and resulting decompression 
         speed, W, is calculated until teh stopping criterium is met, which is either 
         P < 1e5 Pa or W < 0.
+
+        If a ResultCache is given, results for the same input are taken 
+        from the cache, and new results are stored in it. The cache is not
+        used with an engine passed to the constructor, as the cache key 
+        does not identify the engine. See iter_steps() 
+        for a generator yielding the points as they are calculated.
         """
-        for i in range(self.max_step):
-            if i == 0:
-                Tguess = self.T0
-            else:
-                Tguess = self.T[-1]
+        if cache is not None and not self.custom_engine:
+            results = cache.get(self.input)
+            if results is not None:
+                self.load_results(results)
+                return
+            self.run(disable_pbar)
+            cache.put(self.input, self.get_results())
+            return
 
-            P_new = self.P0-self.P_step*i
-            T_new = PropsSI('T', 'P', P_new, 'S', self.S0, self.fluid_string)
-            #S_mass = PropsSI('Smass', 'P', P_new, 'T', T_new, self.fluid_string)
-            H_mass = PropsSI('Hmass', 'P', P_new, 'S', self.S0, self.fluid_string)
-            Q = PropsSI('Q', 'P', P_new, 'S', self.S0, self.fluid_string)
-            
-            if Q < 0:
-                Q = 0
-            elif Q > 1:
-                Q = 1
+        for step in self.iter_steps():
+            pass
+        self.result.trim()
+
+    def iter_steps(self):
+        """
+        Generator running the isentropic path like run(), yielding every 
+        point as soon as it is calculated, e.g. for progressive plotting 
+        or for stopping early. Points are also stored in the result. If 
+        extrapolate is set, points are yielded one step late such that 
+        the extrapolated end point is yielded with W = 0. After the 
+        generator is closed early, the calculation can be continued with 
+        extend().
+
+        Yields
+        ----------
+        step : Step
+            Named tuple (P, T, rho_mass, H_mass, Q, C, U, W) 
+        """
+        if self.adaptive_step:
+            steps = self.run_adaptive()
+        else:
+            steps = self.run_fixed()
+        held = None
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    i = next(steps, None)
+                finally:
+                    if self.stats is not None:
+                        self.stats.wall_time += time.perf_counter() - t0
+                if i is None:
+                    break
+                self.isrun = True
+                if not self.extrapolate:
+                    yield self.get_step(i)
+                else:
+                    if held is not None:
+                        yield self.get_step(held)
+                    held = i
+            if held is not None:
+                yield self.get_step(held)
+        finally:
+            steps.close()
+            if self.stats is not None:
+                self.stats.runs += 1
+                if self.hook is not None:
+                    self.hook(self.stats)
+
+    def get_step(self, i):
+        """
+        Stored point i as a Step named tuple
+        """
+        return Step(*(float(self.result[name][i]) for name in Step._fields))
+
+    def run_fixed(self):
+        """
+        Isentropic path with fixed pressure steps of P_step, starting from 
+        P0 or continuing from the last stored point. Generator yielding 
+        the index of every stored point. 
+        """
+        if len(self.result) == 0:
+            P_start = self.P0
+            start = 0
+        else:
+            P_start = self.P[-1]
+            start = 1
+
+        for i in range(start, int(P_start / self.P_step)):
+            P_new = P_start-self.P_step*i
+            T_new, H_mass, Q, D_mass = self.calc_state(P_new)
 
-            D_mass = PropsSI('Dmass', 'P', P_new, 'S', self.S0, self.fluid_string)
-            
             try:
-                C = self.speed_of_sound(self.S0, P_new)
-            except:
+                C = self.speed_of_sound(self.S0, P_new, rho1=D_mass)
+            except Exception as err:
+                self.record_failure('speed_of_sound', P_new, err)
                 self.isrun = True
                 break
             
-            if i == 0:
+            if len(self.result) == 0:
                 U = (self.P0 - P_new) / (C * D_mass)
             else:
-                U = self.U[i-1] + (self.P[i-1] - P_new) / (C * D_mass)
+                U = self.U[-1] + (self.P[-1] - P_new) / (C * D_mass)
 
             W = C - U
 
             if W > 0 and P_new > self.P_break:
-                self.C.append(C)
-                self.P.append(P_new)    
-                self.T.append(T_new)
-                self.Q.append(Q)
-                self.H_mass.append(H_mass)
-                self.U.append(U)
-                self.W.append(W)
-                self.rho_mass.append(D_mass)
+                self.store_step(P_new, T_new, Q, H_mass, D_mass, C, U, W)
+                yield len(self.result) - 1
             else:
                 if self.extrapolate:
-                    self.W[-1] = 0
-                    self.U[-1] = self.C[-1]
+                    self.apply_extrapolation()
                     self.isrun = True
                     break
                 else:
@@ -352,8 +824,196 @@ class WaveSpeed:
                     break
             
             self.isrun = True
+
+    def run_adaptive(self):
+        """
+        Isentropic path with adaptive pressure steps. Starting from the 
+        pressure step P_step, a trial step is rejected and halved (down to 
+        P_step_min) if:
+
+        - the local error estimate of the Bernoulli velocity integral, 
+          taken as the difference between the rectangle and trapezoidal 
+          rule, 0.5 * dP * |1/(rho C)_new - 1/(rho C)_old|, exceeds the 
+          velocity tolerance 
+        - the step changes the quality by more than 0.1
+
+        Steps crossing a phase boundary (the W plateau), ending at W <= 0 
+        or failing in the backend are located by bisection down to 
+        P_step_min (at least 1 Pa). A failing speed of sound at P_step_min
+        ends the curve, a failing flash is raised. Accepted steps are grown by up to a factor of two 
+        according to the error estimate (up to P_step_max). The velocity is 
+        integrated with the trapezoidal rule. The same stopping criteria 
+        as for the fixed step march apply. Generator yielding the index of 
+        every stored point. 
+        """
+        if len(self.result) == 0:
+            T_old, H_mass, Q_old, D_mass = self.calc_state(self.P0)
+            C = self.speed_of_sound(self.S0, self.P0, rho1=D_mass)
+            self.store_step(self.P0, T_old, Q_old, H_mass, D_mass, C, 0.0, C)
+            yield 0
+        else:
+            C, D_mass, Q_old = self.C[-1], self.rho_mass[-1], self.Q[-1]
+        f_old = 1 / (C * D_mass)
+        step = self.P_step
+        # Highest pressure known to be beyond a phase boundary, the W = 0 
+        # end point or a backend failure. The remaining interval is bisected. 
+        P_bracket = None
+
+        while True:
+            if P_bracket is not None:
+                step = min(step, max((self.P[-1] - P_bracket) / 2, self.P_step_min))
+            P_new = self.P[-1] - step
+            if P_new <= self.P_break:
+                break
+
+            try:
+                T_new, H_mass, Q, D_mass = self.calc_state(P_new)
+            except Exception:
+                if step > self.P_step_min:
+                    P_bracket = P_new
+                    continue
+                raise
+            try:
+                C = self.speed_of_sound(self.S0, P_new, rho1=D_mass)
+            except Exception as err:
+                self.record_failure('speed_of_sound', P_new, err)
+                if step > self.P_step_min:
+                    P_bracket = P_new
+                    continue
+                break
+
+            f_new = 1 / (C * D_mass)
+            U = self.U[-1] + 0.5 * step * (f_old + f_new)
+            W = C - U
+            error = 0.5 * step * abs(f_new - f_old)
+            crossing = (0 < Q < 1) != (0 < Q_old < 1)
+
+            if step > self.P_step_min:
+                if crossing or W <= 0:
+                    P_bracket = P_new
+                    continue
+                if error > self.U_tol or abs(Q - Q_old) > 0.1:
+                    factor = 0.5
+                    if error > self.U_tol:
+                        factor = max(0.9 * math.sqrt(self.U_tol / error), 0.25)
+                    step = max(step * factor, self.P_step_min)
+                    continue
+
+            if W <= 0:
+                break
+
+            self.store_step(P_new, T_new, Q, H_mass, D_mass, C, U, W)
+            yield len(self.result) - 1
+            f_old = f_new
+            Q_old = Q
+            if crossing:
+                P_bracket = None
+            elif P_bracket is None:
+                factor = 0.9 * math.sqrt(self.U_tol / error) if error > 0 else 2
+                step = min(step * min(max(factor, 1), 2), self.P_step_max)
+
+        if self.extrapolate:
+            self.apply_extrapolation()
+        self.isrun = True
+
+    def apply_extrapolation(self):
+        """
+        Set the last point to W = 0, keeping the calculated U and W such
+        that the curve can be continued
+        """
+        self.extrapolated = (self.U[-1], self.W[-1])
+        self.W[-1] = 0
+        self.U[-1] = self.C[-1]
+        self.result.invalidate()
+
+    def undo_extrapolation(self):
+        if self.extrapolated is not None:
+            self.U[-1], self.W[-1] = self.extrapolated
+            self.extrapolated = None
+            self.result.invalidate()
+
+    def extend(self, pressure_break=None):
+        """
+        Continue a finished or interrupted run from the last stored point 
+        down to a lower pressure_break. The points already calculated are 
+        kept. 
+
+        Parameters
+        ----------
+        pressure_break : float, optional
+            New end pressure (Pa), default the current pressure_break
+        """
+        if pressure_break is not None:
+            self.P_break = pressure_break
+            self.input = dict(self.input, pressure_break=pressure_break)
+        self.undo_extrapolation()
+        for step in self.iter_steps():
+            pass
+        self.result.trim()
+
+    def refine(self, P_high, P_low, pressure_step):
+        """
+        Recalculate the curve between P_high and P_low with a smaller 
+        pressure step. Points outside the interval are kept, and the 
+        change of the Bernoulli velocity integral across the interval is 
+        added to U (and subtracted from W) of the points below it. 
+
+        Parameters
+        ----------
+        P_high, P_low : float
+            Pressure interval (Pa)
+        pressure_step : float
+            Pressure step (Pa) within the interval
+        """
+        if not self.isrun:
+            raise InputError("Calculation has not been run")
+        P = self.P
+        i0 = int(np.argmax(P <= P_high))
+        i1 = len(P) - 1 - int(np.argmax(P[::-1] >= P_low))
+        if not P[i0] <= P_high or not P[i1] >= P_low or i1 <= i0:
+            return
+
+        extrapolated = self.extrapolated is not None
+        if extrapolated and i1 == len(P) - 1:
+            U_end = self.extrapolated[0]
+        else:
+            U_end = self.U[i1]
+
+        def increment(dP, f_old, f_new):
+            if self.adaptive_step:
+                return 0.5 * dP * (f_old + f_new)
+            return dP * f_new
+
+        records = []
+        P_old = P[i0]
+        U = self.U[i0]
+        f_old = 1 / (self.C[i0] * self.rho_mass[i0])
+        n = math.ceil((P[i0] - P[i1]) / pressure_step * (1 - 1e-9))
+        for k in range(1, n):
+            P_new = P[i0] - pressure_step * k
+            T_new, H_mass, Q, D_mass = self.calc_state(P_new)
+            C = self.speed_of_sound(self.S0, P_new, rho1=D_mass)
+            f_new = 1 / (C * D_mass)
+            U += increment(P_old - P_new, f_old, f_new)
+            records.append((P_new, T_new, self.S0, H_mass, D_mass, Q, C, U, C - U))
+            P_old = P_new
+            f_old = f_new
+
+        U += increment(P_old - P[i1], f_old, 1 / (self.C[i1] * self.rho_mass[i1]))
+        delta = U - U_end
+        self.result.replace(i0 + 1, i1, records)
+        i1 = i0 + 1 + len(records)
+        self.U[i1:] += delta
+        self.W[i1:] -= delta
+        if extrapolated:
+            self.extrapolated = (self.extrapolated[0] + delta, self.extrapolated[1] - delta)
+            self.W[-1] = 0
+            self.U[-1] = self.C[-1]
+        self.result.invalidate()
             
 if __name__ == '__main__':
+    from matplotlib import pyplot as plt
+
     input = {}
     input['temperature'] = 273.15+32.
     input['pressure'] = 120.4e5
@@ -3,16 +3,15 @@
 # Published under an MIT license
 
 import streamlit as st
-import math
 import pandas as pd
 #from PIL import Image
 import base64
 import matplotlib.pyplot as plt 
-from CoolProp import CoolProp as CP
-import numpy as np
 
 try:
     import wavespeed
+    import btc as btc_module
+    import envelope as envelope_module
 except:
     import sys
     import os
@@ -20,6 +19,8 @@ except:
     ramdecom_path = os.path.join(os.path.abspath(os.getcwd()), "..", "ramdecom")
     sys.path.append(os.path.abspath(ramdecom_path))
     from ramdecom import wavespeed
+    from ramdecom import btc as btc_module
+    from ramdecom import envelope as envelope_module
 
 
 def get_table_download_link(df, filename):
@@ -68,28 +69,34 @@ def read_input():
     input['fluid'] = 'CO2'
     return input, btc_input
 
-def btc_calc(btc_input, P_max):
-    P_max = P_max/1e6
-    sigma_a = 2 * btc_input['sigma'] / (btc_input['Mt'] * math.pi) * math.acos(math.exp( (-12.5 * math.pi * btc_input['CVN'] * btc_input['E'] * 1000) / ( 24 * btc_input['sigma']**2 * math.sqrt(btc_input['r'] * btc_input['Dt']))))
-    P_a = sigma_a * btc_input['Dt']/btc_input['r']
-    Pd = []
-    Vf = []
-    Pd = np.linspace(P_a, P_max, int((P_max - P_a)/0.1))
-    Vf = np.zeros(len(Pd))
-    for i in range(len(Pd)):
-        Vf[i] = btc_input['C'] * btc_input['sigma'] / math.sqrt(btc_input['CV'])*(Pd[i] / P_a - 1) ** (1./6)
-    
-    return Pd, Vf
+@st.cache_data
+def calc_decompression(pressure, temperature, fluid, eos='HEOS', _progress=None):
+    """
+    Decompression curve, cached by initial state and fluid so that changes
+    to the pipe (BTC) input do not trigger a new calculation. The optional
+    progress bar is updated as the points are calculated.
+    """
+    input = {}
+    input['temperature'] = temperature
+    input['pressure'] = pressure
+    input['eos'] = eos
+    input['fluid'] = fluid
+    ws = wavespeed.WaveSpeed(input)
+    for step in ws.iter_steps():
+        if _progress is not None:
+            _progress.progress(min(max((pressure - step.P) / (pressure - ws.P_break), 0.), 1.))
+    ws.result.trim()
+    return ws.get_results(), ws.get_dataframe()
 
 
 if __name__ == "__main__":
     st.set_page_config(layout='wide')
 
     input, btc = read_input()
-    ws = wavespeed.WaveSpeed(input)
 
-    with st.spinner('Calculating, please wait....'):
-        ws.run()
+    progress = st.progress(0.)
+    res, df = calc_decompression(input['pressure'], input['temperature'], input['fluid'], input['eos'], _progress=progress)
+    progress.empty()
 
     st.title('Pure CO2 pipeline decompression wavespeed')
     st.subheader(r'https://github.com/andr1976/ramdecom')
@@ -97,19 +104,23 @@ if __name__ == "__main__":
 
     my_expander.write('Calculation of decompression wavespeed using the CoolProp library. Results to be used in combination with e.g. the Battelle two-curve method. See https://pubs.acs.org/doi/10.1021/acsomega.1c01360')
 
-    df = ws.get_dataframe()
     file_name = st.text_input('Filename for saving data:', 'saved_data') 
     
     st.markdown(get_table_download_link(df, file_name), unsafe_allow_html=True)
 
-    Pd, Vf = btc_calc(btc,input['pressure'])
+    Pd, Vf = btc_module.fracture_curve(btc, input['pressure'])
+    margin, P_tangent = btc_module.arrest_margin(btc, res['P'], res['W'])
+    if margin[0] > 0:
+        st.success('Running fracture is arrested (arrest pressure {:.1f} bar)'.format(Pd[0] / 1e5))
+    else:
+        st.error('Running fracture is not arrested (curves intersect at {:.1f} bar)'.format(P_tangent[0] / 1e5))
     
     col1, col2 = st.columns(2)
 
     fig, ax = plt.subplots()
 
-    ax.plot(ws.W, ws.P, 'k', label="Decompression speed")
-    ax.plot(Vf, Pd * 1e6, 'k--', label="Fracture speed")
+    ax.plot(res['W'], res['P'], 'k', label="Decompression speed")
+    ax.plot(Vf, Pd, 'k--', label="Fracture speed")
     ax.legend(loc='best')
     ax.set_xlabel("Decompression wave speed (m/s)")
     ax.set_ylabel("Pressure (Pa)")
@@ -117,19 +128,12 @@ if __name__ == "__main__":
     col1.pyplot(fig)
 
     fig1, ax1 = plt.subplots()
-    ax1.plot(ws.T,ws.P,'k',label='Decompression path')
-
-    pc = ws.asfluid.keyed_output(CP.iP_critical)
-    Tc = ws.asfluid.keyed_output(CP.iT_critical)
-    Tt = ws.asfluid.keyed_output(CP.iT_triple)
-    pt = ws.asfluid.keyed_output(CP.iP_triple)
-
-    Ts = np.linspace(Tt, Tc, 100)
-    ps = CP.PropsSI('P', 'T', Ts, 'Q', 0, 'CO2')
+    ax1.plot(res['T'], res['P'], 'k', label='Decompression path')
 
-    ax1.plot(Ts, ps, '--', color='dimgrey', label='Saturation line')
-    ax1.plot(Tc, pc, 'ko', label='Critical point')
-    ax1.plot(Tt, pt, linestyle='none', marker='o', color='black', fillstyle='none', label='Triple point')
+    sat = envelope_module.get_envelope(input['eos'], input['fluid'])
+    ax1.plot(sat.T, sat.p, '--', color='dimgrey', label='Saturation line')
+    ax1.plot(sat.Tc, sat.pc, 'ko', label='Critical point')
+    ax1.plot(sat.Tt, sat.pt, linestyle='none', marker='o', color='black', fillstyle='none', label='Triple point')
     ax1.set_xlabel("Temperature (K)")
     ax1.set_ylabel("Presseure (Pa)")
     ax1.legend(loc='best')
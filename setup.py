@@ -3,4 +3,7 @@ from setuptools import find_packages, setup
 setup(
     name='ramdecom',
     packages=find_packages(),
-)
\ No newline at end of file
+    entry_points={
+        'console_scripts': ['ramdecom=ramdecom.cli:main'],
+    },
+)
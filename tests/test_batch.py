@@ -0,0 +1,30 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import batch
+import numpy as np
+import pytest
+
+
+def test_run_batch():
+    P0 = [145.61e5, 122.2e5]
+    T0 = [273.15 + 35.09, 273.15 + 24.6]
+    grid = np.linspace(30e5, 150e5, 121)
+    res = batch.run_batch(P0, T0, pressure_grid=grid)
+    assert len(res) == 2
+    assert res.W.shape == (2, 121)
+    assert res.error == [None, None]
+    assert res.end_pressure[0] == pytest.approx(3961000.0, rel=1e-5)
+    assert res.plateau_pressure[0] == pytest.approx(5961000.0, rel=1e-5)
+    # Outside the calculated curve
+    assert np.isnan(res.W[0, -1])
+    assert np.isnan(res.W[1, 0])
+    i = np.searchsorted(grid, 100e5)
+    assert res.W[0, i] > res.W[0, i - 10]
+
+
+def test_run_batch_error():
+    res = batch.run_batch(100e5, [300., 5000.])
+    assert res.error[0] is None
+    assert res.error[1] is not None
+    assert np.isnan(res.plateau_pressure[1])
+    assert np.all(np.isnan(res.W[1]))
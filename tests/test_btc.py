@@ -0,0 +1,54 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import btc
+import numpy as np
+import pytest
+
+pipe = {'sigma': 519, 'Dt': 12, 'E': 210, 'CVN': 70, 'Mt': 3.33, 'r': 305, 'CV': 0.96, 'C': 0.379}
+
+# Simplified decompression curve with a plateau at 50 bar
+P = np.array([150e5, 100e5, 60e5, 50.1e5, 50e5, 30e5])
+W = np.array([400., 300., 220., 200., 20., 5.])
+
+
+def test_fracture_curve():
+    Pd, Vf = btc.fracture_curve(pipe, 150e5)
+    assert Pd[0] == pytest.approx(btc.arrest_pressure(pipe)[0])
+    assert Pd[0] == pytest.approx(5231883.598758864, rel=1e-8)
+    assert Vf[0] == 0
+    assert Vf[-1] == pytest.approx(0.379 * 519 / np.sqrt(0.96) * (150e5 / Pd[0] - 1) ** (1./6))
+
+
+def test_arrest_margin():
+    margin, P_tangent = btc.arrest_margin(pipe, P, W)
+    assert margin[0] > 0
+    assert btc.is_arrested(pipe, P, W)[0]
+    weak = dict(pipe)
+    weak['CVN'] = [70, 30]
+    margin, P_tangent = btc.arrest_margin(weak, P, W)
+    assert margin[1] < 0
+    assert P_tangent[1] == pytest.approx(50e5, rel=0.01)
+
+    # Independent of the spacing of the curve: inserting points on the
+    # linear interpolation does not change margin and tangency pressure
+    P_fine = np.linspace(150e5, 30e5, 1201)
+    W_fine = np.interp(P_fine, P[::-1], W[::-1])
+    fine, P_fine_tangent = btc.arrest_margin(weak, P_fine, W_fine)
+    assert fine == pytest.approx(btc.arrest_margin(weak, P, W)[0], abs=1e-3)
+    assert P_fine_tangent == pytest.approx(P_tangent, abs=10)
+    # Brute force minimum of W - Vf
+    Pd = np.linspace(btc.arrest_pressure(pipe)[0] + 1, 150e5, 200001)
+    brute = np.min(np.interp(Pd, P[::-1], W[::-1]) - btc.fracture_velocity(Pd, pipe)[0])
+    assert btc.arrest_margin(pipe, P, W)[0][0] == pytest.approx(brute, abs=1e-2)
+
+
+def test_minimum_for_arrest():
+    designs = dict(pipe)
+    designs['sigma'] = np.array([450., 519., 600.])
+    cvn = btc.minimum_for_arrest(designs, P, W, 'CVN', 5, 1000, tol=1e-3)
+    assert np.all(np.diff(cvn) < 0)
+    # At the minimum the arrest pressure equals the plateau pressure
+    P_a = btc.arrest_pressure(dict(designs, CVN=cvn))
+    assert np.allclose(P_a, 50e5, rtol=1e-3)
+    dt = btc.minimum_for_arrest(pipe, P, W, 'Dt', 1, 5)
+    assert np.isnan(dt[0])
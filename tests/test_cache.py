@@ -0,0 +1,103 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import cache
+from ramdecom import wavespeed
+from ramdecom import engine
+from ramdecom import table
+import os
+import pytest
+
+
+def make_input():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    return input
+
+
+def test_cache_key():
+    input = make_input()
+    input['eos'] = 'REFPROP'
+    input['fluid'] = 'CO2[0.9667]&O2[0.0333]'
+    key = cache.cache_key(input)
+    input['fluid'] = 'CO2[96.67]&O2[3.33]'
+    input['pressure_step'] = 1e5
+    assert cache.cache_key(input) == key
+    input['pressure_break'] = 45e5
+    assert cache.cache_key(input) != key
+    with pytest.raises(wavespeed.InputError):
+        cache.cache_key({'fluid': 'CO2'})
+
+
+def test_result_cache(tmp_path):
+    rc = cache.ResultCache(str(tmp_path))
+    input = make_input()
+    results = rc.run(input)
+    assert rc.misses == 1
+    cached = rc.run(input)
+    assert rc.hits == 1
+    assert list(cached['W']) == list(results['W'])
+
+    ws = wavespeed.WaveSpeed(input)
+    ws.run(cache=rc)
+    assert rc.hits == 2
+    assert ws.P[-1] == pytest.approx(3961000.0, rel=1e-5)
+    assert ws.T[-1] == pytest.approx(278.0666028440005, rel=1e-5)
+
+    disabled = cache.ResultCache(str(tmp_path), enabled=False)
+    assert disabled.get(input) is None
+
+
+def test_result_cache_eviction(tmp_path):
+    input = make_input()
+    rc = cache.ResultCache(str(tmp_path))
+    rc.run(input)
+    size = os.path.getsize(rc.path(cache.cache_key(input)))
+    rc.max_bytes = int(1.5 * size)
+    input['pressure_break'] = 50e5
+    rc.run(input)
+    assert len(os.listdir(str(tmp_path))) == 1
+    assert rc.get(input) is not None
+
+
+def test_result_cache_keys(tmp_path, monkeypatch):
+    rc = cache.ResultCache(str(tmp_path / 'cache'))
+    input = make_input()
+    input['pressure_break'] = 100e5
+
+    # Results of a caller-supplied engine are not cached
+    comp, molefracs = wavespeed.parse_fluid('CO2')
+    rc.run(input, engine=engine.CoolPropEngine('HEOS', comp, molefracs))
+    ws = wavespeed.WaveSpeed(input, engine=engine.CoolPropEngine('HEOS', comp, molefracs))
+    ws.run(cache=rc)
+    assert rc.get(input) is None
+
+    # A corrupt entry is a miss
+    rc.run(input)
+    for content in (b'', b'not a zip file'):
+        with open(rc.path(cache.cache_key(input)), 'wb') as f:
+            f.write(content)
+        assert rc.get(input) is None
+
+    # A failed write leaves no temporary file
+    results = rc.run(make_input())
+
+    def disk_full(*args, **kwargs):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(cache.np, 'savez', disk_full)
+    with pytest.raises(OSError):
+        rc.put(input, results)
+    monkeypatch.undo()
+    assert [name for name in os.listdir(rc.directory) if name.endswith('.tmp')] == []
+
+    # Rewriting the property table changes the key
+    filename = str(tmp_path / 'co2.npz')
+    table.PropertyTable.build('HEOS', 'CO2', [1.0], 30e5, 150e5, 270, 320, nP=5, nS=5).save(filename)
+    input['property_table'] = filename
+    key = cache.cache_key(input)
+    assert key == cache.cache_key(input)
+    table.PropertyTable.build('HEOS', 'CO2', [1.0], 30e5, 150e5, 270, 320, nP=6, nS=5).save(filename)
+    assert cache.cache_key(input) != key
+    assert table.load_table(filename).data.shape[0] == 6
@@ -0,0 +1,85 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import cli
+import pytest
+import os
+
+CASES = """Exp No.;P (bar);T (C);Source;Fluid;pressure_break
+a;145.61;35.09;test;CO2;100e5
+b;120;30;test;Nonsense;
+c;100;20;test;CO2;80e5
+"""
+
+
+def write_cases(tmp_path):
+    filename = os.path.join(tmp_path, 'cases.csv')
+    with open(filename, 'w') as f:
+        f.write(CASES)
+    return filename
+
+
+def test_read_cases(tmp_path):
+    cases = cli.read_cases(write_cases(tmp_path), options={'sound_speed': 'analytic'})
+    assert [name for name, input in cases] == ['a', 'b', 'c']
+    name, input = cases[0]
+    assert input['pressure'] == pytest.approx(145.61e5)
+    assert input['temperature'] == pytest.approx(308.24)
+    assert input['eos'] == 'HEOS'
+    assert input['pressure_break'] == 100e5
+    assert input['sound_speed'] == 'analytic'
+    assert 'pressure_break' not in cases[1][1]
+    assert 'Source' not in input
+
+
+def test_run_and_resume(tmp_path):
+    cases = cli.read_cases(write_cases(tmp_path))
+    directory = os.path.join(tmp_path, 'out')
+
+    def interrupt(done, total, failed):
+        if done == 1:
+            raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        cli.run_cases(cases, directory, progress=interrupt)
+    assert len(cli.Checkpoint(directory).load()) == 1
+
+    calls = []
+    records = cli.run_cases(cases, directory, progress=lambda *args: calls.append(args))
+    # Resumed after the first case, the failed case does not stop the batch
+    assert calls[0] == (1, 3, 0)
+    assert calls[-1] == (3, 3, 1)
+    assert records[0]['error'] is None
+    assert records[0]['end_pressure'] == pytest.approx(100e5, abs=1e5)
+    assert 'Nonsense' in records[1]['error']
+    assert records[2]['points'] > 0
+    checkpoint = cli.Checkpoint(directory)
+    curve = checkpoint.curve(records[2])
+    assert len(curve['P']) == records[2]['points']
+    assert checkpoint.curve(records[1]) is None
+    assert list(checkpoint.store.query(fluid='Nonsense')) == []
+
+    calls = []
+    cli.run_cases(cases, directory, progress=lambda *args: calls.append(args))
+    assert calls == [(3, 3, 1)]
+
+
+def test_interrupted_checkpoint(tmp_path):
+    checkpoint = cli.Checkpoint(str(tmp_path))
+    record = {'key': 'a', 'name': 'a', 'input': {}, 'error': None}
+    checkpoint.append(dict(record))
+    with open(checkpoint.path, 'a') as f:
+        f.write('{"key": "b", "na')
+    checkpoint.append(dict(record, key='c', name='c'))
+    assert sorted(checkpoint.load()) == ['a', 'c']
+
+
+def test_main(tmp_path):
+    filename = write_cases(tmp_path)
+    directory = os.path.join(tmp_path, 'out')
+    assert cli.main(['run', filename, '-o', directory, '-q', '--option', 'sound_speed=analytic']) == 1
+    with open(os.path.join(directory, cli.SUMMARY_FILE)) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 4
+    assert lines[1].startswith('a;')
+    assert lines[2].endswith("')")
+    with pytest.raises(SystemExit):
+        cli.main(['run', filename, '--option', 'unknown=1'])
@@ -0,0 +1,64 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom.composition import Composition
+from ramdecom import engine
+from ramdecom import wavespeed
+import pytest
+import threading
+
+
+def test_composition():
+    mix = Composition.parse('O2[3.33] & CO2[96.67]')
+    assert mix.components == ('CO2', 'O2')
+    assert mix.fractions == (0.9667, 0.0333)
+    assert mix.comp == 'CO2&O2'
+    assert mix == Composition.parse('CO2[0.9667]&O2[0.0333]')
+    assert mix.fluid_string('HEOS') == 'HEOS::CO2[0.9667]&O2[0.0333]'
+    assert len({mix, Composition(['O2', 'CO2'], [0.0333, 0.9667])}) == 1
+    pure = Composition.parse('CO2')
+    assert pure.is_pure and pure.fluid == 'CO2'
+    assert list(pure.molefracs) == [1.0]
+    for fluid in ['CO2[0.9]&O2', 'CO2[x]&O2[0.1]', 'CO2[-1]&O2[2]']:
+        with pytest.raises(ValueError):
+            Composition.parse(fluid)
+
+
+def test_state_pool():
+    engine.clear_states()
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    ws = wavespeed.WaveSpeed(input)
+    state = ws.engine.state
+    # A live instance does not share its backend
+    assert wavespeed.WaveSpeed(input).engine.state is not state
+    del ws
+    assert wavespeed.WaveSpeed(input).engine.state is state
+    input['fluid'] = 'CO2[1]&O2'
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)
+
+
+def test_state_pool_threads():
+    engine.clear_states()
+    errors = []
+
+    def borrow():
+        try:
+            for i in range(200):
+                key, state = engine.acquire_state('HEOS', 'CO2')
+                engine.release_state(key, state)
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=borrow) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # Every state is returned to the pool exactly once
+    states = engine._states[engine.state_key('HEOS', 'CO2')]
+    assert len(states) == len(set(map(id, states))) <= 8
@@ -0,0 +1,88 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import designmap
+from ramdecom import wavespeed
+import numpy as np
+import pytest
+
+
+def sharp(task):
+    # Smooth surface with a steep feature around (75 bar, 304 K)
+    P0, T0, base = task
+    r2 = ((P0 - 75e5) / 5e5)**2 + ((T0 - 304) / 2)**2
+    return 50e5 + 0.1 * (P0 - 100e5) + 10e5 * np.exp(-r2), 30 + 0.1 * (T0 - 300)
+
+
+def failing(task):
+    P0, T0, base = task
+    if T0 > 310:
+        return np.nan, np.nan
+    return sharp(task)
+
+
+def max_error(m, n=101):
+    P0, T0, values, errors = m.surface(n, n)
+    return np.max(np.abs(values - sharp((P0, T0, None))[0]))
+
+
+def test_adaptive_refinement():
+    m = designmap.design_map((60e5, 150e5), (280, 330), tol_P=0.5e5, n=4, max_depth=6, func=sharp)
+    # Dense sampling at the feature only
+    depths = [c.depth for c in m.cells]
+    assert max(depths) >= 3
+    assert min(depths) == 0
+    assert max_error(m) < 1e5
+    # Conservative error estimate
+    assert max_error(m) <= m.surface(51, 51)[3].max()
+    # Interpolation reproduces the samples
+    (P, T), value = next(iter(m.values.items()))
+    assert m(P, T) == pytest.approx(value[0])
+    assert m(P, T, 'plateau_wave_speed') == pytest.approx(value[1])
+
+    # A uniform grid needs more evaluations and is less accurate
+    uniform = designmap.design_map((60e5, 150e5), (280, 330), n=16, max_depth=0, func=sharp)
+    assert max_error(uniform) > max_error(m)
+    assert uniform.n_evaluations > 2 * m.n_evaluations
+
+
+def test_budget_and_failures():
+    m = designmap.design_map((60e5, 150e5), (280, 330), tol_P=1e3, n=2, max_depth=8,
+                             max_evaluations=200, func=failing)
+    assert m.n_evaluations <= 200
+    assert np.isnan(m(100e5, 320))
+    assert not np.isnan(m(100e5, 290))
+    assert np.isnan(m(200e5, 290))
+
+
+def test_plateau_case_failures(monkeypatch):
+    base = {'eos': 'HEOS', 'fluid': 'CO2'}
+
+    def backend_error(self):
+        raise ValueError('Flash failed')
+
+    monkeypatch.setattr(wavespeed.WaveSpeed, 'find_plateau', backend_error)
+    assert np.isnan(designmap.plateau_case((100e5, 300, base))).all()
+
+    def bug(self):
+        raise NameError('name is not defined')
+
+    # Programming errors are not mistaken for failed cases
+    monkeypatch.setattr(wavespeed.WaveSpeed, 'find_plateau', bug)
+    with pytest.raises(NameError):
+        designmap.plateau_case((100e5, 300, base))
+
+
+def test_plateau_map():
+    m = designmap.design_map((120e5, 150e5), (300, 310), tol_P=2e5, n=1, max_depth=1,
+                             options={'sound_speed': 'analytic'})
+    assert m.n_evaluations <= 25
+    input = {}
+    input['temperature'] = 305
+    input['pressure'] = 135e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['sound_speed'] = 'analytic'
+    P, W = wavespeed.WaveSpeed(input).find_plateau()
+    assert m(135e5, 305) == pytest.approx(P, abs=1e4)
+    assert m(135e5, 305, 'plateau_wave_speed') == pytest.approx(W, abs=0.5)
+    assert m.error(135e5, 305) < 2e5
@@ -0,0 +1,53 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import envelope
+import os
+import pytest
+
+
+def test_saturation_line(tmp_path):
+    envelope._envelopes.clear()
+    sat = envelope.get_envelope('HEOS', 'CO2', directory=str(tmp_path))
+    assert sat.Tc == pytest.approx(304.1282, rel=1e-5)
+    assert sat.pc == pytest.approx(7377298.37, rel=1e-5)
+    assert len(sat.T) == 100
+    assert not sat.contains(280., 50e5)
+    assert envelope.get_envelope('HEOS', 'CO2', directory=str(tmp_path)) is sat
+    assert len(os.listdir(str(tmp_path))) == 1
+
+    # Loaded from disk in a new session
+    envelope._envelopes.clear()
+    loaded = envelope.get_envelope('HEOS', 'CO2', directory=str(tmp_path))
+    assert loaded is not sat
+    assert list(loaded.p) == list(sat.p)
+
+
+def test_corrupt_envelope(tmp_path):
+    envelope._envelopes.clear()
+    sat = envelope.get_envelope('HEOS', 'CO2', directory=str(tmp_path))
+    path = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    for content in (b'', b'not a zip file'):
+        with open(path, 'wb') as f:
+            f.write(content)
+        envelope._envelopes.clear()
+        # Recalculated and stored again
+        assert list(envelope.get_envelope('HEOS', 'CO2', directory=str(tmp_path)).p) == list(sat.p)
+        assert os.path.getsize(path) > 100
+
+
+def test_mixture_envelope(tmp_path):
+    envelope._envelopes.clear()
+    env = envelope.get_envelope('HEOS', 'CO2[0.95]&N2[0.05]', directory=str(tmp_path))
+    assert env.mixture
+    assert list(env.contains([280., 280., 250.], [60e5, 200e5, 20e5])) == [True, False, True]
+    assert envelope.get_envelope('HEOS', 'N2[5]&CO2[95]', directory=str(tmp_path)) is env
+
+
+def test_envelope_failure(tmp_path):
+    envelope._envelopes.clear()
+    with pytest.raises(envelope.EnvelopeError):
+        envelope.get_envelope('HEOS', 'CO2[0.9]&H2[0.1]', directory=str(tmp_path))
+    envelope._envelopes.clear()
+    # The failure is stored and not recalculated
+    with pytest.raises(envelope.EnvelopeError):
+        envelope.get_envelope('HEOS', 'CO2[0.9]&H2[0.1]', directory=str(tmp_path))
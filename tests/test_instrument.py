@@ -0,0 +1,61 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import wavespeed
+from ramdecom import instrument
+from ramdecom.engine import StateEngine
+import pytest
+
+
+def get_input():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['pressure_break'] = 50e5
+    return input
+
+
+def test_instrumented_run():
+    calls = []
+    ws = wavespeed.WaveSpeed(get_input(), hook=calls.append)
+    ws.run()
+    stats = ws.stats
+    assert calls == [stats]
+    assert stats.runs == 1
+    # One PT flash and two PS flashes per step with finite differences,
+    # including the final step below pressure_break which is not stored
+    assert stats.calls['update_PT'] == 1
+    assert stats.calls['update_PS'] == 2 * (len(ws.P) + 1)
+    assert stats.flashes == sum(stats.region_calls.values())
+    assert stats.region_calls['two_phase'] > 0
+    assert stats.region_calls['single_phase'] > 0
+    assert stats.stage_calls['flash'] == len(ws.P) + 1
+    assert stats.wall_time > 0
+    assert stats.failures == []
+    assert stats.as_dict()['flashes'] == stats.flashes
+
+
+def test_uninstrumented_run():
+    ws = wavespeed.WaveSpeed(get_input())
+    assert ws.stats is None
+    assert not isinstance(ws.engine, instrument.InstrumentedEngine)
+
+
+class FailingEngine(StateEngine):
+    def update_PS(self, P, Smass):
+        raise ValueError('flash failed')
+
+
+def test_failure_recorded():
+    stats = instrument.RunStats()
+    engine = instrument.InstrumentedEngine(FailingEngine(), stats)
+    with pytest.raises(ValueError):
+        engine.update_PS(50e5, 1500.)
+    assert stats.calls['update_PS'] == 1
+    assert stats.failures == [{'call': 'update_PS', 'P': 50e5, 'S': 1500., 'error': "ValueError('flash failed')"}]
+    total = instrument.RunStats()
+    total.merge(stats)
+    total.merge(stats)
+    assert total.calls['update_PS'] == 2
+    assert len(total.failures) == 2
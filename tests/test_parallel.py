@@ -0,0 +1,43 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import parallel
+from ramdecom import wavespeed
+import CoolProp.CoolProp as CP
+import pytest
+
+
+def test_run_many():
+    inputs = []
+    for P, T in [(145.61e5, 273.15 + 35.09), (100e5, 5000.), (122.2e5, 273.15 + 24.6)]:
+        inputs.append({'pressure': P, 'temperature': T, 'eos': 'HEOS', 'fluid': 'CO2'})
+    cases = list(parallel.run_many(inputs, workers=2))
+    assert [case['input'] for case in cases] == inputs
+    assert cases[0]['results']['P'][-1] == pytest.approx(3961000.0, rel=1e-5)
+    assert cases[0]['results']['T'][-1] == pytest.approx(278.0666028440005, rel=1e-5)
+    assert cases[1]['results'] is None
+    assert cases[1]['error']
+    serial = parallel.run_case(inputs[2])
+    assert list(cases[2]['results']['W']) == list(serial['results']['W'])
+
+
+def test_run_many_unordered():
+    inputs = [{'pressure': 145.61e5, 'temperature': 273.15 + 35.09, 'eos': 'HEOS', 'fluid': 'CO2'}]
+    for P in [140e5, 130e5, 120e5]:
+        inputs.append({'pressure': P, 'temperature': 273.15 + 35.09, 'eos': 'HEOS', 'fluid': 'CO2',
+                       'pressure_break': P - 2e5, 'sound_speed': 'analytic'})
+    cases = list(parallel.run_many(inputs, workers=2, ordered=False))
+    assert sorted(i for i, case in cases) == [0, 1, 2, 3]
+    assert all(case['input'] == inputs[i] for i, case in cases)
+    # The slow first case does not hold back the others
+    assert cases[-1][0] == 0
+    assert list(parallel.run_many(inputs[1:2], workers=1, ordered=False))[0][0] == 0
+
+
+def test_configure_refprop():
+    wavespeed.configure_refprop('GERG')
+    assert CP.get_config_bool(CP.REFPROP_USE_GERG)
+    wavespeed.configure_refprop('PR')
+    assert not CP.get_config_bool(CP.REFPROP_USE_GERG)
+    assert CP.get_config_bool(CP.REFPROP_USE_PENGROBINSON)
+    wavespeed.configure_refprop(None)
+    assert not CP.get_config_bool(CP.REFPROP_USE_PENGROBINSON)
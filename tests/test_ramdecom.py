@@ -1,8 +1,11 @@
 # RAMDECOM Copyright (c) 2022 Anders Andreasen
 
 from ramdecom import wavespeed
+from ramdecom import engine
 import pytest
 import os
+import sys
+import subprocess
 
 def test_pure_run_coolprop():
     input = {}
@@ -117,3 +120,259 @@ def test_input_validation():
     except wavespeed.InputError as err:
         assert str(err) == 'Input file error'
     
+
+def test_pure_run_engine():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    eng = engine.CoolPropEngine('HEOS', 'CO2', [1.0])
+    ws = wavespeed.WaveSpeed(input, engine=eng)
+    ws.run()
+    assert ws.engine is eng
+    assert ws.asfluid is eng.state
+    assert ws.T[-1] == pytest.approx(278.0666028440005, rel=1e-5)
+    assert ws.P[-1] == pytest.approx(3961000.0, rel=1e-5)
+
+def test_pure_run_analytic_sound_speed():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    ws_fd = wavespeed.WaveSpeed(input)
+    ws_fd.run()
+    input['sound_speed'] = 'analytic'
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    assert ws.P[-1] == pytest.approx(3961000.0, rel=1e-5)
+    assert ws.C[0] == pytest.approx(ws_fd.C[0], rel=1e-4)
+    assert ws.C[-1] == pytest.approx(ws_fd.C[-1], rel=1e-3)
+    assert ws.W[-1] == pytest.approx(ws_fd.W[-1], abs=0.1)
+
+def test_pure_run_adaptive_step():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    ws_fixed = wavespeed.WaveSpeed(input)
+    ws_fixed.run()
+    input['adaptive_step'] = True
+    input['velocity_tolerance'] = 0.5
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    assert len(ws.P) < len(ws_fixed.P) / 3
+    assert ws.P[-1] == pytest.approx(ws_fixed.P[-1], abs=1.5e5)
+    # Plateau located within the fixed pressure step 
+    i = [0 < q < 1 for q in ws.Q].index(True)
+    i_fixed = [0 < q < 1 for q in ws_fixed.Q].index(True)
+    assert ws_fixed.P[i_fixed] <= ws.P[i] <= ws_fixed.P[i_fixed - 1]
+    assert ws.P[i - 1] - ws.P[i] <= ws.P_step_min * 1.0001
+
+class FailingEngine(engine.CoolPropEngine):
+    # PS flash failing in a pressure band of the single-phase region
+    def update_PS(self, P, Smass):
+        if 80e5 < P < 82e5:
+            raise ValueError('Flash failed')
+        super().update_PS(P, Smass)
+
+def test_adaptive_step_failures():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['adaptive_step'] = True
+    input['pressure_step_min'] = 0
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)
+    input['pressure_step_min'] = 1e4
+    input['pressure_step_max'] = 0
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)
+    input['pressure_step_max'] = 5e3
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)
+    # A single bound limits the default of the other
+    del input['pressure_step_min']
+    ws = wavespeed.WaveSpeed(input)
+    assert ws.P_step_min == ws.P_step_max == 5e3
+    del input['pressure_step_max']
+    input['pressure_step_min'] = 2e6
+    assert wavespeed.WaveSpeed(input).P_step_max == 2e6
+
+    del input['pressure_step_min']
+    comp, molefracs = wavespeed.parse_fluid('CO2')
+    ws = wavespeed.WaveSpeed(input, engine=FailingEngine('HEOS', comp, molefracs))
+    # The failing step is bisected down to pressure_step_min before failing
+    with pytest.raises(ValueError):
+        ws.run()
+    assert 82e5 <= ws.P[-1] <= 82e5 + 2 * ws.P_step_min
+
+def test_find_plateau():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    ws = wavespeed.WaveSpeed(input, instrument=True)
+    P, W = ws.find_plateau()
+    assert ws.stats.flashes < 50
+    # Reference from run() with pressure_step = 1e4 
+    assert P == pytest.approx(5981000.0, abs=2e4)
+    assert W == pytest.approx(34.24, abs=0.5)
+    input['pressure_break'] = 100e5
+    ws = wavespeed.WaveSpeed(input)
+    P, W = ws.find_plateau()
+    assert P != P and W != W
+
+def test_find_plateau_near_saturation():
+    import CoolProp.CoolProp as CP
+    P_sat = CP.PropsSI('P', 'T', 290, 'Q', 0, 'CO2')
+    input = {}
+    input['temperature'] = 290
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    for dP in (2000, 5000):
+        # Within pressure_step_min of saturation, the crossing is at P0
+        input['pressure'] = P_sat + dP
+        P, W = wavespeed.WaveSpeed(input).find_plateau()
+        assert P == pytest.approx(P_sat, abs=1e4)
+        assert W > 0
+
+def test_extend_and_refine():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['extrapolate'] = True
+    ws_full = wavespeed.WaveSpeed(input)
+    ws_full.run()
+    input['pressure_break'] = 70e5
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    ws.extend(1e5)
+    assert list(ws.P) == list(ws_full.P)
+    assert list(ws.W) == list(ws_full.W)
+    assert ws.W[-1] == 0
+
+    input['pressure_step'] = 1e4
+    ws_fine = wavespeed.WaveSpeed(input)
+    ws_fine.run()
+    ws.refine(145.61e5, 80e5, 1e4)
+    n = sum(ws.P >= 80e5)
+    assert list(ws.P[:n]) == list(ws_fine.P[:n])
+    assert list(ws.W[:n]) == pytest.approx(list(ws_fine.W[:n]), rel=1e-9)
+    assert ws.P[n] == ws_full.P[-len(ws.P) + n]
+    assert ws.W[-1] == 0
+
+def test_iter_steps():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['extrapolate'] = True
+    ws_full = wavespeed.WaveSpeed(input)
+    ws_full.run()
+    ws = wavespeed.WaveSpeed(input)
+    steps = list(ws.iter_steps())
+    assert [step.P for step in steps] == list(ws_full.P)
+    assert [step.W for step in steps] == list(ws_full.W)
+    assert steps[-1].W == 0
+
+    ws = wavespeed.WaveSpeed(input)
+    for step in ws.iter_steps():
+        if step.P < 100e5:
+            break
+    assert ws.isrun
+    # With extrapolate the points are yielded one step late
+    assert len(ws.P) == 48
+    ws.extend()
+    assert list(ws.W) == list(ws_full.W)
+
+def test_warm_start():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['sound_speed'] = 'analytic'
+    ws_cold = wavespeed.WaveSpeed(input, instrument=True)
+    ws_cold.run()
+    input['warm_start'] = True
+    ws = wavespeed.WaveSpeed(input, instrument=True)
+    ws.run()
+    assert list(ws.P) == list(ws_cold.P)
+    assert list(ws.T) == pytest.approx(list(ws_cold.T), rel=1e-9)
+    assert list(ws.W) == pytest.approx(list(ws_cold.W), abs=1e-4)
+    # Single-phase steps are seeded, two-phase steps use the PS flash
+    assert ws.stats.calls['update_PS_guess'] > ws.stats.calls['update_PS']
+
+    eng = engine.CoolPropEngine('HEOS', 'CO2', [1.0])
+    eng.update_PS(100e5, ws.S0)
+    T, rho = eng.T(), eng.rhomass()
+    assert eng.update_PS_guess(99e5, ws.S0, T, rho)
+    T_warm, rho_warm = eng.T(), eng.rhomass()
+    eng.update_PS(99e5, ws.S0)
+    assert T_warm == pytest.approx(eng.T(), rel=1e-10)
+    assert rho_warm == pytest.approx(eng.rhomass(), rel=1e-10)
+    # Seeds in the two-phase region are rejected
+    assert not eng.update_PS_guess(50e5, ws.S0, T, rho)
+    assert 0 < eng.Q() < 1
+
+def test_warm_start_fallback():
+    class FlakyEngine(engine.CoolPropEngine):
+        # Fails the first flash at P_fail, as for a seed too far away
+        P_fail = 100e5 + 0.5 * 1e5
+        failed = False
+        def update_PS_guess(self, P, Smass, T, rhomass):
+            if P == self.P_fail and not self.failed:
+                self.failed = True
+                raise ValueError("No convergence")
+            return super().update_PS_guess(P, Smass, T, rhomass)
+
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['warm_start'] = True
+    ws = wavespeed.WaveSpeed(input)
+    ws.engine = FlakyEngine('HEOS', 'CO2', [1.0])
+    ws.calc_state(101e5)
+    T, H, Q, D = ws.calc_state(FlakyEngine.P_fail)
+    assert ws.engine.failed
+    assert ws.guess[0] == FlakyEngine.P_fail
+    ws.engine.update_PS(FlakyEngine.P_fail, ws.S0)
+    assert T == pytest.approx(ws.engine.T(), rel=1e-9)
+    assert D == pytest.approx(ws.engine.rhomass(), rel=1e-9)
+
+def test_warm_start_zero_entropy():
+    # Reference state with s = 0 at the state of the flash, the Newton
+    # iteration still converges on the absolute entropy tolerance
+    import CoolProp.CoolProp as CP
+    rhomolar = CP.PropsSI('Dmolar', 'T', 350, 'P', 100e5, 'CO2')
+    CP.set_reference_stateD('CO2', 350, rhomolar, 0, 0)
+    engine.clear_states()
+    try:
+        eng = engine.CoolPropEngine('HEOS', 'CO2', [1.0])
+        eng.update_PT(100e5, 350)
+        S = eng.smass()
+        assert abs(S) < 1e-9
+        eng.update_PT(101e5, 351)
+        assert eng.update_PS_guess(100e5, S, eng.T(), eng.rhomass())
+        assert eng.T() == pytest.approx(350, rel=1e-9)
+    finally:
+        CP.set_reference_stateS('CO2', 'DEF')
+        engine.clear_states()
+
+def test_lightweight_import():
+    # Plotting, DataFrames and input validation are imported on first use
+    code = ("import sys, ramdecom.wavespeed, ramdecom.batch, ramdecom.sweep; "
+            "print(','.join(m for m in ('matplotlib', 'pandas', 'cerberus') if m in sys.modules))")
+    loaded = subprocess.check_output([sys.executable, '-c', code], text=True).strip()
+    assert loaded == ''
@@ -0,0 +1,40 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import result
+from ramdecom import wavespeed
+import numpy as np
+
+
+def test_decompression_result():
+    res = result.DecompressionResult(2)
+    for i in range(5):
+        res.append(100e5 - i * 1e5, 300., 1500., 3e5, 700., 0., 400., 0.1 * i, 400. - 0.1 * i)
+    assert len(res) == 5
+    assert list(res['P']) == [100e5, 99e5, 98e5, 97e5, 96e5]
+    res.trim()
+    assert len(res.data) == 5
+    df = res.to_dataframe()
+    assert list(df['Decompression wave speed (m/s)']) == list(res['W'])
+    assert res.to_dataframe() is df
+    res.replace(1, 3, [(99.5e5, 300., 1500., 3e5, 700., 0., 400., 0., 400.)])
+    assert list(res['P']) == [100e5, 99.5e5, 97e5, 96e5]
+    copy = result.DecompressionResult.from_dict({'P': res['P'], 'W': res['W']})
+    assert list(copy['W']) == list(res['W'])
+    assert len(copy) == 4
+    assert np.all(np.isnan(copy['T']))
+
+
+def test_wavespeed_result_views():
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['pressure_break'] = 100e5
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    assert len(ws.P) == len(ws.result) == 46
+    assert np.shares_memory(ws.W, ws.result.data)
+    assert np.shares_memory(ws.get_results()['P'], ws.result.data)
+    assert np.all(ws.S_mass == ws.S0)
+    assert len(ws.get_dataframe()) == 46
@@ -0,0 +1,108 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import service
+from ramdecom.cache import ResultCache
+import threading
+import signal
+import os
+import urllib.request
+import urllib.error
+import json
+import pytest
+
+
+def case():
+    input = {}
+    input['temperature'] = 308.
+    input['pressure'] = 145e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['sound_speed'] = 'analytic'
+    input['pressure_break'] = 100e5
+    return input
+
+
+@pytest.fixture
+def server(tmp_path):
+    calculations = service.CalculationService(workers=2, cache=ResultCache(str(tmp_path)))
+    server = service.make_server(port=0, service=calculations)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:' + str(server.server_address[1]), str(tmp_path)
+    server.shutdown()
+    server.server_close()
+    calculations.shutdown()
+
+
+def request(url, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(url, data, timeout=60) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as err:
+        return err.code, json.loads(err.read())
+
+
+def test_submit_poll_and_cache(server):
+    server, cache_dir = server
+    status, job = request(server + '/jobs', case())
+    assert status == 202
+    assert job['status'] in ('queued', 'running')
+    # Identical input joins the job in flight
+    status, same = request(server + '/jobs', case())
+    assert same['id'] == job['id']
+
+    status, result = request(server + '/jobs/' + job['id'] + '?wait=50')
+    assert status == 200
+    assert result['status'] == 'done'
+    assert result['source'] == 'calculation'
+    assert result['results']['P'][0] == pytest.approx(145e5)
+    assert result['results']['P'][-1] >= 100e5
+    assert len(result['results']['W']) == len(result['results']['P'])
+
+    # A new service on the same cache answers from the cache
+    calculations = service.CalculationService(workers=1, cache=ResultCache(cache_dir))
+    try:
+        job = calculations.submit(case())
+        assert job.status == 'done'
+        assert job.source == 'cache'
+        assert job.as_dict()['results']['W'] == result['results']['W']
+    finally:
+        calculations.shutdown()
+
+    status, health = request(server + '/health')
+    assert health['workers'] == 2
+    assert health['pending'] == 0
+
+
+def test_invalid_input(server):
+    server, cache_dir = server
+    input = case()
+    input['eos'] = 'PR'
+    status, body = request(server + '/jobs', input)
+    assert status == 400
+    assert 'eos' in body['error']
+    status, body = request(server + '/jobs', [1, 2])
+    assert status == 400
+    assert request(server + '/jobs/unknown')[0] == 404
+
+
+def test_worker_crash(tmp_path):
+    calculations = service.CalculationService(workers=1, cache=ResultCache(str(tmp_path)))
+    try:
+        input = case()
+        del input['pressure_break']
+        job = calculations.submit(input)
+        while job.status == 'queued':
+            job.finished.wait(0.01)
+        for pid in list(calculations.executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        assert job.finished.wait(30)
+        assert job.status == 'failed'
+        # The broken pool is replaced and the job can be submitted again
+        job = calculations.submit(input)
+        assert job.finished.wait(60)
+        assert job.status == 'done'
+        assert calculations.pending == 0
+    finally:
+        calculations.shutdown()
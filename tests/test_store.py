@@ -0,0 +1,95 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import wavespeed
+from ramdecom.store import ResultStore, StoreError
+from ramdecom.result import FIELDS
+import numpy as np
+import pytest
+import os
+
+
+def get_results(P0, n):
+    P = np.linspace(P0, P0 / 2, n)
+    results = {name: np.linspace(0, 1, n) + P0 for name in FIELDS}
+    results['P'] = P
+    results['Q'] = np.zeros(n)
+    return results
+
+
+def test_append_and_read(tmp_path):
+    directory = os.path.join(tmp_path, 'store')
+    store = ResultStore(directory)
+    for i, P0 in enumerate([100e5, 120e5, 140e5]):
+        input = {'pressure': P0, 'temperature': 300., 'eos': 'HEOS', 'fluid': 'CO2' if i < 2 else 'N2'}
+        assert store.append(get_results(P0, 10 + i), input, name='case' + str(i)) == i
+    assert len(store) == 3
+
+    store = ResultStore(directory, mode='r')
+    curve = store.curve(1)
+    assert list(curve['P']) == list(get_results(120e5, 11)['P'])
+    # Zero-copy views of the memory mapped column
+    assert np.shares_memory(curve['W'], store.column('W'))
+    assert len(store.column('P')) == 10 + 11 + 12
+    assert store.metadata(2)['name'] == 'case2'
+    assert store.metadata(0)['end_pressure'] == 50e5
+
+    assert list(store.query(fluid='CO2')) == [0, 1]
+    assert list(store.query(fluid='CO2', pressure=(110e5, None))) == [1]
+    assert list(store.query(pressure=lambda p: p > 130e5)) == [2]
+    assert list(store.query(unknown=1)) == []
+    assert [i for i, curve in store.curves(store.query(fluid='N2'), fields=('P',))] == [2]
+    with pytest.raises(StoreError):
+        store.append(get_results(1e5, 2))
+    with pytest.raises(StoreError):
+        ResultStore(os.path.join(tmp_path, 'missing'), mode='r')
+
+
+def test_interrupted_append(tmp_path):
+    directory = os.path.join(tmp_path, 'store')
+    store = ResultStore(directory)
+    store.append(get_results(100e5, 10))
+    # Column data written without the committing index line
+    with open(store.column_path('P'), 'ab') as f:
+        f.write(np.ones(5).tobytes())
+
+    store = ResultStore(directory)
+    assert os.path.getsize(store.column_path('P')) == 10 * 8
+    store.append(get_results(120e5, 4))
+    assert list(store.curve(1)['P']) == list(get_results(120e5, 4)['P'])
+
+
+def test_interrupted_index(tmp_path):
+    directory = os.path.join(tmp_path, 'store')
+    store = ResultStore(directory)
+    store.append(get_results(100e5, 10))
+    store.append(get_results(110e5, 6))
+    # Index line of the second curve cut short
+    path = os.path.join(directory, 'index.jsonl')
+    with open(path, 'rb+') as f:
+        f.truncate(os.path.getsize(path) - 10)
+
+    store = ResultStore(directory)
+    assert len(store) == 1
+    assert os.path.getsize(store.column_path('P')) == 10 * 8
+    store.append(get_results(120e5, 4))
+    store.append(get_results(130e5, 3))
+    store = ResultStore(directory, mode='r')
+    assert len(store) == 3
+    assert list(store.curve(2)['P']) == list(get_results(130e5, 3)['P'])
+
+
+def test_append_run(tmp_path):
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['sound_speed'] = 'analytic'
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    store = ResultStore(os.path.join(tmp_path, 'store'))
+    i = store.append_run(ws)
+    assert list(store.curve(i)['W']) == list(ws.W)
+    assert store.metadata(i)['plateau_pressure'] == ws.get_plateau()[0]
+    assert list(store.query(sound_speed='analytic')) == [i]
+    assert len(store.get_dataframe()) == 1
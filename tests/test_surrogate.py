@@ -0,0 +1,101 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import surrogate
+from ramdecom.sweep import design_points
+from ramdecom.wavespeed import parse_fluid
+import numpy as np
+import pytest
+import os
+
+
+def smooth(X, u):
+    P0, T0 = X[:, 0], X[:, 1]
+    P_plateau = 40e5 + 0.2 * P0 + 1e4 * (T0 - 300)
+    W_plateau = 30 + 0.1 * (T0 - 300)
+    W = np.outer(W_plateau, np.ones(2 * len(u))) + np.outer(P0 / 1e5, np.concatenate((u, u)))
+    return np.column_stack((P_plateau, W_plateau, 0.5 * P_plateau, W))
+
+
+def synthetic(task):
+    # Smooth model of the surrogate quantities in P0, T0 and the N2 fraction
+    input, u = task
+    comp, x = parse_fluid(input['fluid'])
+    x_N2 = x[comp.split('&').index('N2')]
+    P0, T0 = input['pressure'], input['temperature']
+    P_plateau = 40e5 + 0.2 * P0 + 1e4 * (T0 - 300) + 100e5 * x_N2
+    W_plateau = 30 + 0.1 * (T0 - 300) - 200 * x_N2
+    W = W_plateau + P0 / 1e5 * u
+    return np.concatenate(([P_plateau, W_plateau, 0.5 * P_plateau], W, W))
+
+
+def test_interpolation():
+    u = np.linspace(1, 0, 5)
+    X = design_points([(100e5, 150e5), (290, 320)], 'lhs', 40, seed=0)
+    s = surrogate.Surrogate(X, smooth(X, u), [100e5, 290], [150e5, 320], u, 'CO2')
+    result = s.predict(X[3, 0], X[3, 1])
+    assert result['plateau_pressure'] == pytest.approx(smooth(X, u)[3, 0], rel=1e-9)
+    x = np.array([[123e5, 301.]])
+    result = s.predict(123e5, 301.)
+    assert result['plateau_pressure'] == pytest.approx(smooth(x, u)[0, 0], rel=1e-4)
+    assert list(result['W']) == pytest.approx(list(smooth(x, u)[0, 3:]), abs=0.1)
+    assert len(result['P']) == 10
+    assert result['P'][0] == 123e5
+    assert result['error']['plateau_pressure'] >= 0
+    assert s.contains([123e5, 301.])
+    assert not s.contains([160e5, 301.])
+    with pytest.raises(ValueError):
+        s.predict(123e5, 301., [0.01])
+
+
+def test_train_query_and_fallback(tmp_path):
+    s = surrogate.train((120e5, 150e5), (300, 310), n=20, seed=1, n_curve=10,
+                        options={'sound_speed': 'analytic'})
+    assert len(s.X) == 20
+    full = s.compute(135e5, 305)
+    result = s.query(135e5, 305)
+    assert result['source'] == 'surrogate'
+    assert result['plateau_pressure'] == pytest.approx(full['plateau_pressure'], abs=1e5)
+    assert result['plateau_wave_speed'] == pytest.approx(full['plateau_wave_speed'], abs=2)
+    assert np.max(np.abs(result['W'] - full['W'])) < 10
+
+    # Outside the training domain or above the tolerance
+    assert s.query(160e5, 305)['source'] == 'full'
+    result = s.query(135e5, 305, tol_P=1.)
+    assert result['source'] == 'full'
+    assert result['plateau_pressure'] == full['plateau_pressure']
+
+    filename = os.path.join(tmp_path, 'surrogate.npz')
+    s.save(filename)
+    loaded = surrogate.Surrogate.load(filename)
+    assert loaded.predict(135e5, 305)['plateau_pressure'] == s.predict(135e5, 305)['plateau_pressure']
+    assert loaded.input == s.input
+
+
+def test_impurity_coordinate():
+    s = surrogate.train((120e5, 150e5), (300, 310), impurities={'N2': (0.01, 0.02)}, n=30, seed=2,
+                        n_curve=5, func=synthetic)
+    assert s.impurities == ['N2']
+    assert s.fluid([0.015]) == 'CO2[0.985]&N2[0.015]'
+    u = np.linspace(1, 0, 5)
+    expected = synthetic(({'fluid': s.fluid([0.015]), 'pressure': 135e5, 'temperature': 305}, u))
+    result = s.query(135e5, 305, [0.015])
+    assert result['source'] == 'surrogate'
+    assert result['plateau_pressure'] == pytest.approx(expected[0], rel=1e-4)
+    assert result['plateau_wave_speed'] == pytest.approx(expected[1], abs=0.1)
+    # The N2 fraction is a coordinate of its own
+    assert s.predict(135e5, 305, [0.01])['plateau_pressure'] < result['plateau_pressure']
+    assert not s.contains(s.point(135e5, 305, [0.03]))
+    with pytest.raises(ValueError):
+        s.predict(135e5, 305)
+
+
+def test_no_plateau():
+    input = {}
+    input['temperature'] = 308.
+    input['pressure'] = 145e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['sound_speed'] = 'analytic'
+    input['pressure_break'] = 100e5
+    u = np.linspace(1, 0, 5)
+    assert np.all(np.isnan(surrogate.evaluate(input, u)))
@@ -0,0 +1,62 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import sweep
+from ramdecom import wavespeed
+import numpy as np
+import pytest
+
+
+def test_design_points():
+    grid = sweep.design_points([(0, 0.05), (0, 0.02)], 'grid', 3)
+    assert grid.shape == (9, 2)
+    assert list(grid[-1]) == [0.05, 0.02]
+    lhs = sweep.design_points([(0, 0.05), (0.01, 0.02)], 'lhs', 10, seed=1)
+    assert lhs.shape == (10, 2)
+    # One sample per stratum in each dimension
+    assert sorted(np.floor(lhs[:, 0] / 0.005).astype(int)) == list(range(10))
+    assert sorted(np.floor((lhs[:, 1] - 0.01) / 0.001).astype(int)) == list(range(10))
+    order = sweep.neighbour_order(grid)
+    assert sorted(order) == list(range(9))
+    assert order[0] == 0
+    with pytest.raises(ValueError):
+        sweep.design_points([(0, 0.05)], 'random', 3)
+
+
+def test_composition_sweep():
+    # Zero impurity ranges give pure CO2 for all cases
+    result = sweep.composition_sweep('CO2', {'N2': (0, 0), 'O2': (0, 0)}, 145.61e5, 273.15+35.09,
+                                     eos='HEOS', n=2)
+    assert len(result) == 4
+    assert result.fluid == ['CO2'] * 4
+    assert result.surface('plateau_pressure').shape == (2, 2)
+    assert result.plateau_pressure == pytest.approx(5990687.5, abs=2e4)
+    assert np.all(np.isnan(result.W))
+
+    result = sweep.composition_sweep('CO2', {'N2': (0, 0)}, 145.61e5, 273.15+35.09, eos='HEOS',
+                                     design='lhs', n=1, curves=True, options={'pressure_break': 50e5})
+    assert result.plateau_pressure[0] == pytest.approx(5961000.0)
+    assert np.isfinite(result.W[0]).sum() > 0
+    assert 'N2 (mole fraction)' in result.get_dataframe()
+
+
+def test_composition_sweep_mixture():
+    # CO2 with 1-2 % N2, single-phase part of the curves
+    options = {'pressure_break': 100e5, 'pressure_step': 5e5, 'sound_speed': 'analytic'}
+    grid = np.linspace(105e5, 145e5, 9)
+    result = sweep.composition_sweep('CO2', {'N2': (0.01, 0.02)}, 145.61e5, 273.15+35.09, eos='HEOS',
+                                     n=2, curves=True, options=options, pressure_grid=grid)
+    assert result.fluid == ['CO2[0.99]&N2[0.01]', 'CO2[0.98]&N2[0.02]']
+    assert list(result.fractions[:, 0]) == [0.01, 0.02]
+    assert np.all(np.isfinite(result.W))
+    # N2 lowers the speed of sound of the dense phase
+    assert np.all(result.W[1] < result.W[0])
+
+    # Each case has the curve of its own composition
+    input = dict(options)
+    input['pressure'] = 145.61e5
+    input['temperature'] = 273.15+35.09
+    input['eos'] = 'HEOS'
+    input['fluid'] = result.fluid[1]
+    ws = wavespeed.WaveSpeed(input)
+    ws.run()
+    assert list(result.W[1]) == pytest.approx(list(np.interp(grid, ws.P[::-1], ws.W[::-1])), rel=1e-6)
@@ -0,0 +1,72 @@
+# RAMDECOM Copyright (c) 2022 Anders Andreasen
+
+from ramdecom import table
+from ramdecom import wavespeed
+import CoolProp
+import pytest
+
+
+def test_tabular_run(tmp_path):
+    filename = str(tmp_path / 'co2.npz')
+    tab = table.PropertyTable.build('HEOS', 'CO2', [1.0], 30e5, 150e5, 270, 320, nP=80, nS=40)
+    tab.save(filename)
+    assert table.PropertyTable.load(filename).matches('HEOS', 'CO2', [1.0])
+
+    input = {}
+    input['temperature'] = 273.15+35.09
+    input['pressure'] = 145.61e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['property_table'] = filename
+    ws = wavespeed.WaveSpeed(input)
+    assert isinstance(ws.engine, table.TabularEngine)
+    ws.run()
+    assert ws.P[-1] == pytest.approx(3961000.0, rel=1e-5)
+    assert ws.T[-1] == pytest.approx(278.0666028440005, rel=1e-4)
+    assert ws.get_plateau()[0] == pytest.approx(5961000.0, rel=1e-5)
+
+    # Outside the table the full equation of state is used
+    ws.engine.update_PS(200e5, ws.S0)
+    assert ws.engine.values is None
+    assert ws.engine.T() > 300
+
+
+def test_tabular_mismatch(tmp_path):
+    filename = str(tmp_path / 'co2.npz')
+    table.PropertyTable.build('HEOS', 'CO2', [1.0], 30e5, 150e5, 270, 320, nP=5, nS=5).save(filename)
+    input = {}
+    input['temperature'] = 300
+    input['pressure'] = 100e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'Nitrogen'
+    input['property_table'] = filename
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)
+
+
+def test_tabular_metadata(tmp_path):
+    filename = str(tmp_path / 'co2.npz')
+    tab = table.PropertyTable.build('HEOS', 'CO2', [1.0], 30e5, 150e5, 270, 320, nP=5, nS=5)
+    assert tab.matches('HEOS', 'CO2', [1.0], 'GERG')
+    gerg = table.PropertyTable('REFPROP', 'CO2', [1.0], tab.P, tab.S, tab.data,
+                               CoolProp.__version__, 'GERG')
+    gerg.save(filename)
+    gerg = table.PropertyTable.load(filename)
+    assert gerg.refprop_option == 'GERG'
+    assert gerg.matches('REFPROP', 'CO2', [1.0], 'GERG')
+    assert not gerg.matches('REFPROP', 'CO2', [1.0])
+    assert not gerg.matches('REFPROP', 'CO2', [1.0], 'PR')
+
+    # Tables of another CoolProp version are rejected
+    tab.coolprop_version = '0.0.0'
+    tab.save(filename)
+    with pytest.raises(table.TableError):
+        table.PropertyTable.load(filename)
+    input = {}
+    input['temperature'] = 300
+    input['pressure'] = 100e5
+    input['eos'] = 'HEOS'
+    input['fluid'] = 'CO2'
+    input['property_table'] = filename
+    with pytest.raises(wavespeed.InputError):
+        wavespeed.WaveSpeed(input)